@@ -102,7 +102,13 @@ async def main():
         return
 
     logging.info(config)
-    await Gossip(config).run()
+    gossip = Gossip(config)
+    try:
+        await gossip.run()
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        # Stop the worker processes before the interpreter exits
+        gossip.close()
+        raise
 
 
 if __name__ == "__main__":
@@ -0,0 +1,285 @@
+"""
+This module provides the Address_book class, which remembers peers we
+successfully connected to across restarts.
+"""
+import heapq
+import json
+import logging
+import os
+import time
+
+# Score penalty of a single failed connection attempt, in seconds of age
+FAILURE_PENALTY = 3600
+
+# Score penalty of one second of connect rtt, in seconds of age
+RTT_PENALTY = 600
+
+# Weight of a new rtt sample in the smoothed rtt of an entry
+RTT_SMOOTHING = 0.25
+
+# Seconds changes are collected before they are written to the file, if the
+# book has a timer wheel
+FLUSH_DELAY = 5
+
+# The file is compacted if it has more lines than this factor times the
+# number of entries (but at least COMPACT_MIN_LINES)
+COMPACT_FACTOR = 2
+COMPACT_MIN_LINES = 64
+
+
+class Address_book:
+    """The Address_book stores the p2p addresses of peers we connected to and
+    that validated us, together with the time we last saw them, the smoothed
+    connect rtt and the number of consecutive failed connection attempts.
+    The connect rtt is the time the TCP connection took to open, not the
+    round trip of the handshake, which includes solving the peer challenge.
+
+    Entries are ranked by score: the time last seen, minus FAILURE_PENALTY
+    seconds for every failure and RTT_PENALTY seconds for every second of
+    rtt. If the book is full, the entry with the lowest score is evicted.
+    The scores are kept in a heap, which may contain outdated scores of an
+    address. They are skipped when evicting and dropped by rebuilding the
+    heap once it holds twice as many scores as there are entries.
+
+    The book is stored as a JSON lines file. Every changed address appends a
+    single line, the last line of an address wins when loading. With a timer
+    wheel, changes are collected for FLUSH_DELAY seconds and written with a
+    single write, so they are not written on every connection; changes of the
+    last FLUSH_DELAY seconds are lost if the process is killed. Without a
+    timer wheel every change is written directly. The file is rewritten
+    without outdated lines once it grew too large. Lines that can not be
+    parsed (e.g. cut off by a crash) are skipped.
+
+    Class variables:
+    - path (str) -- (private) path of the file. Empty to keep the book in
+      memory only
+    - max_entries (int) -- (private) maximum number of entries
+    - clock (function) -- (private) returns the current unix time
+    - timer_wheel (Timer_wheel) -- (private) used to delay writes. None to
+      write every change directly
+    - entries (dictionary: str - List) -- (private) known peers.
+      Format: address : [last_seen (float), rtt (float / None),
+      failures (int)]
+    - scores (List of Tuples) -- (private) heap of the scores of the entries,
+      lowest first. Format: (score (float), address (str))
+    - lines (int) -- (private) number of lines in the file
+    - dirty (str set) -- (private) addresses changed since the last flush
+    - flush_timer (Timer) -- (private) pending flush. None if no flush is
+      scheduled
+    """
+
+    def __init__(self, path, max_entries, clock=time.time, timer_wheel=None):
+        """
+        Arguments:
+        - path (str) -- path of the file, created if it does not exist.
+          Empty to keep the book in memory only
+        - max_entries (int) -- maximum number of entries
+        - clock (function) -- (Optional, default: time.time) returns the
+          current unix time
+        - timer_wheel (Timer_wheel) -- (Optional, default: None) used to
+          collect changes for FLUSH_DELAY seconds before writing them. None to
+          write every change directly
+        """
+        self.__path = path
+        self.__max_entries = max_entries
+        self.__clock = clock
+        self.__timer_wheel = timer_wheel
+        self.__entries = {}
+        self.__scores = []
+        self.__lines = 0
+        self.__dirty = set()
+        self.__flush_timer = None
+        if self.__path:
+            self.__load()
+
+    def __len__(self):
+        """Returns the number of entries"""
+        return len(self.__entries)
+
+    def __contains__(self, address):
+        return address in self.__entries
+
+    def __repr__(self):
+        return f"Address_book({len(self.__entries)} entries)"
+
+    def get_entry(self, address):
+        """Returns a copy of the entry of address as dictionary with the keys
+        last_seen, rtt and failures, or None if address is unknown"""
+        entry = self.__entries.get(address)
+        if entry is None:
+            return None
+        return {"last_seen": entry[0], "rtt": entry[1], "failures": entry[2]}
+
+    def get_score(self, address):
+        """Returns the score of address, higher is better. See Address_book"""
+        (last_seen, rtt, failures) = self.__entries[address]
+        rtt = 0 if rtt is None else rtt
+        return last_seen - FAILURE_PENALTY * failures - RTT_PENALTY * rtt
+
+    def get_best(self, count):
+        """Returns up to count addresses with the highest scores, best first
+
+        Arguments:
+        - count (int) -- maximum number of addresses
+        """
+        return sorted(self.__entries, key=self.get_score,
+                      reverse=True)[:count]
+
+    def record_success(self, address, rtt=None):
+        """Adds or updates a peer that we connected to and that validated us.
+        Resets its failures. Evicts the entry with the lowest score if the
+        book is full.
+
+        Arguments:
+        - address (str) -- p2p address of the peer. Format: host_ip:port
+        - rtt (float) -- (Optional, default: None) connect rtt in seconds
+        """
+        entry = self.__entries.get(address)
+        if entry is None:
+            entry = [0, None, 0]
+            self.__entries[address] = entry
+        entry[0] = self.__clock()
+        if rtt is not None:
+            entry[1] = rtt if entry[1] is None else (
+                (1 - RTT_SMOOTHING) * entry[1] + RTT_SMOOTHING * rtt)
+        entry[2] = 0
+        self.__push_score(address)
+        self.__mark(address)
+        while len(self.__entries) > self.__max_entries:
+            self.__evict(exclude=address)
+
+    def record_failure(self, address):
+        """Counts a failed connection attempt to a known peer. Unknown
+        addresses are ignored.
+
+        Arguments:
+        - address (str) -- p2p address of the peer. Format: host_ip:port
+        """
+        entry = self.__entries.get(address)
+        if entry is None:
+            return
+        entry[2] += 1
+        self.__push_score(address)
+        self.__mark(address)
+
+    def __push_score(self, address):
+        """Adds the current score of address to the heap. Rebuilds the heap
+        without outdated scores if it grew too large"""
+        heapq.heappush(self.__scores, (self.get_score(address), address))
+        if len(self.__scores) > 2 * len(self.__entries):
+            self.__scores = [(self.get_score(address), address)
+                             for address in self.__entries]
+            heapq.heapify(self.__scores)
+
+    def __evict(self, exclude):
+        """Removes the entry with the lowest score except exclude"""
+        excluded = None
+        while True:
+            (score, address) = heapq.heappop(self.__scores)
+            if (address not in self.__entries
+                    or self.get_score(address) != score):
+                # Outdated score
+                continue
+            if address == exclude:
+                excluded = (score, address)
+                continue
+            break
+        if excluded is not None:
+            heapq.heappush(self.__scores, excluded)
+        logging.debug(f"[PEER] Evicting {address} from the address book")
+        del self.__entries[address]
+        self.__mark(address)
+
+    def __record(self, address):
+        """Returns the JSON line of address. Addresses without an entry are
+        written as removed"""
+        entry = self.__entries.get(address)
+        if entry is None:
+            return json.dumps({"address": address, "removed": True}) + "\n"
+        return json.dumps({"address": address, "last_seen": entry[0],
+                           "rtt": entry[1], "failures": entry[2]}) + "\n"
+
+    def __mark(self, address):
+        """Remembers that address changed and writes it directly or
+        schedules a flush"""
+        if not self.__path:
+            return
+        self.__dirty.add(address)
+        if self.__timer_wheel is None:
+            self.flush()
+        elif self.__flush_timer is None:
+            self.__flush_timer = self.__timer_wheel.schedule(FLUSH_DELAY,
+                                                             self.flush)
+
+    def flush(self):
+        """Appends the current state of all changed addresses to the file
+        with a single write. Compacts the file instead if it grew too
+        large."""
+        if self.__flush_timer is not None:
+            self.__flush_timer.cancel()
+            self.__flush_timer = None
+        if len(self.__dirty) == 0:
+            return
+        dirty = self.__dirty
+        self.__dirty = set()
+        if self.__lines >= max(COMPACT_FACTOR * len(self.__entries),
+                               COMPACT_MIN_LINES):
+            self.__compact()
+            return
+        try:
+            with open(self.__path, "a") as f:
+                f.writelines(self.__record(address) for address in dirty)
+            self.__lines += len(dirty)
+        except OSError as e:
+            logging.warning(f"[PEER] Failed to write address book "
+                            f"{self.__path}: {e}")
+
+    def __compact(self):
+        """Rewrites the file with a single line per entry. The new file
+        replaces the old one atomically."""
+        tmp_path = self.__path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                f.writelines(self.__record(address)
+                             for address in self.__entries)
+            os.replace(tmp_path, self.__path)
+            self.__lines = len(self.__entries)
+        except OSError as e:
+            logging.warning(f"[PEER] Failed to write address book "
+                            f"{self.__path}: {e}")
+
+    def __load(self):
+        """Loads the entries from the file, if it exists"""
+        try:
+            with open(self.__path) as f:
+                for line in f:
+                    self.__lines += 1
+                    self.__load_line(line)
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            logging.warning(f"[PEER] Failed to read address book "
+                            f"{self.__path}: {e}")
+            return
+        while len(self.__entries) > self.__max_entries:
+            self.__evict(exclude=None)
+        logging.info(f"[PEER] Loaded {len(self.__entries)} peers from the "
+                     f"address book {self.__path}")
+
+    def __load_line(self, line):
+        """Applies a single line of the file"""
+        try:
+            record = json.loads(line)
+            address = str(record["address"])
+            if record.get("removed", False):
+                self.__entries.pop(address, None)
+                return
+            rtt = record["rtt"]
+            self.__entries[address] = [
+                float(record["last_seen"]),
+                None if rtt is None else float(rtt),
+                int(record["failures"])]
+            self.__push_score(address)
+        except (ValueError, KeyError, TypeError):
+            logging.debug(f"[PEER] Skipping invalid address book line: "
+                          f"{line!r}")
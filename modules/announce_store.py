@@ -0,0 +1,413 @@
+"""
+This module provides the Announce_store class, which buffers PEER ANNOUNCEs
+until their subscribers validated them according to the validation policy of
+their datatype. The store is bounded by a memory budget and entries expire
+after a maximum age.
+"""
+import logging
+from collections import OrderedDict, namedtuple
+
+
+# Estimated memory used by a single entry without its data in bytes
+ENTRY_OVERHEAD = 256
+
+# Message ids of GOSSIP NOTIFICATION and GOSSIP VALIDATION are 16 bit, so at
+# most this many announces can wait for validation at the same time
+MAX_ENTRIES = 2**16
+
+# Eviction policies if the memory budget is exceeded
+# - oldest: evict the oldest entries until the new entry fits
+# - reject: keep the stored entries and drop the new entry
+EVICTION_POLICIES = ["oldest", "reject"]
+
+# Validation policies, when a stored announce is forwarded. A negative
+# validation drops the announce with every policy.
+# - all: after all subscribers validated it
+# - quorum:K: after K subscribers validated it (all, if there are fewer)
+# - timeout:T: after all subscribers validated it or T seconds passed
+VALIDATION_POLICIES = ["all", "quorum", "timeout"]
+
+# Validation policy of a datatype
+# - name (str) -- see VALIDATION_POLICIES
+# - parameter (int / float / None) -- K of quorum, T of timeout
+Validation_policy = namedtuple("Validation_policy", ["name", "parameter"])
+
+# Policy of datatypes without a configured policy
+DEFAULT_VALIDATION_POLICY = Validation_policy("all", None)
+
+
+def parse_validation_policies(text):
+    """Parses validation policies of datatypes.
+
+    Arguments:
+    - text (str) -- comma separated list of <datatype>=<policy>, where policy
+      is all, quorum:<K> or timeout:<T>. Example: "1=quorum:2, 7=timeout:0.5"
+
+    Returns: dictionary: int - Validation_policy
+
+    Raises: ValueError if text is not in a valid format
+    """
+    policies = {}
+    for item in text.replace(" ", "").split(","):
+        if len(item) == 0:
+            continue
+        (datatype, _, policy) = item.partition("=")
+        (name, _, parameter) = policy.partition(":")
+        if name == "all" and parameter == "":
+            parameter = None
+        elif name == "quorum":
+            parameter = int(parameter)
+        elif name == "timeout":
+            parameter = float(parameter)
+        else:
+            raise ValueError(f"Unknown validation policy \"{policy}\". Must "
+                             "be all, quorum:<K> or timeout:<T>")
+        policies[int(datatype)] = Validation_policy(name, parameter)
+    return policies
+
+
+class Announce_store:
+    """The Announce_store keeps PEER ANNOUNCEs that are waiting for the
+    validation of subscribers. Announces are identified by the 64 bit id of
+    the PEER ANNOUNCE, subscribers get a 16 bit message id (notification id)
+    in the GOSSIP NOTIFICATION, which they use in their GOSSIP VALIDATION.
+
+    The validators of an announce are numbered. The validators that still
+    have to validate are kept as bitset, the positive validations are
+    counted. An announce is complete once the count reaches the number
+    required by its validation policy. A validator that disconnects neither
+    validates nor rejects: all and timeout then wait for the remaining
+    validators, quorum still needs K validations. An announce that can no
+    longer get the required validations, or would be forwarded without any
+    validation, is dropped. With timeout it waits for its deadline instead,
+    since nobody rejected it.
+
+    Class variables:
+    - timer_wheel (Timer_wheel / Actor_timers) -- (private) used to expire
+      entries
+    - max_bytes (int) -- (private) memory budget in bytes
+    - max_age (float) -- (private) seconds after which entries are dropped
+    - policy (str) -- (private) eviction policy, see EVICTION_POLICIES
+    - validation_policies (dictionary: int - Validation_policy) -- (private)
+      validation policy of each datatype. Others use
+      DEFAULT_VALIDATION_POLICY
+    - on_timeout (function) -- (private) called with the announce tuple
+      (packet_id, ttl, dtype, data, sender) when an announce with the
+      validation policy timeout is completed by its timeout. Can return a
+      coroutine, which is started as task
+    - entries (OrderedDict: int - List) -- (private) stored announces, oldest
+      first.
+      Format: notification id : [packet id, ttl, dtype, data, sender,
+                                 validators (Tuple), pending (int bitset),
+                                 validated (int), required (int), timer,
+                                 deadline (Timer / None), size]
+    - packet_ids (dictionary: int - int) -- (private) packet id to
+      notification id
+    - api_entries (dictionary: Api_connection - dictionary) -- (private)
+      notification ids each api still has to validate, with the number of
+      the api in the validators of the entry.
+      Format: api : {notification id : validator number}
+    - next_id (int) -- (private) next notification id to try
+    - bytes (int) -- (private) estimated memory held by all entries
+    - statistics (dictionary: str - int) -- (private) see get_statistics
+    """
+
+    def __init__(self, timer_wheel, max_bytes, max_age, policy="oldest",
+                 validation_policies=None, on_timeout=None):
+        """
+        Arguments:
+        - timer_wheel (Timer_wheel / Actor_timers) -- used to expire entries
+        - max_bytes (int) -- memory budget in bytes
+        - max_age (float) -- seconds after which entries are dropped
+        - policy (str) -- (Optional, default: "oldest") eviction policy, see
+          EVICTION_POLICIES
+        - validation_policies (dictionary: int - Validation_policy) --
+          (Optional, default: None) validation policy of each datatype
+        - on_timeout (function) -- (Optional, default: None) called with
+          announces completed by the validation policy timeout
+        """
+        self.__timer_wheel = timer_wheel
+        self.__max_bytes = max_bytes
+        self.__max_age = max_age
+        self.__policy = policy
+        self.__validation_policies = (validation_policies
+                                      if validation_policies is not None
+                                      else {})
+        self.__on_timeout = on_timeout
+        self.__entries = OrderedDict()
+        self.__packet_ids = {}
+        self.__api_entries = {}
+        self.__next_id = 0
+        self.__bytes = 0
+        self.__statistics = {
+            "added": 0,
+            "forwarded": 0,
+            "rejected": 0,
+            "evicted": 0,
+            "expired": 0,
+            "abandoned": 0,
+            "timeouts": 0,
+            "duplicates": 0,
+        }
+
+    def __len__(self):
+        """Returns the number of stored announces"""
+        return len(self.__entries)
+
+    def __contains__(self, packet_id):
+        """Returns True if an announce with the given packet id is stored"""
+        return packet_id in self.__packet_ids
+
+    def __repr__(self):
+        return repr({entry[0]: entry[1:6]
+                     for entry in self.__entries.values()})
+
+    def get_statistics(self):
+        """Returns a copy of the counters of this store.
+
+        Returns:
+            dictionary with the keys:
+            - added (int) -- announces added to the store
+            - forwarded (int) -- announces validated according to their
+              validation policy
+            - rejected (int) -- announces invalidated by a subscriber or
+              dropped because the store was full (policy reject)
+            - evicted (int) -- announces evicted to stay within the budget
+            - expired (int) -- announces dropped after max_age
+            - abandoned (int) -- announces dropped because their validators
+              disconnected before enough of them validated it
+            - timeouts (int) -- forwarded announces that were completed by
+              the validation policy timeout
+            - duplicates (int) -- announces dropped because an announce with
+              the same packet id was already stored
+            - entries (int) -- currently stored announces
+            - bytes (int) -- estimated memory held by stored announces
+        """
+        statistics = self.__statistics.copy()
+        statistics["entries"] = len(self.__entries)
+        statistics["bytes"] = self.__bytes
+        return statistics
+
+    def next_notification_id(self):
+        """Returns a 16 bit notification id, which is not used by a stored
+        announce. Returns None if all ids are in use."""
+        if len(self.__entries) >= MAX_ENTRIES:
+            return None
+        while self.__next_id in self.__entries:
+            self.__next_id = (self.__next_id + 1) % MAX_ENTRIES
+        notification_id = self.__next_id
+        self.__next_id = (self.__next_id + 1) % MAX_ENTRIES
+        return notification_id
+
+    def get_validation_policy(self, dtype):
+        """Returns the Validation_policy of a datatype"""
+        return self.__validation_policies.get(dtype,
+                                              DEFAULT_VALIDATION_POLICY)
+
+    def add(self, packet_id, ttl, dtype, data, sender, validators):
+        """Stores an announce until it is validated according to the
+        validation policy of its datatype, it is rejected or it expires.
+
+        Arguments:
+        - packet_id (int) -- id of the PEER ANNOUNCE
+        - ttl (int) -- ttl used when forwarding
+        - dtype (int) -- datatype
+        - data (byte-object) -- data of the announce
+        - sender (Peer_connection) -- peer the announce was received from
+        - validators (Api_connection List) -- subscribers that need to
+          validate the announce
+
+        Returns:
+            notification id (int) to use in the GOSSIP NOTIFICATION or None if
+            the announce was dropped because the store is full or an announce
+            with the same packet id is already stored
+        """
+        if packet_id in self.__packet_ids:
+            # The id cache can forget ids of announces that are still stored
+            self.__statistics["duplicates"] += 1
+            logging.debug(f"[API] Message {packet_id} is already waiting for "
+                          "validation, dropping duplicate")
+            return None
+        size = ENTRY_OVERHEAD + len(data)
+        if not self.__make_room(size):
+            self.__statistics["rejected"] += 1
+            logging.debug(f"[API] Announce store is full, dropping message "
+                          f"{packet_id}")
+            return None
+
+        # Data can be a memoryview of a whole received chunk, copy it so the
+        # chunk is not kept alive
+        data = bytes(data)
+        notification_id = self.next_notification_id()
+        timer = self.__timer_wheel.schedule(self.__max_age, self.__expire,
+                                            notification_id)
+        validators = tuple(dict.fromkeys(validators))
+        (name, parameter) = self.get_validation_policy(dtype)
+        required = len(validators)
+        deadline = None
+        if name == "quorum":
+            required = min(parameter, required)
+        elif name == "timeout":
+            deadline = self.__timer_wheel.schedule(
+                parameter, self.__on_deadline, notification_id)
+        self.__entries[notification_id] = [
+            packet_id, ttl, dtype, data, sender, validators,
+            (1 << len(validators)) - 1, 0, required, timer, deadline, size]
+        self.__packet_ids[packet_id] = notification_id
+        for (number, api) in enumerate(validators):
+            self.__api_entries.setdefault(api, {})[notification_id] = number
+        self.__bytes += size
+        self.__statistics["added"] += 1
+        return notification_id
+
+    def __make_room(self, size):
+        """Evicts entries according to the policy until an entry of the given
+        size fits. Returns False if it does not fit."""
+        def is_full():
+            return (self.__bytes + size > self.__max_bytes
+                    or len(self.__entries) >= MAX_ENTRIES)
+
+        if not is_full():
+            return True
+        if self.__policy == "reject" or size > self.__max_bytes:
+            return False
+
+        while is_full() and len(self.__entries) > 0:
+            notification_id = next(iter(self.__entries))
+            logging.debug(f"[API] Evicting message {notification_id} from "
+                          "announce store")
+            self.__remove(notification_id)
+            self.__statistics["evicted"] += 1
+        return True
+
+    def validate(self, notification_id, api):
+        """Marks the announce as validated by the given api.
+
+        Arguments:
+        - notification_id (int) -- id from the GOSSIP VALIDATION
+        - api (Api_connection) -- api that validated the announce
+
+        Returns:
+            tuple (packet_id, ttl, dtype, data, sender) if the announce is now
+            validated according to its policy and should be forwarded,
+            otherwise None
+        """
+        entry = self.__entries.get(notification_id)
+        if entry is None:
+            logging.debug("[API] Message ID of GOSSIP VALIDATION is "
+                          "currently not being validated!")
+            return None
+        ids = self.__api_entries.get(api)
+        if ids is None or notification_id not in ids:
+            logging.debug(f"[API] Sender {api} of GOSSIP VALIDATION is "
+                          "no validator!")
+            return None
+
+        number = ids.pop(notification_id)
+        if len(ids) == 0:
+            del self.__api_entries[api]
+        entry[6] &= ~(1 << number)
+        entry[7] += 1
+        if not self.__is_complete(entry):
+            return None
+        return self.__complete(notification_id)
+
+    def __is_complete(self, entry):
+        """Returns True if enough validators validated the entry. At least
+        one validation is required"""
+        return entry[7] >= max(entry[8], 1)
+
+    def __is_abandoned(self, entry):
+        """Returns True if the remaining validators can not complete the
+        entry anymore"""
+        return entry[7] + bin(entry[6]).count("1") < max(entry[8], 1)
+
+    def reject(self, notification_id):
+        """Drops the announce, because a subscriber did not validate it.
+
+        Arguments:
+        - notification_id (int) -- id from the GOSSIP VALIDATION
+        """
+        if notification_id in self.__entries:
+            self.__remove(notification_id)
+            self.__statistics["rejected"] += 1
+
+    def remove_api(self, api):
+        """Removes the api from the validators of all stored announces.
+
+        Arguments:
+        - api (Api_connection) -- api that disconnected
+
+        Returns:
+            List of tuples (packet_id, ttl, dtype, data, sender) of announces
+            that are now validated according to their validation policy
+        """
+        completed = []
+        for (notification_id, number) in self.__api_entries.pop(api,
+                                                                {}).items():
+            entry = self.__entries.get(notification_id)
+            if entry is None:
+                continue
+            entry[6] &= ~(1 << number)
+            policy = self.get_validation_policy(entry[2]).name
+            if policy != "quorum":
+                # all and timeout wait for the remaining validators
+                entry[8] -= 1
+            if self.__is_complete(entry):
+                completed.append(self.__complete(notification_id))
+            elif policy != "timeout" and self.__is_abandoned(entry):
+                # timeout forwards unrejected announces at its deadline
+                logging.debug(f"[API] Dropping message {notification_id}, "
+                              "its validators disconnected before it was "
+                              "validated")
+                self.__remove(notification_id)
+                self.__statistics["abandoned"] += 1
+        return completed
+
+    def __complete(self, notification_id):
+        """Removes a validated announce and returns it for forwarding"""
+        entry = self.__remove(notification_id)
+        self.__statistics["forwarded"] += 1
+        return tuple(entry[:5])
+
+    def __on_deadline(self, notification_id):
+        """Gets called by the timer wheel after the timeout of the validation
+        policy timeout. Forwards the announce unless it was rejected."""
+        if notification_id not in self.__entries:
+            return None
+        # The deadline fired, it must not be cancelled anymore
+        self.__entries[notification_id][10] = None
+        self.__statistics["timeouts"] += 1
+        announce = self.__complete(notification_id)
+        if self.__on_timeout is not None:
+            return self.__on_timeout(announce)
+        return None
+
+    def __expire(self, notification_id):
+        """Gets called by the timer wheel after max_age"""
+        if notification_id in self.__entries:
+            logging.debug(f"[API] Validation of message {notification_id} "
+                          "timed out")
+            self.__remove(notification_id)
+            self.__statistics["expired"] += 1
+
+    def __remove(self, notification_id):
+        """Removes an entry and all references to it. Returns the entry"""
+        entry = self.__entries.pop(notification_id)
+        (packet_id, _, _, _, _, validators, pending, _, _, timer, deadline,
+         size) = entry
+        timer.cancel()
+        if deadline is not None:
+            deadline.cancel()
+        if self.__packet_ids.get(packet_id) == notification_id:
+            del self.__packet_ids[packet_id]
+        for (number, api) in enumerate(validators):
+            if not pending & (1 << number):
+                continue
+            ids = self.__api_entries.get(api)
+            if ids is not None:
+                ids.pop(notification_id, None)
+                if len(ids) == 0:
+                    del self.__api_entries[api]
+        self.__bytes -= size
+        return entry
@@ -7,11 +7,13 @@ from modules.packet_parser import (
     GOSSIP_ANNOUNCE,
     GOSSIP_NOTIFY,
     GOSSIP_VALIDATION,
+    READ_SIZE,
+    Frame_decoder,
     get_header_type,
     parse_gossip_announce,
     parse_gossip_notify,
     parse_gossip_validation,
-    build_gossip_notification
+    build_gossip_notification_header
 )
 
 
@@ -22,6 +24,8 @@ class Api_connection:
     - gossip (Gossip) -- gossip responsible for this peer
     - reader (StreamReader) -- (private) asyncio StreamReader of connected peer
     - writer (StreamWriter) -- (private) asyncio StreamWriter of connected peer
+    - send_queue (Send_queue) -- (private) outgoing GOSSIP NOTIFICATIONs,
+      handles slow API users according to config.slow_consumer_policy
     """
 
     def __init__(self, reader, writer, gossip):
@@ -34,6 +38,8 @@ class Api_connection:
         self.gossip = gossip
         self.__reader = reader
         self.__writer = writer
+        self.__send_queue = gossip.create_send_queue(
+            writer, self, lambda: self.gossip.close_api(self))
 
     def __str__(self):
         """called by str(Api_connection)
@@ -52,21 +58,33 @@ class Api_connection:
     async def run(self):
         """Waits for incoming messages and handles them. Runs until the
         connection is closed"""
+        decoder = Frame_decoder()
         while True:
+            if self.__writer.is_closing():
+                break
             try:
-                if self.__writer.is_closing():
-                    break
-                # Note: Too long packets would be read incorrectly next loop
-                #       and the API user will be disconnected
-                size_bytes = await self.__reader.read(2)
-                size = int.from_bytes(size_bytes, "big")
-                buf = size_bytes + await self.__reader.read(size-2)
-                logging.debug("[API] Packet arrived:\n       " +
-                              f"{hexdump.dump(buf)}")
+                chunk = await self.__reader.read(READ_SIZE)
             except ConnectionError:
                 await self.gossip.close_api(self)
                 return
-            await self.__handle_incoming_message(buf)
+            if len(chunk) == 0:
+                logging.debug(f"[API] Connection closed by {self}")
+                await self.gossip.close_api(self)
+                return
+            try:
+                frames = decoder.feed(chunk)
+            except ValueError as e:
+                logging.info(f"[API] Disconnecting API user {self}: {e}")
+                await self.gossip.close_api(self)
+                return
+            # A single read can contain many messages
+            for frame in frames:
+                if self.__writer.is_closing():
+                    break
+                if logging.getLogger().isEnabledFor(logging.DEBUG):
+                    logging.debug("[API] Packet arrived:\n       " +
+                                  f"{hexdump.dump(bytes(frame))}")
+                await self.__handle_incoming_message(frame)
 
     async def close(self):
         """Closes the connection to the API user.
@@ -74,6 +92,8 @@ class Api_connection:
         the API from the API list and datatype dictionary."""
 
         logging.info(f"[API] Connection to {self.get_api_address()} closed")
+        # Write queued notifications, the transport sends them before closing
+        self.__send_queue.close()
         try:
             self.__writer.close()
             await self.__writer.wait_closed()
@@ -81,6 +101,11 @@ class Api_connection:
         except Exception:
             return
 
+    def get_send_statistics(self):
+        """Returns the statistics of the send queue, including queue depth
+        and bytes in flight. See Send_queue.get_statistics"""
+        return self.__send_queue.get_statistics()
+
     def get_api_address(self):
         """Returns the address of this API user in the format host:port
 
@@ -175,12 +200,27 @@ class Api_connection:
         await self.gossip.log_gossip_debug()
         return
 
-    async def send_gossip_notification(self, msg_id, dtype, data):
-        buf = build_gossip_notification(msg_id, dtype, data)
+    async def send_gossip_notification(self, msg_id, dtype, data, header=None):
+        """Sends a GOSSIP NOTIFICATION to the API user.
+
+        Arguments:
+        - msg_id (int) -- 16 bit message id used in the GOSSIP VALIDATION
+        - dtype (int) -- datatype
+        - data (byte-object) -- data of the notification
+        - header (byte-object) -- (Optional, default: None) header built with
+          build_gossip_notification_header, can be shared by all subscribers.
+          None to build it
+
+        Returns: True if the notification was queued, False if it was
+        dropped, e.g. because the API user is congested (see Send_queue)
+        """
+        if header is None:
+            header = build_gossip_notification_header(msg_id, dtype,
+                                                      len(data))
+            if header is None:
+                logging.warning("[API] Can not build GOSSIP_NOTIFICATION "
+                                f"with message id {msg_id} and "
+                                f"{len(data)} bytes of data")
+                return False
         logging.info(f"[API] Sending GOSSIP_NOTIFICATION to {self}")
-        try:
-            self.__writer.write(buf)
-            await self.__writer.drain()
-        except ConnectionResetError:
-            # Will already close if run was called
-            return
+        return self.__send_queue.put(header, data, datatype=dtype)
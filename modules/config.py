@@ -9,6 +9,15 @@ class itself can be found bellow those.
 
 from configparser import ConfigParser
 from modules.util import is_valid_address, resolve_address
+from modules.announce_store import (
+    EVICTION_POLICIES,
+    parse_validation_policies
+)
+from modules.id_cache import DEDUP_BACKENDS
+from modules.peer_protocol import PEER_TRANSPORTS
+from modules.send_queue import SLOW_CONSUMER_POLICIES, parse_datatype_weights
+from modules.gossip_actor import GOSSIP_CORES
+from modules.lazy_push import DISSEMINATION_MODES
 
 
 def __check_cache_size(config):
@@ -65,13 +74,195 @@ def __check_search_cooldown(config):
                          "greater than 0")
 
 
-def __check_challenge_cooldown(config):
-    """Checks if challenge_cooldown greater than 0"""
-    if config.search_cooldown <= 0:
-        raise ValueError(f"challenge_cooldown ({config.search_cooldown}) must "
+def __check_peer_transport(config):
+    """Checks if peer_transport is a known transport"""
+    if config.peer_transport not in PEER_TRANSPORTS:
+        raise ValueError(f"peer_transport ({config.peer_transport}) must be "
+                         f"one of: {', '.join(PEER_TRANSPORTS)}")
+
+
+def __check_dial_concurrency(config):
+    """Checks if dial_concurrency greater than 0"""
+    if config.dial_concurrency <= 0:
+        raise ValueError(f"dial_concurrency ({config.dial_concurrency}) must "
+                         "be greater than 0")
+
+
+def __check_connect_timeout(config):
+    """Checks if connect_timeout greater than 0"""
+    if config.connect_timeout <= 0:
+        raise ValueError(f"connect_timeout ({config.connect_timeout}) must be "
+                         "greater than 0")
+
+
+def __check_dial_backoff(config):
+    """Checks if dial_backoff greater than 0"""
+    if config.dial_backoff <= 0:
+        raise ValueError(f"dial_backoff ({config.dial_backoff}) must be "
+                         "greater than 0")
+
+
+def __check_dial_backoff_max(config):
+    """Checks if dial_backoff_max greater than or equal to dial_backoff"""
+    if config.dial_backoff_max < config.dial_backoff:
+        raise ValueError(f"dial_backoff_max ({config.dial_backoff_max}) must "
+                         "be greater than or equal to dial_backoff "
+                         f"({config.dial_backoff})")
+
+
+def __check_address_book_size(config):
+    """Checks if address_book_size greater than 0"""
+    if config.address_book_size <= 0:
+        raise ValueError(f"address_book_size ({config.address_book_size}) "
+                         "must be greater than 0")
+
+
+def __check_send_high_watermark(config):
+    """Checks if send_high_watermark greater than 0"""
+    if config.send_high_watermark <= 0:
+        raise ValueError("send_high_watermark "
+                         f"({config.send_high_watermark}) must be greater "
+                         "than 0")
+
+
+def __check_send_low_watermark(config):
+    """Checks if send_low_watermark is greater than or equal to 0 and less
+    than send_high_watermark"""
+    if (config.send_low_watermark < 0 or
+            config.send_low_watermark >= config.send_high_watermark):
+        raise ValueError(f"send_low_watermark ({config.send_low_watermark}) "
+                         "must be greater than or equal to 0 and less than "
+                         "send_high_watermark "
+                         f"({config.send_high_watermark})")
+
+
+def __check_slow_consumer_policy(config):
+    """Checks if slow_consumer_policy is a known policy"""
+    if config.slow_consumer_policy not in SLOW_CONSUMER_POLICIES:
+        raise ValueError("slow_consumer_policy "
+                         f"({config.slow_consumer_policy}) must be one of: "
+                         f"{', '.join(SLOW_CONSUMER_POLICIES)}")
+
+
+def __check_slow_consumer_timeout(config):
+    """Checks if slow_consumer_timeout greater than 0"""
+    if config.slow_consumer_timeout <= 0:
+        raise ValueError("slow_consumer_timeout "
+                         f"({config.slow_consumer_timeout}) must be greater "
+                         "than 0")
+
+
+def __check_datatype_weights(config):
+    """Checks if the datatype weights use valid datatypes and weights"""
+    for (datatype, weight) in config.datatype_weights.items():
+        if not 0 <= datatype < 2**16:
+            raise ValueError(f"datatype_weights datatype ({datatype}) must be "
+                             "a 16 bit unsigned integer")
+        if weight < 1:
+            raise ValueError(f"datatype_weights weight of datatype {datatype} "
+                             f"({weight}) must be greater than 0")
+
+
+def __check_pow_workers(config):
+    """Checks if pow_workers greater than or equal to 0"""
+    if config.pow_workers < 0:
+        raise ValueError(f"pow_workers ({config.pow_workers}) must be greater "
+                         "than or equal to 0")
+
+
+def __check_pow_slices(config):
+    """Checks if pow_slices greater than or equal to 0"""
+    if config.pow_slices < 0:
+        raise ValueError(f"pow_slices ({config.pow_slices}) must be greater "
+                         "than or equal to 0")
+
+
+def __check_announce_store_bytes(config):
+    """Checks if announce_store_bytes greater than 0"""
+    if config.announce_store_bytes <= 0:
+        raise ValueError("announce_store_bytes "
+                         f"({config.announce_store_bytes}) must be greater "
+                         "than 0")
+
+
+def __check_announce_max_age(config):
+    """Checks if announce_max_age greater than 0"""
+    if config.announce_max_age <= 0:
+        raise ValueError(f"announce_max_age ({config.announce_max_age}) must "
                          "be greater than 0")
 
 
+def __check_announce_eviction(config):
+    """Checks if announce_eviction is a known eviction policy"""
+    if config.announce_eviction not in EVICTION_POLICIES:
+        raise ValueError(f"announce_eviction ({config.announce_eviction}) "
+                         f"must be one of: {', '.join(EVICTION_POLICIES)}")
+
+
+def __check_validation_policies(config):
+    """Checks if the validation policies use valid datatypes and
+    parameters"""
+    for (datatype, (name, parameter)) in \
+            config.validation_policies.items():
+        if not 0 <= datatype < 2**16:
+            raise ValueError(f"validation_policies datatype ({datatype}) "
+                             "must be a 16 bit unsigned integer")
+        if name != "all" and parameter <= 0:
+            raise ValueError(f"validation_policies parameter of {name} for "
+                             f"datatype {datatype} ({parameter}) must be "
+                             "greater than 0")
+
+
+def __check_dedup_backend(config):
+    """Checks if dedup_backend is a known backend"""
+    if config.dedup_backend not in DEDUP_BACKENDS:
+        raise ValueError(f"dedup_backend ({config.dedup_backend}) must be one "
+                         f"of: {', '.join(DEDUP_BACKENDS)}")
+
+
+def __check_bloom_window(config):
+    """Checks if bloom_window greater than 0"""
+    if config.bloom_window <= 0:
+        raise ValueError(f"bloom_window ({config.bloom_window}) must be "
+                         "greater than 0")
+
+
+def __check_bloom_fp_rate(config):
+    """Checks if 0 < bloom_fp_rate < 1"""
+    if not 0 < config.bloom_fp_rate < 1:
+        raise ValueError(f"bloom_fp_rate ({config.bloom_fp_rate}) must be "
+                         "greater than 0 and less than 1")
+
+
+def __check_gossip_core(config):
+    """Checks if gossip_core is a known core"""
+    if config.gossip_core not in GOSSIP_CORES:
+        raise ValueError(f"gossip_core ({config.gossip_core}) must be one of: "
+                         f"{', '.join(GOSSIP_CORES)}")
+
+
+def __check_dissemination(config):
+    """Checks if dissemination is a known dissemination mode"""
+    if config.dissemination not in DISSEMINATION_MODES:
+        raise ValueError(f"dissemination ({config.dissemination}) must be one "
+                         f"of: {', '.join(DISSEMINATION_MODES)}")
+
+
+def __check_eager_fanout(config):
+    """Checks if eager_fanout is not negative"""
+    if config.eager_fanout < 0:
+        raise ValueError(f"eager_fanout ({config.eager_fanout}) must be "
+                         "greater than or equal to 0")
+
+
+def __check_lazy_push_threshold(config):
+    """Checks if lazy_push_threshold is not negative"""
+    if config.lazy_push_threshold < 0:
+        raise ValueError("lazy_push_threshold "
+                         f"({config.lazy_push_threshold}) must be greater "
+                         "than or equal to 0")
+
+
 def __check_bootstrapper(config):
     """Checks if the bootstrapper is in a valid format"""
     if not is_valid_address(config.bootstrapper):
@@ -146,11 +337,145 @@ config_config = {
             "type": int,
             "checks": __check_search_cooldown
         },
-        "challenge_cooldown": {
+        "peer_transport": {
+            "required": False,
+            "default": "stream",
+            "checks": __check_peer_transport
+        },
+        "dial_concurrency": {
+            "required": False,
+            "default": 8,
+            "type": int,
+            "checks": __check_dial_concurrency
+        },
+        "connect_timeout": {
+            "required": False,
+            "default": 5,
+            "type": float,
+            "checks": __check_connect_timeout
+        },
+        "dial_backoff": {
+            "required": False,
+            "default": 10,
+            "type": float,
+            "checks": __check_dial_backoff
+        },
+        "dial_backoff_max": {
+            "required": False,
+            "default": 600,
+            "type": float,
+            "checks": __check_dial_backoff_max
+        },
+        "address_book": {
+            "required": False,
+            "default": ""
+        },
+        "address_book_size": {
+            "required": False,
+            "default": 1000,
+            "type": int,
+            "checks": __check_address_book_size
+        },
+        "send_high_watermark": {
+            "required": False,
+            "default": 4194304,
+            "type": int,
+            "checks": __check_send_high_watermark
+        },
+        "send_low_watermark": {
+            "required": False,
+            "default": 1048576,
+            "type": int,
+            "checks": __check_send_low_watermark
+        },
+        "slow_consumer_policy": {
+            "required": False,
+            "default": "drop_oldest",
+            "checks": __check_slow_consumer_policy
+        },
+        "slow_consumer_timeout": {
+            "required": False,
+            "default": 30,
+            "type": float,
+            "checks": __check_slow_consumer_timeout
+        },
+        "datatype_weights": {
+            "required": False,
+            "default": "",
+            "checks": __check_datatype_weights
+        },
+        "pow_workers": {
+            "required": False,
+            "default": 0,
+            "type": int,
+            "checks": __check_pow_workers
+        },
+        "pow_slices": {
+            "required": False,
+            "default": 0,
+            "type": int,
+            "checks": __check_pow_slices
+        },
+        "announce_store_bytes": {
+            "required": False,
+            "default": 16777216,
+            "type": int,
+            "checks": __check_announce_store_bytes
+        },
+        "announce_max_age": {
             "required": False,
             "default": 300,
             "type": int,
-            "checks": __check_challenge_cooldown
+            "checks": __check_announce_max_age
+        },
+        "announce_eviction": {
+            "required": False,
+            "default": "oldest",
+            "checks": __check_announce_eviction
+        },
+        "validation_policies": {
+            "required": False,
+            "default": "",
+            "checks": __check_validation_policies
+        },
+        "dedup_backend": {
+            "required": False,
+            "default": "exact",
+            "checks": __check_dedup_backend
+        },
+        "bloom_window": {
+            "required": False,
+            "default": 1000000,
+            "type": int,
+            "checks": __check_bloom_window
+        },
+        "bloom_fp_rate": {
+            "required": False,
+            "default": 0.001,
+            "type": float,
+            "checks": __check_bloom_fp_rate
+        },
+        "gossip_core": {
+            "required": False,
+            "default": "locks",
+            "checks": __check_gossip_core
+        },
+        "dissemination": {
+            "required": False,
+            "default": "eager",
+            "checks": __check_dissemination
+        },
+        "eager_fanout": {
+            "required": False,
+            "default": 2,
+            "type": int,
+            "checks": __check_eager_fanout
+        },
+        "lazy_push_threshold": {
+            "required": False,
+            "default": 1024,
+            "type": int,
+            "checks": __check_lazy_push_threshold
         },
         "bootstrapper": {
             "required": True,
@@ -184,6 +509,31 @@ class Config:
     - min_connections: see readme
     - max_connections: see readme
     - search_cooldown: see readme
+    - peer_transport: see readme
+    - dial_concurrency: see readme
+    - connect_timeout: see readme
+    - dial_backoff: see readme
+    - dial_backoff_max: see readme
+    - address_book: see readme
+    - address_book_size: see readme
+    - send_high_watermark: see readme
+    - send_low_watermark: see readme
+    - slow_consumer_policy: see readme
+    - slow_consumer_timeout: see readme
+    - datatype_weights: see readme
+    - pow_workers: see readme
+    - pow_slices: see readme
+    - announce_store_bytes: see readme
+    - announce_max_age: see readme
+    - announce_eviction: see readme
+    - validation_policies: see readme
+    - dedup_backend: see readme
+    - bloom_window: see readme
+    - bloom_fp_rate: see readme
+    - gossip_core: see readme
+    - dissemination: see readme
+    - eager_fanout: see readme
+    - lazy_push_threshold: see readme
     - bootstrapper: see readme
     - p2p_address: see readme
     - api_address: see readme
@@ -206,6 +556,9 @@ class Config:
             for peer in self.known_peers.replace(" ", "").split(","):
                 peers.append(resolve_address(peer))
         self.known_peers = peers
+        self.validation_policies = parse_validation_policies(
+            self.validation_policies)
+        self.datatype_weights = parse_datatype_weights(self.datatype_weights)
 
         self.__check_config()
 
@@ -0,0 +1,214 @@
+"""
+This module provides the Dialer class, which connects to new pull peers in the
+background, and the Dial_backoff class, a negative cache of addresses that
+could not be connected to.
+"""
+import asyncio
+import logging
+import random
+import time
+from collections import OrderedDict
+
+from modules.peer_connection import peer_connection_factory
+
+# Maximum number of candidate addresses waiting to be dialed. The oldest
+# candidates are dropped if more are offered
+DIAL_POOL_SIZE = 256
+
+# Maximum number of addresses in a Dial_backoff. The least recently failed
+# addresses are forgotten first
+DIAL_BACKOFF_SIZE = 4096
+
+# A backoff delay is randomly shortened by up to this fraction, so peers that
+# failed together are not retried together
+DIAL_BACKOFF_JITTER = 0.5
+
+
+class Dial_backoff:
+    """The Dial_backoff remembers addresses that could not be connected to.
+    After the n-th consecutive failure an address is not dialed for
+    min(base * 2**(n-1), max_delay) seconds, shortened by a random jitter of
+    up to DIAL_BACKOFF_JITTER. A successful connection removes the address.
+
+    Class variables:
+    - base (float) -- (private) delay after the first failure in seconds
+    - max_delay (float) -- (private) maximum delay in seconds
+    - max_entries (int) -- (private) maximum number of remembered addresses
+    - clock (function) -- (private) returns the current time in seconds
+    - random (function) -- (private) returns a random float in [0, 1)
+    - entries (OrderedDict: str - List) -- (private) failed addresses, least
+      recently failed first. Format: address : [failures, retry_at]
+    """
+
+    def __init__(self, base, max_delay, max_entries=DIAL_BACKOFF_SIZE,
+                 clock=time.monotonic, random=random.random):
+        """
+        Arguments:
+        - base (float) -- delay after the first failure in seconds
+        - max_delay (float) -- maximum delay in seconds
+        - max_entries (int) -- (Optional, default: DIAL_BACKOFF_SIZE) maximum
+          number of remembered addresses
+        - clock (function) -- (Optional, default: time.monotonic) returns the
+          current time in seconds
+        - random (function) -- (Optional, default: random.random) returns a
+          random float in [0, 1), used for the jitter
+        """
+        self.__base = base
+        self.__max_delay = max_delay
+        self.__max_entries = max_entries
+        self.__clock = clock
+        self.__random = random
+        self.__entries = OrderedDict()
+
+    def __len__(self):
+        """Returns the number of remembered addresses"""
+        return len(self.__entries)
+
+    def __repr__(self):
+        now = self.__clock()
+        return repr({address: (entry[0], round(entry[1] - now, 1))
+                     for (address, entry) in self.__entries.items()})
+
+    def record_failure(self, address):
+        """Records a failed connection attempt and returns the delay until the
+        address may be dialed again.
+
+        Arguments:
+        - address (str) -- Format: host_ip:port
+
+        Returns: delay in seconds
+        """
+        entry = self.__entries.pop(address, [0, 0])
+        entry[0] += 1
+        delay = min(self.__base * 2 ** (entry[0] - 1), self.__max_delay)
+        delay *= 1 - DIAL_BACKOFF_JITTER * self.__random()
+        entry[1] = self.__clock() + delay
+        self.__entries[address] = entry
+        if len(self.__entries) > self.__max_entries:
+            self.__entries.popitem(last=False)
+        return delay
+
+    def record_success(self, address):
+        """Forgets the failures of an address
+
+        Arguments:
+        - address (str) -- Format: host_ip:port
+        """
+        self.__entries.pop(address, None)
+
+    def get_failures(self, address):
+        """Returns the number of consecutive failures of an address"""
+        entry = self.__entries.get(address)
+        return 0 if entry is None else entry[0]
+
+    def is_blocked(self, address):
+        """Returns True if the address should not be dialed yet"""
+        entry = self.__entries.get(address)
+        return entry is not None and self.__clock() < entry[1]
+
+    def filter(self, addresses):
+        """Returns the addresses that may be dialed, in the given order
+
+        Arguments:
+        - addresses (str List) -- Format: host_ip:port
+        """
+        return [address for address in addresses
+                if not self.is_blocked(address)]
+
+
+class Dialer:
+    """The Dialer keeps a pool of candidate addresses, e.g. from PEER OFFERs,
+    and connects to them in the background. At most max_concurrent
+    connection attempts run at the same time and no more are started than
+    pull peers are missing. Connected peers are handed to
+    Gossip.add_pull_peer.
+
+    Class variables:
+    - gossip (Gossip) -- (private) gossip using this dialer
+    - max_concurrent (int) -- (private) maximum number of concurrent
+      connection attempts
+    - p2p_listening_port (int) -- (private) port we accept peer connections
+      at, sent to the dialed peers in a PEER INFO
+    - candidates (OrderedDict: str - None) -- (private) addresses waiting to
+      be dialed, in the order they were offered. Format: host_ip:port
+    - dialing (dictionary: str - Task) -- (private) running connection
+      attempts by address
+
+    Candidates blocked by Gossip.dial_backoff are skipped.
+    """
+
+    def __init__(self, gossip, max_concurrent, p2p_listening_port):
+        """
+        Arguments:
+        - gossip (Gossip) -- gossip using this dialer
+        - max_concurrent (int) -- maximum number of concurrent connection
+          attempts
+        - p2p_listening_port (int) -- port we accept peer connections at
+        """
+        self.__gossip = gossip
+        self.__max_concurrent = max_concurrent
+        self.__p2p_listening_port = p2p_listening_port
+        self.__candidates = OrderedDict()
+        self.__dialing = {}
+
+    def __repr__(self):
+        return (f"Dialer(candidates: {len(self.__candidates)}, dialing: "
+                f"{list(self.__dialing)})")
+
+    def offer(self, addresses):
+        """Adds candidate addresses to the pool and starts dialing them if
+        pull peers are missing. Does not wait for any connection.
+
+        Arguments:
+        - addresses (str List) -- candidate addresses. Format: host_ip:port
+        """
+        for address in addresses:
+            if address in self.__dialing:
+                continue
+            self.__candidates[address] = None
+            self.__candidates.move_to_end(address)
+        while len(self.__candidates) > DIAL_POOL_SIZE:
+            self.__candidates.popitem(last=False)
+        self.__start_dials()
+
+    def get_candidates(self):
+        """Returns the addresses waiting to be dialed"""
+        return list(self.__candidates)
+
+    def get_dialing(self):
+        """Returns the addresses that are currently dialed"""
+        return list(self.__dialing)
+
+    def close(self):
+        """Cancels all running connection attempts and clears the pool"""
+        for task in self.__dialing.values():
+            task.cancel()
+        self.__dialing.clear()
+        self.__candidates.clear()
+
+    def __start_dials(self):
+        """Starts connection attempts while candidates are left, the
+        concurrency limit is not reached and pull peers are missing"""
+        while (len(self.__candidates) > 0
+               and len(self.__dialing) < self.__max_concurrent
+               and len(self.__dialing)
+               < self.__gossip.get_missing_pull_peers()):
+            (address, _) = self.__candidates.popitem(last=False)
+            if self.__gossip.dial_backoff.is_blocked(address):
+                continue
+            self.__dialing[address] = asyncio.create_task(
+                self.__dial(address))
+
+    async def __dial(self, address):
+        """Connects to a single address and hands the new peer to gossip"""
+        try:
+            peers = await peer_connection_factory(
+                [address], self.__gossip, self.__p2p_listening_port)
+            for peer in peers:
+                await self.__gossip.add_pull_peer(peer)
+        except Exception as e:
+            logging.warning(f"[PEER] Dialing {address} failed: {e}")
+        finally:
+            if self.__dialing.get(address) is asyncio.current_task():
+                del self.__dialing[address]
+                self.__start_dials()
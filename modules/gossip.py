@@ -4,13 +4,31 @@ This module provides the gossip class.
 
 import asyncio
 import logging
+import time
 from random import (randint, sample, shuffle)
 from math import (floor, ceil)
-from collections import deque
 
-from modules.util import (Setqueue, parse_address)
+from modules.util import parse_address
+from modules.packet_parser import (
+    build_gossip_notification_header,
+    pack_peer_announce_header,
+    PEER_FLAG_LAZY_PUSH
+)
+from modules.id_cache import Id_cache, Bloom_id_cache
 from modules.api_connection import Api_connection
 from modules.connection_handler import connection_handler
+from modules.peer_protocol import peer_protocol_server
+from modules.pow_solver import Pow_solver
+from modules.timer_wheel import Timer_wheel
+from modules.announce_store import Announce_store
+from modules.metrics import Metrics
+from modules.send_queue import Send_queue
+from modules.dialer import Dialer, Dial_backoff
+from modules.address_book import Address_book
+from modules.gossip_actor import Actor_timers, Gossip_actor
+from modules.lazy_push import Lazy_push
+from modules.peer_registry import Peer_registry, UNVERIFIED, PUSH, PULL
+from modules.subscription_index import Subscription_index
 from modules.peer_connection import (
     Peer_connection, peer_connection_factory)
 
@@ -21,40 +39,54 @@ class Gossip:
 
     Class variables:
     - config (Config) -- config object used for this instance of gossip
-    - push_peers (Peer_connection deque) -- Connected (active) push peers /
-      peers that connected to us. Limited to max_push_peers.
-      -> corresponding lock: push_peers_lock
-    - pull_peers (Peer_connection List) -- Connected (active) pull peers /
-      peers we learned about from other peers and than connected to.
-      -> corresponding lock: pull_peers_lock
-    - unverified_peers (Peer_connection deque) -- peers that connected to us
-      that still need to be verified. After beeing verified, they will be moved
-      into push_peers. Limited to config.cache_size
-      -> corresponding lock: unverified_peers_lock
+    - peers (Peer_registry) -- all peer connections by role:
+      - push peers: Connected (active) push peers / peers that connected to
+        us. Limited to max_push_peers.
+      - pull peers: Connected (active) pull peers / peers we learned about
+        from other peers and than connected to. Limited to max_pull_peers.
+      - unverified peers: peers that connected to us that still need to be
+        verified. After beeing verified, they become push peers. Limited to
+        config.cache_size
+      Does not require a lock
     - max_push_peers (int) -- push_peers capacity
     - max_pull_peers (int) -- pull_peers capacity
     - apis (Api_connection List) -- connected APIs
       -> corresponding lock: apis_lock
-    - datasubs (dictionary: int-[Api_connection]) -- Datatypes linking to all
-      theire subscribing APIs
-      -> corresponding lock: datasubs_lock
-    - peer_announce_ids (Setqueue) -- known PEER ANNOUNCE ids, prevent
-      spreading of duplicate messages e.g. in a loop
-      -> corresponding lock: peer_announce_ids_lock
-    - announces_to_verify (dictionary: int - Tuple List) -- open
-      PEER_ANNOUNCES. PEER_ANNOUNCES Will be forwarded if/when all subscribers
-      verify the message.
-      Format: message-id : [(ttl, datatype, data, [datasubs])]
+    - datasubs (Subscription_index) -- Datatypes linking to all theire
+      subscribing APIs and APIs to their datatypes. Does not require a lock
+    - peer_announce_ids (Id_cache / Bloom_id_cache) -- known PEER ANNOUNCE
+      ids, prevent spreading of duplicate messages e.g. in a loop. Selected
+      by config.dedup_backend. Does not require a lock
+    - announces_to_verify (Announce_store) -- open PEER_ANNOUNCES.
+      PEER_ANNOUNCES Will be forwarded if/when all subscribers verify the
+      message. Bounded by config.announce_store_bytes, entries are dropped
+      after config.announce_max_age seconds.
       -> corresponding lock: announces_to_verify_lock
+    - pow_solver (Pow_solver) -- solves peer challenges received by peers in a
+      process pool
+    - timer_wheel (Timer_wheel) -- keeps track of all protocol deadlines, e.g.
+      challenge and peer offer timeouts of peers
+    - dialer (Dialer) -- connects to candidates from PEER OFFERs in the
+      background and adds them to pull_peers
+    - address_book (Address_book) -- peers we connected to and that
+      validated us, stored in config.address_book. Used to find peers after
+      a restart
+    - dial_backoff (Dial_backoff) -- addresses that recently could not be
+      connected to. Consulted before dialing, updated by
+      peer_connection_factory
+    - metrics (Metrics) -- counters and timings, e.g. PEER ANNOUNCEs that were
+      dropped by a congested peer. Does not require a lock
+    - lazy_push (Lazy_push) -- payloads for PEER IWANTs and pending PEER
+      IWANTs. None with config.dissemination eager. Does not require a lock
+    - core (Gossip_actor) -- (private) None with config.gossip_core locks.
+      Otherwise the actor owns datasubs, peer_announce_ids and
+      announces_to_verify, which must not be used outside of it, and the
+      methods handling subscriptions, announces and validations send commands
+      to it instead of taking the locks
 
     The locks should be acquired in the following order:
-    1) unverified_peers_lock
-    2) pull_peers_lock
-    3) push_peers_lock
-    4) apis_lock
-    5) datasubs_lock
-    6) peer_announce_ids_lock
-    7) announces_to_verify_lock
+    1) apis_lock
+    2) announces_to_verify_lock
     """
 
     def __init__(self, config):
@@ -67,66 +99,122 @@ class Gossip:
         self.__max_push_peers = floor(self.config.max_connections / 2)
         self.__max_pull_peers = ceil(self.config.max_connections / 2)
 
-        # Push peers that connected to us
-        self.__push_peers = deque(maxlen=self.__max_push_peers)
-        self.__push_peers_lock = asyncio.Lock()
-
-        # Pull peers that we connected to
-        self.__pull_peers = []
-        self.__pull_peers_lock = asyncio.Lock()
-
-        # unverified push peers
-        self.__unverified_peers = deque(maxlen=self.config.cache_size)
-        self.__unverified_peers_lock = asyncio.Lock()
+        # Push, pull and unverified peers
+        self.__peers = Peer_registry()
 
         self.__apis = []
         self.__apis_lock = asyncio.Lock()
 
-        #                          Key - Value
-        # Subscriber list, Format: Int - List of Api_connections
-        self.__datasubs = {}
-        self.__datasubs_lock = asyncio.Lock()
-        self.__peer_announce_ids = Setqueue(self.config.cache_size)
-        self.__peer_announce_ids_lock = asyncio.Lock()
-        # Dictionary of buffered PEER_ANNOUNCEs;
-        # Key: int - Message ID
-        # Value: [ int, int     , bytes, Peer_connection, [Peer_connection]]
-        #        [(ttl, datatype, data , sender         , [datasubs])]
-        self.__announces_to_verify = {}
+        # Subscribers by datatype and datatypes by API
+        self.__datasubs = Subscription_index()
+        if self.config.dedup_backend == "bloom":
+            self.__peer_announce_ids = Bloom_id_cache(
+                self.config.bloom_window, self.config.bloom_fp_rate)
+        else:
+            self.__peer_announce_ids = Id_cache(self.config.cache_size)
+        # Deadlines of peers and announces
+        self.timer_wheel = Timer_wheel()
+        # With the actor core, deadlines of its state expire in the actor
+        timers = self.timer_wheel
+        if self.config.gossip_core == "actor":
+            timers = Actor_timers(self.timer_wheel)
+
+        # Buffered PEER_ANNOUNCEs waiting for validation
+        self.__announces_to_verify = Announce_store(
+            timers, self.config.announce_store_bytes,
+            self.config.announce_max_age, self.config.announce_eviction,
+            self.config.validation_policies, self.__on_validation_timeout)
         self.__announces_to_verify_lock = asyncio.Lock()
 
+        # With the actor core, a single coroutine owns the state above
+        self.__core = None
+        if self.config.gossip_core == "actor":
+            self.__core = Gossip_actor(self, self.__datasubs,
+                                       self.__peer_announce_ids,
+                                       self.__announces_to_verify, timers)
+
+        # Counters and timings, e.g. of slow peers
+        self.metrics = Metrics()
+
+        # Large PEER ANNOUNCEs are announced with PEER IHAVEs to most peers
+        self.lazy_push = None
+        if self.config.dissemination == "lazy":
+            self.lazy_push = Lazy_push(timers, self.metrics,
+                                       self.config.eager_fanout,
+                                       self.config.lazy_push_threshold)
+
+        # Peers from previous runs
+        self.address_book = Address_book(self.config.address_book,
+                                         self.config.address_book_size,
+                                         timer_wheel=self.timer_wheel)
+
+        # Addresses that failed recently are not dialed again until their
+        # backoff expired
+        self.dial_backoff = Dial_backoff(self.config.dial_backoff,
+                                         self.config.dial_backoff_max)
+
+        # Connects to offered peers in the background
+        (_, p2p_listening_port) = parse_address(self.config.p2p_address)
+        self.dialer = Dialer(self, self.config.dial_concurrency,
+                             int(p2p_listening_port))
+
+        # Solves peer challenges off the event loop
+        self.pow_solver = Pow_solver(self.config.pow_workers,
+                                     self.config.pow_slices)
+
     async def run(self):
         """Starts this gossip instance.
-        Tries to connect to all known peers or connect to bootstrapping
-        service, if no peers where in the config.
+        Tries to connect to all known peers and the best peers of the address
+        book or connect to bootstrapping service, if none of them are
+        reachable.
         Starts peer controll (responsible for maintaining degree many peers),
         peers and waits for new incoming connections.
+        Closes this instance when it stops, also if it is cancelled.
         """
-        # connect to peers in config
+        try:
+            await self.__run()
+        finally:
+            self.close()
+
+    def close(self):
+        """Stops the worker processes of the pow solver and the actor.
+        Pending peer challenges and actor commands are dropped."""
+        self.pow_solver.shutdown()
+        if self.__core is not None:
+            self.__core.close()
+
+    async def __run(self):
+        """Connects to the first peers and serves connections, see run"""
+        # connect to peers in config and the best peers of previous runs
         (_, p2p_listening_port) = parse_address(self.config.p2p_address)
-        num_known_peers = len(self.config.known_peers)
+        known_peers = list(self.config.known_peers)
+        for address in self.address_book.get_best(self.__max_pull_peers):
+            if (address not in known_peers
+                    and len(known_peers) < self.__max_pull_peers):
+                known_peers.append(address)
+        known_peers = self.dial_backoff.filter(known_peers)
+        num_known_peers = len(known_peers)
         if num_known_peers > 0:
             logging.debug(
                 f"[PEER] Connecting to {num_known_peers} known peers")
-            async with self.__pull_peers_lock:
-                self.__pull_peers = await peer_connection_factory(
-                    self.config.known_peers, self, int(p2p_listening_port))
+            for peer in await peer_connection_factory(
+                    known_peers, self, int(p2p_listening_port)):
+                self.__peers.add(peer, PULL)
 
         # No known_peers in config or all where unreachable
         # -> Connect to bootstrapping node
-        async with self.__pull_peers_lock:
-            if len(self.__pull_peers) == 0:
-                logging.debug("[PEER] Connecting to bootstrapping node")
-                self.__pull_peers = await peer_connection_factory(
-                    [self.config.bootstrapper], self, int(p2p_listening_port))
+        if self.__peers.count(PULL) == 0:
+            logging.debug("[PEER] Connecting to bootstrapping node")
+            for peer in await peer_connection_factory(
+                    [self.config.bootstrapper], self, int(p2p_listening_port)):
+                self.__peers.add(peer, PULL)
 
         # Start active peers
-        async with self.__pull_peers_lock:
-            for peer in self.__pull_peers:
-                asyncio.create_task(peer.run())
+        for peer in self.__peers.get_peers(PULL):
+            asyncio.create_task(peer.run())
 
+        asyncio.create_task(self.timer_wheel.run())
         asyncio.create_task(self.__run_peer_control())
-        asyncio.create_task(self.__run_verifier())
 
         # start API connection handler
         (api_host, api_port) = parse_address(self.config.api_address)
@@ -144,9 +232,12 @@ class Gossip:
 
         # start peer connection handler
         (host, port) = parse_address(self.config.p2p_address)
+        if self.config.peer_transport == "protocol":
+            peer_handler = peer_protocol_server
+        else:
+            peer_handler = connection_handler
         try:
-            await connection_handler(host, int(port),
-                                     self.__on_peer_connection)
+            await peer_handler(host, int(port), self.__on_peer_connection)
         except OSError:
             logging.critical(
                 "Error while trying to start peer connection handler on "
@@ -154,6 +245,29 @@ class Gossip:
                 "address and port are valid and available")
             exit()
 
+    def create_send_queue(self, writer, connection, on_slow_consumer):
+        """Creates the Send_queue of a peer or API connection using the
+        watermarks and slow consumer policy of the config.
+
+        Arguments:
+        - writer (StreamWriter / Peer_protocol) -- writer of the connection
+        - connection (Peer_connection / Api_connection) -- owner of the queue
+        - on_slow_consumer (function) -- called if the connection stays
+          congested for config.slow_consumer_timeout seconds with the policy
+          "disconnect". Should close the connection, e.g. with close_peer
+
+        Returns: Send_queue
+        """
+        return Send_queue(
+            writer, connection,
+            high_watermark=self.config.send_high_watermark,
+            low_watermark=self.config.send_low_watermark,
+            policy=self.config.slow_consumer_policy,
+            timeout=self.config.slow_consumer_timeout,
+            on_slow_consumer=on_slow_consumer,
+            timer_wheel=self.timer_wheel,
+            weights=self.config.datatype_weights)
+
     async def __on_api_connection(self, reader, writer):
         new_api = Api_connection(reader, writer, self)
         logging.info(f"[API] New API connected: {new_api.get_api_address()}")
@@ -165,100 +279,116 @@ class Gossip:
         """Gets called when a new peer tries to connect.
 
         Arguments:
-        - reader (StreamReader) -- asyncio StreamReader connected to a new peer
-        - writer (StreamWriter) -- asyncio StreamWriter connected to a new peer
+        - reader (StreamReader) -- asyncio StreamReader connected to a new
+          peer. None if config.peer_transport is "protocol"
+        - writer (StreamWriter / Peer_protocol) -- asyncio StreamWriter or
+          Peer_protocol connected to a new peer
         """
         new_peer = Peer_connection(reader, writer, self, validated_us=True)
         logging.info(f"[PEER] New unverified peer connected: {new_peer}")
 
         # Dosconnect the oldest unverified peer if we reached cache_size
-        async with self.__unverified_peers_lock:
-            if len(self.__unverified_peers) >= self.config.cache_size:
-                oldest_peer = self.__unverified_peers.pop()
-                logging.debug(
-                    f"Disconnecting {oldest_peer}, because capacity for "
-                    f"unverified peers (cache_size: {self.config.cache_size}) "
-                    "is reached")
-                await self.close_peer(oldest_peer, True)
-            self.__unverified_peers.appendleft(new_peer)
+        self.__peers.add(new_peer, UNVERIFIED)
+        if self.__peers.count(UNVERIFIED) > self.config.cache_size:
+            oldest_peer = self.__peers.get_oldest(UNVERIFIED)
+            logging.debug(
+                f"Disconnecting {oldest_peer}, because capacity for "
+                f"unverified peers (cache_size: {self.config.cache_size}) "
+                "is reached")
+            await self.close_peer(oldest_peer)
 
         asyncio.create_task(new_peer.run())
 
     async def validate_peer(self, peer):
-        """Removes the given peer from the unverified_peers list and adds it to
-        push_peers"""
-        in_unverified = False
-        async with self.__unverified_peers_lock:
-            in_unverified = peer in self.__unverified_peers
-            if in_unverified:
-                self.__unverified_peers.remove(peer)
-
-        # If the peer was removed from unverified, log connected, else warning
-        if in_unverified:
-            await self.__log_connected_peers()
-        else:
+        """Turns the given unverified peer into a push peer"""
+        if self.__peers.get_role(peer) != UNVERIFIED:
             logging.warning("[PEER] Peer not found in unverified_peers")
+            return
+
+        self.__peers.add(peer, PUSH)
+        await self.__log_connected_peers()
 
         # Dosconnect the oldest push peer if we reached max_push_peers
-        async with self.__push_peers_lock:
-            if len(self.__push_peers) >= self.__max_push_peers:
-                oldest_peer = self.__push_peers.pop()
-                logging.debug(
-                    f"Disconnecting {oldest_peer}, because max_push_peers "
-                    f"({self.__max_push_peers}) is reached")
-                await self.close_peer(oldest_peer, has_push_peers_lock=True)
-            self.__push_peers.appendleft(peer)
+        if self.__peers.count(PUSH) > self.__max_push_peers:
+            oldest_peer = self.__peers.get_oldest(PUSH)
+            logging.debug(
+                f"Disconnecting {oldest_peer}, because max_push_peers "
+                f"({self.__max_push_peers}) is reached")
+            await self.close_peer(oldest_peer)
+
+    def update_peer(self, peer):
+        """Gets called by a peer when its p2p listening address or its
+        validation changed, updates the peer registry.
+
+        Arguments:
+        - peer (Peer_connection) -- changed peer
+        """
+        self.__peers.update(peer)
 
     async def handle_peer_offer(self, peer_addresses):
         """Offers peer_addresses to this gossip class. Gets called after a peer
-        offer was received.
+        offer was received. New addresses are handed to the dialer, this
+        function does not wait for the connections.
 
         Arguments:
         - peer_addresses (str List) -- addresses of potential peers, received
           from peer offer. format: host_ip:port
         """
-        async with self.__pull_peers_lock:
-            if len(self.__pull_peers) > self.__max_pull_peers:
-                logging.debug("[PEER] Ignoring peer offer because pull peers "
-                              f"capacity is reached ({len(self.__pull_peers)}/"
-                              f"{self.__max_pull_peers})")
-                return
+        if self.__peers.count(PULL) >= self.__max_pull_peers:
+            logging.debug("[PEER] Ignoring peer offer because pull peers "
+                          f"capacity is reached ({self.__peers.count(PULL)}/"
+                          f"{self.__max_pull_peers})")
+            return
         logging.info(f"[PEER] Offer contained: {peer_addresses}")
 
-        # get addresses of all peers and remove already connected peers
-        async with self.__unverified_peers_lock:
-            all_peers = list(self.__unverified_peers).copy()
-        async with self.__pull_peers_lock:
-            all_peers += self.__pull_peers
-        async with self.__push_peers_lock:
-            all_peers += list(self.__push_peers)
-        connected = await self.get_peer_addresses(all_peers)
-        candidates = list(filter(lambda x: x not in connected, peer_addresses))
+        # remove already connected peers
+        candidates = [address for address in peer_addresses
+                      if self.__peers.find(address) is None]
+        # Skip addresses that failed recently
+        candidates = self.dial_backoff.filter(candidates)
 
         if len(candidates) == 0:
             logging.info("[PEER] No new peers found in offer")
 
         logging.debug(f"[PEER] Candidates: {candidates}")
         shuffle(candidates)
-        (_, p2p_listening_port) = parse_address(self.config.p2p_address)
+        # The dialer connects to candidates until max_pull_peers is reached,
+        # failed attempts are replaced by the next candidate
+        self.dialer.offer(candidates)
+
+    def get_peer_flags(self):
+        """Returns the capability flags sent to peers in PEER INFO and PEER
+        VALIDATION, see PEER_FLAG_LAZY_PUSH"""
+        if self.lazy_push is not None:
+            return PEER_FLAG_LAZY_PUSH
+        return 0
+
+    def get_missing_pull_peers(self):
+        """Returns the number of pull peers missing to reach max_pull_peers"""
+        return max(0, self.__max_pull_peers - self.__peers.count(PULL))
+
+    async def add_pull_peer(self, peer):
+        """Adds a newly connected peer to pull_peers and starts it. Closes the
+        peer if pull_peers capacity is reached or the address got connected in
+        the meantime.
 
-        async with self.__pull_peers_lock:
-            # missing_peers to reach max_pull_peers
-            missing_peers = self.__max_pull_peers - len(self.__pull_peers)
-
-            # Open connections to missing_peers new Peers. If a peer did not
-            # respond / a connection attempt failed, repeat until we reach the
-            # max_pull_peers or no candidates are left
-            while missing_peers > 0 and len(candidates) > 0:
-                connect_to = candidates[:min(missing_peers, len(candidates))]
-                candidates = candidates[min(missing_peers, len(candidates)):]
-                new_peers = await peer_connection_factory(
-                    connect_to, self, p2p_listening_port)
-                self.__pull_peers += new_peers
-                missing_peers -= len(new_peers)
-                # start new peers
-                for peer in new_peers:
-                    asyncio.create_task(peer.run())
+        Arguments:
+        - peer (Peer_connection) -- peer we connected to
+
+        Returns: True if the peer was added
+        """
+        address = peer.get_peer_p2p_listening_address()
+        if self.__peers.count(PULL) >= self.__max_pull_peers:
+            reason = "pull peers capacity is reached"
+        elif address is not None and self.__peers.find(address) is not None:
+            reason = "it is already connected"
+        else:
+            self.__peers.add(peer, PULL)
+            asyncio.create_task(peer.run())
+            return True
+        logging.debug(f"[PEER] Disconnecting {peer}, {reason}")
+        await peer.close()
+        return False
 
     async def get_peer_addresses(self, peerlist=None):
         """Returns the p2p listening addresses of all known peers in a list
@@ -270,7 +400,6 @@ class Gossip:
           returned.
           This can be used to exclusively get the addresses of pull, push or
           unverified peers.
-          If peerlist is None, pull_peers_lock and push_peers_lock are acquired
 
         Returns:
             List of strings with format: <host_ip>:<port>
@@ -278,73 +407,29 @@ class Gossip:
         if peerlist is not None:
             peers = peerlist
         else:
-            peers = []
-            async with self.__pull_peers_lock:
-                peers += self.__pull_peers
-            async with self.__push_peers_lock:
-                peers += list(self.__push_peers)
+            peers = (self.__peers.get_peers(PULL)
+                     + self.__peers.get_peers(PUSH))
 
         addresses = []
         for peer in peers:
             addresses.append(peer.get_peer_p2p_listening_address())
         return list(filter(lambda x: x is not None, addresses))
 
-    async def close_peer(self, peer, has_unverified_lock=False,
-                         has_push_peers_lock=False, has_pull_peers_lock=False):
+    async def close_peer(self, peer):
         """Removes a Peer_connection from gossip and calls close on the
         Peer_connection.
 
         Arguments:
         - peer (Peer_connection) -- Peer_connection instance that should be
           closed
-        - has_unverified_lock (bool) -- (Default False) whether
-          unverified_peers_lock is already acquired
-        - has_push_peers_lock (bool) -- (Default False) whether
-          push_peers_lock is already acquired
-        - has_pull_peers_lock (bool) -- (Default False) whether
-          pull_peers_lock is already acquired
         """
-        async def __check_list(peer, list, lock, has_lock):
-            """Checks if peer is in list. Uses the lock if has_lock is False.
-            Returns True if the peer was found in list and closed"""
-            # already has lock, check unverified_peers
-            if has_lock and peer in list:
-                list.remove(peer)
-                await peer.close()
-                return True
-            # acquire lock and check unverified_peers
-            if not has_lock:
-                async with lock:
-                    if peer in list:
-                        list.remove(peer)
-                        await peer.close()
-                        return True
-            return False
-
-        # Check if the peer is in unverified_peers
-        if await __check_list(peer, self.__unverified_peers,
-                              self.__unverified_peers_lock,
-                              has_unverified_lock):
-            await self.__log_connected_peers()
-            return
-
-        # Check if the peer is in pull_peers
-        if await __check_list(peer, self.__pull_peers,
-                              self.__pull_peers_lock, has_pull_peers_lock):
-            await self.__log_connected_peers()
-            return
-
-        # Check if the peer is in push_peers
-        if await __check_list(peer, self.__push_peers,
-                              self.__push_peers_lock, has_push_peers_lock):
-            await self.__log_connected_peers()
-            return
-
-        # It can happen that the peer is not in any of the above lists, e.g.
-        # when a connection is closed directly after establishing it in the
-        # Peer_connection factory
-        logging.debug("[PEER] The Peer that should be closed was not found"
-                      " in push_peers, pull_peers or unverified_peers")
+        if self.__peers.remove(peer) is None:
+            # It can happen that the peer is not registered, e.g. when a
+            # connection is closed directly after establishing it in the
+            # Peer_connection factory
+            logging.debug("[PEER] The Peer that should be closed was not "
+                          "found in push_peers, pull_peers or "
+                          "unverified_peers")
         await peer.close()
         await self.__log_connected_peers()
 
@@ -355,152 +440,132 @@ class Gossip:
         min_connections/2 pull peers.
         """
         while True:
+            pull_peers = self.__peers.count(PULL)
             # True if we can accept more pull peers
-            async with self.__pull_peers_lock:
-                async with self.__push_peers_lock:
-                    has_pull_peers_capacity = (
-                        len(self.__pull_peers) < self.__max_pull_peers
-                    )
-                    # True if we have less than min_connections/2 pull peers
-                    bellow_min_pull_connections = (
-                        len(self.__pull_peers) < ceil(
-                            self.config.min_connections / 2)
-                    )
-                    # True if we need more total peers ro reach min_connections
-                    bellow_min_connections = (
-                        len(self.__pull_peers) + len(self.__push_peers)
-                        < self.config.min_connections
-                    )
-                    # Search for new pull peers if we have capacity and need
-                    # more peer to reach min_connections or if we have less
-                    # than min_connections/2 pull peers (to keep a minimum
-                    # amount of pull peers and avoid only having push peers)
-                    if((has_pull_peers_capacity and (
-                        bellow_min_connections or bellow_min_pull_connections))
-                       ):
-                        logging.info("- - - - - - - - - - - - - -")
-                        logging.info("[PEER] Looking for new Peers")
-                        # Send PeerDiscovery to all validated peers
-                        for peer in list(self.__push_peers)+self.__pull_peers:
-                            if peer.is_fully_validated():
-                                await peer.send_peer_discovery()
+            has_pull_peers_capacity = pull_peers < self.__max_pull_peers
+            # True if we have less than min_connections/2 pull peers
+            bellow_min_pull_connections = (
+                pull_peers < ceil(self.config.min_connections / 2)
+            )
+            # True if we need more total peers ro reach min_connections
+            bellow_min_connections = (
+                pull_peers + self.__peers.count(PUSH)
+                < self.config.min_connections
+            )
+            # Search for new pull peers if we have capacity and need more
+            # peer to reach min_connections or if we have less than
+            # min_connections/2 pull peers (to keep a minimum amount of pull
+            # peers and avoid only having push peers)
+            if((has_pull_peers_capacity and (
+                bellow_min_connections or bellow_min_pull_connections))
+               ):
+                logging.info("- - - - - - - - - - - - - -")
+                logging.info("[PEER] Looking for new Peers")
+                # Send PeerDiscovery to all validated peers
+                for peer in self.__peers.get_snapshot().peers:
+                    await peer.send_peer_discovery()
 
             await self.__log_connected_peers()
             await asyncio.sleep(self.config.search_cooldown)
 
-    async def __run_verifier(self):
-        """Sends out peer challenge to all unverified peers in a regular
-        intervall"""
-        while True:
-            async with self.__unverified_peers_lock:
-                if len(self.__unverified_peers) > 0:
-                    for peer in self.__unverified_peers:
-                        await peer.send_peer_challenge()
-
-            await asyncio.sleep(self.config.challenge_cooldown)
-
     async def log_gossip_debug(self):
-        """Logs all Gossip class variables.
-        Acquires unverified_peers_lock
-        """
+        """Logs all Gossip class variables."""
         await self.__log_connected_peers()
         async with self.__apis_lock:
             logging.debug(f"[API] connected apis {self.__apis}")
-        async with self.__datasubs_lock:
-            logging.debug(f"[API] current subscribers {self.__datasubs}")
-        async with self.__peer_announce_ids_lock:
-            logging.debug("[API] current routing ids: "
-                          f"{list(self.__peer_announce_ids.queue)}")
+            for api in self.__apis:
+                logging.debug(f"[API] send queue of {api}: "
+                              f"{api.get_send_statistics()}")
+        if self.__core is not None:
+            # The actor owns the state below and logs it itself
+            await self.__core.log_debug()
+            logging.debug(f"[PEER] metrics: {self.metrics}")
+            return
+        logging.debug(f"[API] current subscribers {self.__datasubs}")
+        logging.debug("[API] current routing ids: "
+                      f"{self.__peer_announce_ids}")
+        logging.debug("[API] estimated false positive rate of routing ids: "
+                      f"{self.__peer_announce_ids.estimated_fp_rate():.2e}")
         async with self.__announces_to_verify_lock:
             logging.debug("[API] current announces to verify: "
-                          f"{self.__announces_to_verify}\r\n")
+                          f"{self.__announces_to_verify}")
+            logging.debug("[API] announce store statistics: "
+                          f"{self.__announces_to_verify.get_statistics()}")
+        logging.debug(f"[PEER] metrics: {self.metrics}")
+        if self.lazy_push is not None:
+            logging.debug(f"[PEER] {self.lazy_push}")
+        logging.debug(f"[PEER] {self.dialer}, backed off addresses: "
+                      f"{self.dial_backoff}")
+        for peer in self.__peers.get_snapshot().peers:
+            logging.debug(f"[PEER] send queue of {peer}: "
+                          f"{peer.get_send_statistics()}")
+        logging.debug("\r\n")
 
     async def __log_connected_peers(self):
-        """Logs push and pull peers including capacities.
-        Acquires __push_peers_lock, __pull_peers_lock and unverified_peers_lock
-        """
-        async with self.__push_peers_lock:
-            logging.info("[PEER] Connected push peers: {}. {}/{}".format(
-                await self.get_peer_addresses(self.__push_peers),
-                len(self.__push_peers), self.__max_push_peers))
-        async with self.__pull_peers_lock:
-            logging.info("[PEER] Connected pull peers: {}. {}/{}".format(
-                await self.get_peer_addresses(self.__pull_peers),
-                len(self.__pull_peers), self.__max_pull_peers))
-        async with self.__unverified_peers_lock:
-            logging.info("[PEER] Connected unverified peers: {}. {}/{}".format(
-                await self.get_peer_addresses(self.__unverified_peers),
-                len(self.__unverified_peers), self.config.cache_size
-            ))
+        """Logs push and pull peers including capacities."""
+        for (name, role, capacity) in [
+                ("push", PUSH, self.__max_push_peers),
+                ("pull", PULL, self.__max_pull_peers),
+                ("unverified", UNVERIFIED, self.config.cache_size)]:
+            logging.info("[PEER] Connected {} peers: {}. {}/{}".format(
+                name,
+                await self.get_peer_addresses(self.__peers.get_peers(role)),
+                self.__peers.count(role), capacity))
 
     async def add_subscriber(self, datatype, api):
-        """Adds an Api_connection to the Subscriber dict (datasubs)
-           gets called after a GOSSIP_NOTIFY
+        """Adds an Api_connection to the Subscription_index (datasubs)
+           gets called after a GOSSIP_NOTIFY. Repeated GOSSIP_NOTIFYs for the
+           same datatype are ignored.
         """
-        async with self.__datasubs_lock:
-            if datatype in self.__datasubs.keys():
-                temp = self.__datasubs[datatype]
-                temp.append(api)
-                self.__datasubs[datatype] = temp
-            else:
-                self.__datasubs[datatype] = [api]
-        return
-
-    async def __remove_subscriber(self, api):
-        """Removes an Api_connection from the whole Subscriber dict (datasubs)
-        """
-        async with self.__datasubs_lock:
-            for key in self.__datasubs:
-                if api in self.__datasubs[key]:
-                    self.__datasubs[key].remove(api)
+        if self.__core is not None:
+            await self.__core.subscribed(datatype, api)
+            return
+        self.__datasubs.subscribe(datatype, api)
         return
 
     async def close_api(self, api):
         """Removes an Api connection from:
             - apis
             - datasubs
-           and closes the socket"""
-        await self.__remove_subscriber(api)
+            - validators of announces_to_verify
+           and closes the socket. Announces that are now validated according
+           to their validation policy are forwarded, announces nobody
+           validated are dropped (see Announce_store.remove_api)."""
         async with self.__apis_lock:
             if api in self.__apis:
                 self.__apis.remove(api)
+        if self.__core is not None:
+            await self.__core.api_closed(api)
+        else:
+            self.__datasubs.remove(api)
+            async with self.__announces_to_verify_lock:
+                completed = self.__announces_to_verify.remove_api(api)
+            for announce in completed:
+                await self.forward_announce(*announce)
         # Close the socket
         await api.close()
         return
 
-    async def __add_peer_announce_id(self, packet_id):
-        """Adds a packet/message id to the FIFO Queue to keep track of known
-           IDs to prevent routing loops"""
-        async with self.__peer_announce_ids_lock:
-            if self.__peer_announce_ids.full():
-                self.__peer_announce_ids.get()
-            # duplicates wont be added as we use SetQueue
-            self.__peer_announce_ids.put(packet_id)
-
     async def handle_gossip_announce(self, ttl, dtype, data):
         """Gets called upon arrival of a GOSSIP_ANNOUNCE
            Performs several things:
               - generate a packet id
               - add it as a known id
               - send a PEER_ANNOUNCE to a sample of degree peers"""
-        # Generate PEER_ANNOUNCE id
+        if self.__core is not None:
+            await self.__core.gossip_announce_received(ttl, dtype, data)
+            return
+        # Generate PEER_ANNOUNCE id and save it for routing loop prevention
         packet_id = randint(0, 2**64-1)
-        async with self.__peer_announce_ids_lock:
-            while self.__peer_announce_ids.contains(packet_id):
-                packet_id = randint(0, 2**64-1)
-        # Save this id for routing loop prevention
-        await self.__add_peer_announce_id(packet_id)
+        while self.__peer_announce_ids.check_and_add(packet_id):
+            packet_id = randint(0, 2**64-1)
 
         # Choose degree peers randomly
-        peers = await self.__get_verified_pull_push_peers()
-        if len(peers) < self.config.degree:
-            peer_sample = peers
-        else:
-            peer_sample = sample(peers, self.config.degree)
+        peer_sample = self.get_peer_sample()
 
         # send PEER_ANNOUNCE on each Peer_connection
-        for peer in peer_sample:
-            await peer.send_peer_announce(packet_id, ttl, dtype, data)
+        await self.send_peer_announces(peer_sample, packet_id, ttl, dtype,
+                                       data)
         return
 
     async def handle_peer_announce(self, packet_id, ttl, dtype, data, peer):
@@ -513,104 +578,220 @@ class Gossip:
               - if we want to forward it and all subs have to validate:
                 add it to the dictionary of to-be validated announces
                 'announces_to_verify'"""
-        # routing loops: check if id is already in id list
-        async with self.__peer_announce_ids_lock:
-            if self.__peer_announce_ids.contains(packet_id):
-                return
+        if self.__core is not None:
+            await self.__core.announce_received(packet_id, ttl, dtype, data,
+                                                peer)
+            return
+        if self.lazy_push is not None:
+            # Do not request it anymore if it was announced with PEER IHAVE
+            self.lazy_push.received(packet_id)
+        # routing loops: check if id is already in id list, add it otherwise
+        if self.__peer_announce_ids.check_and_add(packet_id):
+            return
+
+        # Immutable, stays valid while subscriptions change
+        subscribers = self.__datasubs.get_subscribers(dtype)
 
-        await self.__add_peer_announce_id(packet_id)
+        # no subscriber for this datatype
+        # Specification 4.2.2.: Do not propagate further.
+        if len(subscribers) == 0:
+            return
 
         if ttl == 1:  # ends here, no forwarding
-            async with self.__datasubs_lock:
-                if dtype in self.__datasubs.keys():
-                    for sub in self.__datasubs.get(dtype):
-                        sub.send_gossip_notification(packet_id, dtype, data)
+            async with self.__announces_to_verify_lock:
+                msg_id = self.__announces_to_verify.next_notification_id()
+            if msg_id is None:
+                self.drop_last_hop(packet_id)
+                return
+            header = build_gossip_notification_header(
+                msg_id, dtype, len(data))
+            for sub in subscribers:
+                await sub.send_gossip_notification(msg_id, dtype, data,
+                                                   header)
             return
 
         if ttl > 0:
             ttl -= 1
 
-        async with self.__datasubs_lock:
-            if dtype in self.__datasubs.keys():
-                # save message and subs as tuple:(ttl, dtype, data, [datasubs])
-                # and add to dictionary
-                async with self.__announces_to_verify_lock:
-                    self.__announces_to_verify[packet_id] = (
-                        ttl, dtype, data, peer,
-                        self.__datasubs.get(dtype).copy())
-                for sub in self.__datasubs.get(dtype):
-                    await sub.send_gossip_notification(packet_id, dtype, data)
-
-        # no subscriber for this datatype
-        # Specification 4.2.2.: Do not propagate further.
+        # save message and subs in the announce store. Subscribers
+        # get the 16 bit message id assigned by the store
+        async with self.__announces_to_verify_lock:
+            msg_id = self.__announces_to_verify.add(
+                packet_id, ttl, dtype, data, peer, subscribers)
+        if msg_id is None:
+            return
+        # All subscribers share the same header and data
+        header = build_gossip_notification_header(msg_id, dtype, len(data))
+        for sub in subscribers:
+            await sub.send_gossip_notification(msg_id, dtype, data, header)
         return
 
+    def drop_last_hop(self, packet_id):
+        """Counts and logs a PEER ANNOUNCE with ttl 1 that can not be
+        notified, because all notification ids are used by stored announces.
+        Also used by the actor core.
+
+        Arguments:
+        - packet_id (int) -- id of the PEER_ANNOUNCE
+        """
+        self.metrics.increment("last_hop_announces_dropped")
+        logging.warning(f"[API] No free notification id, dropping PEER "
+                        f"ANNOUNCE {packet_id} with ttl 1")
+
+    async def handle_peer_ihave(self, packet_id, ttl, dtype, peer):
+        """Gets called upon arrival of a PEER_IHAVE. Requests the PEER
+        ANNOUNCE with a PEER IWANT if its id is unknown and we have
+        subscribers for its datatype (Specification 4.2.2.: we would not
+        propagate it otherwise).
+
+        Arguments:
+        - packet_id (int) -- id of the PEER ANNOUNCE
+        - ttl (int) -- ttl of the PEER ANNOUNCE
+        - dtype (int) -- datatype
+        - peer (Peer_connection) -- peer that sent the PEER IHAVE
+        """
+        if self.lazy_push is None:
+            logging.debug(f"[PEER] Ignoring PEER IHAVE from {peer}, lazy push "
+                          "is disabled")
+            return
+        if self.__core is not None:
+            await self.__core.ihave_received(packet_id, dtype, peer)
+            return
+        if (packet_id in self.__peer_announce_ids
+                or len(self.__datasubs.get_subscribers(dtype)) == 0):
+            return
+        await self.lazy_push.handle_ihave(packet_id, peer)
+
+    async def handle_peer_iwant(self, packet_id, peer):
+        """Gets called upon arrival of a PEER_IWANT. Sends the requested PEER
+        ANNOUNCE, if it is still known.
+
+        Arguments:
+        - packet_id (int) -- id of the PEER ANNOUNCE
+        - peer (Peer_connection) -- peer that sent the PEER IWANT
+        """
+        if self.lazy_push is None:
+            logging.debug(f"[PEER] Ignoring PEER IWANT from {peer}, lazy push "
+                          "is disabled")
+            return
+        if self.__core is not None:
+            await self.__core.iwant_received(packet_id, peer)
+            return
+        await self.lazy_push.handle_iwant(packet_id, peer)
+
     async def handle_gossip_validation(self, msg_id, valid, api):
         """Gets called upon arrival of a GOSSIP_VALIDATION;
            - if the answer is negative, delete the announce packet from the
-             queue, it will never be sent.
+             store, it will never be sent.
            - if the message ID is not in the to-be validated announces do
              nothing (APIs are honest)
            - delete this API from the validators
            - if it was the last: send a PEER_ANNOUNCE as all have positively
              validated
-        """
-        if not valid:
-            # delete the whole entry
-            async with self.__announces_to_verify_lock:
-                self.__announces_to_verify.pop(msg_id, None)
-                return
 
+        Arguments:
+        - msg_id (int) -- 16 bit message id of the GOSSIP NOTIFICATION
+        - valid (bool) -- whether the api validated the message
+        - api (Api_connection) -- api that sent the validation
+        """
+        if self.__core is not None:
+            await self.__core.validation_received(msg_id, valid, api)
+            return
         async with self.__announces_to_verify_lock:
-            if msg_id not in self.__announces_to_verify.keys():
-                logging.debug("[API] Message ID of GOSSIP VALIDATION is " +
-                              "currently not being validated!")
+            if not valid:
+                # delete the whole entry
+                self.__announces_to_verify.reject(msg_id)
                 return
 
-            if api not in self.__announces_to_verify[msg_id][4]:
-                logging.debug("[API] Sender {api} of GOSSIP VALIDATION is " +
-                              "no validator!")
-                return
-
-            # remove this api from the validators of this message id
-            self.__announces_to_verify[msg_id][4].remove(api)
-
             # check if we are the last to verify
-            # if yes send PEER_ANNOUNCE to peer sample
-            if len(self.__announces_to_verify[msg_id][4]) == 0:
-                (ttl, dtype, data, peer, _) = self.__announces_to_verify.\
-                    pop(msg_id, None)
-                peer_sample = await self.__get_peer_sample()
-                # remove original sender from sample
-                if peer in peer_sample:
-                    peer_sample.remove(peer)
-
-                # forward
-                for peer in peer_sample:
-                    if peer.is_fully_validated():
-                        await peer.send_peer_announce(msg_id, ttl, dtype, data)
+            announce = self.__announces_to_verify.validate(msg_id, api)
+        # if yes send PEER_ANNOUNCE to peer sample, without holding the lock
+        if announce is not None:
+            await self.forward_announce(*announce)
         return
 
-    async def __get_peer_sample(self):
+    def __on_validation_timeout(self, announce):
+        """Gets called by announces_to_verify if an announce with the
+        validation policy timeout was not rejected in time. Returns the
+        coroutine forwarding it, which is started by the timer wheel or, with
+        the actor core, awaited by the actor.
+
+        Arguments:
+        - announce (Tuple) -- (packet_id, ttl, dtype, data, sender)
+        """
+        return self.forward_announce(*announce)
+
+    async def forward_announce(self, packet_id, ttl, dtype, data, sender):
+        """Sends a validated PEER_ANNOUNCE to a sample of peers, excluding the
+        peer it was received from. Only reads the peer snapshot, so it is
+        also used by the actor core.
+
+        Arguments:
+        - packet_id (int) -- id of the PEER_ANNOUNCE
+        - ttl (int) -- already decremented ttl
+        - dtype (int) -- datatype
+        - data (byte-object) -- data of the announce
+        - sender (Peer_connection) -- peer the announce was received from
+        """
+        peer_sample = self.get_peer_sample()
+        # remove original sender from sample
+        if sender in peer_sample:
+            peer_sample.remove(sender)
+
+        # forward
+        peer_sample = [peer for peer in peer_sample
+                       if peer.is_fully_validated()]
+        await self.send_peer_announces(peer_sample, packet_id, ttl, dtype,
+                                       data)
+
+    async def send_peer_announces(self, peers, packet_id, ttl, dtype, data):
+        """Queues a PEER_ANNOUNCE on all given peers and records the results
+        in metrics. Queueing never waits for the network, so a slow peer does
+        not delay the others (see Send_queue). Also used by the actor core.
+        Must not be called while holding a lock.
+
+        Arguments:
+        - peers (Peer_connection List) -- fully validated receivers
+        - packet_id (int) -- id of the PEER_ANNOUNCE
+        - ttl (int) -- ttl of the PEER_ANNOUNCE
+        - dtype (int) -- datatype
+        - data (byte-object) -- data of the announce
+        """
+        if len(peers) == 0:
+            return
+        start = time.monotonic()
+        if self.lazy_push is not None:
+            # Peers that only get a PEER IHAVE are removed
+            peers = await self.lazy_push.push(peers, packet_id, ttl, dtype,
+                                              data)
+        # Pack the header once, all peers share it and the data
+        header = pack_peer_announce_header(packet_id, ttl, dtype, len(data))
+        for peer in peers:
+            try:
+                if await peer.send_peer_announce(packet_id, ttl, dtype, data,
+                                                 header):
+                    self.metrics.increment("peer_announces_sent")
+                else:
+                    self.metrics.increment("peer_announces_dropped")
+            except OSError as e:
+                self.metrics.increment("peer_send_errors")
+                logging.warning(f"[PEER] Failed to send PEER ANNOUNCE "
+                                f"{packet_id} to {peer}: {e}")
+        self.metrics.observe("peer_announce_fanout_time",
+                             time.monotonic() - start)
+
+    def get_peer_snapshot(self):
+        """Returns the current Peer_snapshot of all verified pull and push
+        peers (push peers are assumed to be always verified, see unverified
+        peers). Does not require a lock, the snapshot is immutable."""
+        return self.__peers.get_snapshot()
+
+    def get_peer_sample(self):
         """Get a sample of the currently connected peers.
 
         Returns:
             - List of Peer_connections"""
-        peers = await self.__get_verified_pull_push_peers()
+        peers = self.__peers.get_snapshot().peers
         if len(peers) < self.config.degree:
-            return peers
+            return list(peers)
         return sample(peers, self.config.degree)
-
-    async def __get_verified_pull_push_peers(self):
-        """Returns a list containing all verified pull and push peers. Acquires
-        pull_peers_lock and push_peers_lock"""
-        peers = []
-        # Only take validated pull peers
-        async with self.__pull_peers_lock:
-            for peer in self.__pull_peers:
-                if peer.is_fully_validated():
-                    peers.append(peer)
-        # push peers are assumed to be always verified (see unverified peers)
-        async with self.__push_peers_lock:
-            peers += list(self.__push_peers)
-        return peers
@@ -0,0 +1,304 @@
+"""
+This module provides the Gossip_actor class, an alternative core of gossip
+that keeps the subscription, dedup and validation state in a single coroutine
+instead of guarding it with locks.
+"""
+import asyncio
+import logging
+from random import randint
+
+from modules.packet_parser import build_gossip_notification_header
+
+# Cores of gossip, see config gossip_core:
+# - locks: the Gossip methods change the state themselves, guarded by locks
+# - actor: the Gossip methods send commands to a Gossip_actor
+GOSSIP_CORES = ["locks", "actor"]
+
+# Maximum number of commands waiting for the actor. Senders wait while the
+# queue is full, so a fast peer can not grow it without bounds
+ACTOR_QUEUE_SIZE = 4096
+
+
+class Actor_timers:
+    """Actor_timers is used instead of the Timer_wheel by the state owned by
+    a Gossip_actor (its Announce_store and the Lazy_push of gossip). Timers
+    are scheduled at the Timer_wheel, but when they expire their callbacks
+    are sent to the actor as commands. A timer that is cancelled after it
+    expired, but before the actor processed its command, is not run.
+
+    Class variables:
+    - timer_wheel (Timer_wheel) -- (private) wheel the timers are scheduled at
+    - actor (Gossip_actor) -- actor running the callbacks, set by the actor
+    """
+
+    def __init__(self, timer_wheel):
+        """
+        Arguments:
+        - timer_wheel (Timer_wheel) -- wheel the timers are scheduled at
+        """
+        self.__timer_wheel = timer_wheel
+        self.actor = None
+
+    def schedule(self, delay, callback, *args):
+        """See Timer_wheel.schedule. callback is called by the actor, a
+        returned coroutine is awaited by the actor."""
+        timer = self.__timer_wheel.schedule(delay, self.__expired)
+        timer.args = (timer, callback, args)
+        return timer
+
+    def __expired(self, timer, callback, args):
+        """Gets called by the timer wheel. Returns the coroutine sending the
+        callback to the actor"""
+        return self.actor.timer_expired(timer, callback, args)
+
+
+class Gossip_actor:
+    """The Gossip_actor owns the subscribers, the known PEER ANNOUNCE ids,
+    the announces waiting for validation and the Lazy_push of gossip. Only
+    its own coroutine (run) reads or changes them, every other coroutine
+    sends commands (announce_received, validation_received, ...) that are
+    processed one after another, so no locks are required. Their deadlines
+    are scheduled with Actor_timers, so expired timers are commands as well.
+
+    A command handler never waits for the network: GOSSIP NOTIFICATIONs and
+    PEER ANNOUNCEs are only put into the Send_queues of the connections.
+    Membership stays in the Peer_registry of gossip, which never awaits, and
+    is read through its immutable Peer_snapshot. PEER ANNOUNCEs are sent
+    with Gossip.send_peer_announces and Gossip.forward_announce, which only
+    read the snapshot.
+
+    The actor is started with the first command.
+
+    Class variables:
+    - gossip (Gossip) -- (private) gossip using this actor, provides config,
+      metrics and sends PEER ANNOUNCEs
+    - datasubs (Subscription_index) -- (private) subscribers by datatype and
+      datatypes by API
+    - peer_announce_ids (Id_cache / Bloom_id_cache) -- (private) known PEER
+      ANNOUNCE ids
+    - announces_to_verify (Announce_store) -- (private) PEER ANNOUNCEs
+      waiting for the validation of all subscribers
+    - queue (asyncio.Queue) -- (private) pending commands.
+      Format: (handler, arguments (Tuple), done (Future / None))
+    - task (Task) -- (private) task running the actor, None until the first
+      command
+    - processed (int) -- (private) number of processed commands
+    """
+
+    def __init__(self, gossip, datasubs, peer_announce_ids,
+                 announces_to_verify, timers=None,
+                 max_commands=ACTOR_QUEUE_SIZE):
+        """
+        Arguments:
+        - gossip (Gossip) -- gossip using this actor
+        - datasubs (Subscription_index) -- subscribers, owned by the actor
+          from now on
+        - peer_announce_ids (Id_cache / Bloom_id_cache) -- known PEER
+          ANNOUNCE ids, owned by the actor from now on
+        - announces_to_verify (Announce_store) -- store of announces waiting
+          for validation, owned by the actor from now on
+        - timers (Actor_timers) -- (Optional, default: None) timers of the
+          owned state, their callbacks are run by this actor
+        - max_commands (int) -- (Optional, default: ACTOR_QUEUE_SIZE)
+          maximum number of pending commands
+        """
+        self.__gossip = gossip
+        self.__datasubs = datasubs
+        self.__peer_announce_ids = peer_announce_ids
+        self.__announces_to_verify = announces_to_verify
+        self.__queue = asyncio.Queue(max_commands)
+        self.__task = None
+        self.__processed = 0
+        if timers is not None:
+            timers.actor = self
+
+    def __repr__(self):
+        return (f"Gossip_actor(pending: {self.__queue.qsize()}, processed: "
+                f"{self.__processed}, subscribers: {self.__datasubs}, "
+                f"open announces: {len(self.__announces_to_verify)})")
+
+    def get_pending(self):
+        """Returns the number of commands waiting to be processed"""
+        return self.__queue.qsize()
+
+    async def run(self):
+        """Processes commands until the actor is closed"""
+        while True:
+            (handler, arguments, done) = await self.__queue.get()
+            try:
+                await handler(*arguments)
+            except Exception:
+                logging.exception(f"[API] Gossip actor failed to process "
+                                  f"{handler.__name__}")
+            finally:
+                self.__processed += 1
+                if done is not None and not done.done():
+                    done.set_result(None)
+
+    def close(self):
+        """Stops the actor. Pending commands are dropped"""
+        if self.__task is not None:
+            self.__task.cancel()
+            self.__task = None
+
+    async def flush(self):
+        """Returns after all commands queued before were processed"""
+        await self.__call(self.__on_flush)
+
+    async def log_debug(self):
+        """Logs the state owned by the actor, see Gossip.log_gossip_debug.
+        Returns after it was logged."""
+        await self.__call(self.__on_log_debug)
+
+    async def __post(self, handler, *arguments):
+        """Queues a command without waiting for it to be processed. Waits
+        while the queue is full."""
+        if self.__task is None:
+            self.__task = asyncio.create_task(self.run())
+        await self.__queue.put((handler, arguments, None))
+
+    async def __call(self, handler, *arguments):
+        """Queues a command and waits until it was processed"""
+        done = asyncio.get_running_loop().create_future()
+        if self.__task is None:
+            self.__task = asyncio.create_task(self.run())
+        await self.__queue.put((handler, arguments, done))
+        await done
+
+    # Commands
+
+    async def subscribed(self, dtype, api):
+        """An API sent a GOSSIP NOTIFY for dtype"""
+        await self.__post(self.__on_subscribed, dtype, api)
+
+    async def api_closed(self, api):
+        """An API disconnected. Returns after its subscriptions and
+        validations were removed."""
+        await self.__call(self.__on_api_closed, api)
+
+    async def gossip_announce_received(self, ttl, dtype, data):
+        """An API sent a GOSSIP ANNOUNCE"""
+        await self.__post(self.__on_gossip_announce, ttl, dtype, data)
+
+    async def announce_received(self, packet_id, ttl, dtype, data, peer):
+        """A peer sent a PEER ANNOUNCE"""
+        await self.__post(self.__on_announce, packet_id, ttl, dtype, data,
+                          peer)
+
+    async def validation_received(self, msg_id, valid, api):
+        """An API sent a GOSSIP VALIDATION"""
+        await self.__post(self.__on_validation, msg_id, valid, api)
+
+    async def ihave_received(self, packet_id, dtype, peer):
+        """A peer sent a PEER IHAVE"""
+        await self.__post(self.__on_ihave, packet_id, dtype, peer)
+
+    async def iwant_received(self, packet_id, peer):
+        """A peer sent a PEER IWANT"""
+        await self.__post(self.__gossip.lazy_push.handle_iwant, packet_id,
+                          peer)
+
+    async def timer_expired(self, timer, callback, args):
+        """A timer scheduled with Actor_timers expired"""
+        await self.__post(self.__on_timer, timer, callback, args)
+
+    # Handlers, only called by run
+
+    async def __on_flush(self):
+        """Does nothing, see flush"""
+
+    async def __on_log_debug(self):
+        """Logs the subscribers, known ids and stored announces"""
+        logging.debug(f"[API] {self}")
+        logging.debug(f"[API] current subscribers {self.__datasubs}")
+        logging.debug("[API] current routing ids: "
+                      f"{self.__peer_announce_ids}")
+        logging.debug("[API] estimated false positive rate of routing ids: "
+                      f"{self.__peer_announce_ids.estimated_fp_rate():.2e}")
+        logging.debug("[API] current announces to verify: "
+                      f"{self.__announces_to_verify}")
+        logging.debug("[API] announce store statistics: "
+                      f"{self.__announces_to_verify.get_statistics()}")
+
+    async def __on_subscribed(self, dtype, api):
+        """Adds api to the subscribers of dtype"""
+        self.__datasubs.subscribe(dtype, api)
+
+    async def __on_api_closed(self, api):
+        """Removes api from the subscribers and validators. Announces that
+        are now validated according to their validation policy are
+        forwarded, see Announce_store.remove_api."""
+        self.__datasubs.remove(api)
+        for announce in self.__announces_to_verify.remove_api(api):
+            await self.__forward(*announce)
+
+    async def __on_gossip_announce(self, ttl, dtype, data):
+        """Sends a PEER ANNOUNCE with a new id to a sample of peers"""
+        packet_id = randint(0, 2**64-1)
+        while self.__peer_announce_ids.check_and_add(packet_id):
+            packet_id = randint(0, 2**64-1)
+        await self.__gossip.send_peer_announces(
+            self.__gossip.get_peer_sample(), packet_id, ttl, dtype, data)
+
+    async def __on_timer(self, timer, callback, args):
+        """Runs the callback of an expired timer, unless it was cancelled
+        meanwhile"""
+        if timer.cancelled:
+            return
+        result = callback(*args)
+        if asyncio.iscoroutine(result):
+            await result
+
+    async def __on_announce(self, packet_id, ttl, dtype, data, peer):
+        """Notifies the subscribers of a new PEER ANNOUNCE and stores it
+        until they validated it, unless its ttl ends here. See
+        Gossip.handle_peer_announce"""
+        if self.__gossip.lazy_push is not None:
+            # Do not request it anymore if it was announced with PEER IHAVE
+            self.__gossip.lazy_push.received(packet_id)
+        # routing loops: drop known ids
+        if self.__peer_announce_ids.check_and_add(packet_id):
+            return
+        subscribers = self.__datasubs.get_subscribers(dtype)
+        # Specification 4.2.2.: Do not propagate without subscribers
+        if len(subscribers) == 0:
+            return
+
+        if ttl == 1:  # ends here, no forwarding
+            msg_id = self.__announces_to_verify.next_notification_id()
+            if msg_id is None:
+                self.__gossip.drop_last_hop(packet_id)
+                return
+        else:
+            if ttl > 0:
+                ttl -= 1
+            msg_id = self.__announces_to_verify.add(
+                packet_id, ttl, dtype, data, peer, subscribers)
+            if msg_id is None:
+                return
+        header = build_gossip_notification_header(msg_id, dtype, len(data))
+        for sub in subscribers:
+            await sub.send_gossip_notification(msg_id, dtype, data, header)
+
+    async def __on_ihave(self, packet_id, dtype, peer):
+        """Requests an unknown PEER ANNOUNCE of a subscribed datatype. See
+        Gossip.handle_peer_ihave"""
+        if (packet_id in self.__peer_announce_ids
+                or len(self.__datasubs.get_subscribers(dtype)) == 0):
+            return
+        await self.__gossip.lazy_push.handle_ihave(packet_id, peer)
+
+    async def __on_validation(self, msg_id, valid, api):
+        """Rejects or validates a stored announce and forwards it once all
+        subscribers validated it"""
+        if not valid:
+            self.__announces_to_verify.reject(msg_id)
+            return
+        announce = self.__announces_to_verify.validate(msg_id, api)
+        if announce is not None:
+            await self.__forward(*announce)
+
+    async def __forward(self, packet_id, ttl, dtype, data, sender):
+        """Sends a validated PEER ANNOUNCE, see Gossip.forward_announce"""
+        await self.__gossip.forward_announce(packet_id, ttl, dtype, data,
+                                             sender)
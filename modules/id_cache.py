@@ -0,0 +1,256 @@
+"""
+This module provides caches of seen PEER ANNOUNCE ids, which are used to
+prevent spreading duplicate messages:
+- Id_cache -- exact, fixed-capacity FIFO cache
+- Bloom_id_cache -- approximate cache of rotating Bloom filters for large
+  protection windows with a fixed memory footprint. It saves memory, not
+  time: lookups are slower than with Id_cache
+
+Both provide check_and_add and estimated_fp_rate.
+"""
+from math import ceil, exp, log
+from random import getrandbits
+
+# Backends selectable with the dedup_backend config option
+DEDUP_BACKENDS = ["exact", "bloom"]
+
+# Number of Bloom filter generations used by Bloom_id_cache
+BLOOM_GENERATIONS = 4
+
+# All bits of an id are set in a single block of this many bits, so a lookup
+# tests one block per generation
+BLOCK_BITS = 512
+_POSITION_BITS = 9
+
+# Positions are taken from a 128 bit hash, which limits the bits per id
+MAX_HASHES = 128 // _POSITION_BITS
+
+_MASK_64 = 2**64 - 1
+_BIT = tuple(1 << i for i in range(BLOCK_BITS))
+
+
+def _popcount(x):
+    """Returns the number of set bits of a non-negative integer
+    (int.bit_count requires Python 3.10)"""
+    return bin(x).count("1")
+
+
+class Id_cache:
+    """The Id_cache remembers the last capacity ids that were added. When it
+    is full, the oldest id is replaced (FIFO).
+
+    It is only used from the event loop and does not use any locks. All
+    operations are O(1).
+
+    Class variables:
+    - capacity (int) -- (private) maximum number of ids
+    - ring (List) -- (private) ids in insertion order, used as a ring buffer
+    - ids (set) -- (private) ids currently in the cache, for lookups
+    - position (int) -- (private) index in ring the next id is written to
+    """
+
+    def __init__(self, capacity):
+        """
+        Arguments:
+        - capacity (int) -- maximum number of ids, must be greater than 0
+        """
+        self.__capacity = capacity
+        self.__ring = [None] * capacity
+        self.__ids = set()
+        self.__position = 0
+
+    def __len__(self):
+        """Returns the number of ids in the cache"""
+        return len(self.__ids)
+
+    def __contains__(self, id):
+        """Returns True if the id is in the cache"""
+        return id in self.__ids
+
+    def __repr__(self):
+        """Returns the ids from oldest to newest"""
+        ids = (self.__ring[self.__position:] +
+               self.__ring[:self.__position])
+        return str([id for id in ids if id is not None])
+
+    def check_and_add(self, id):
+        """Adds the id to the cache, unless it is already known. If the cache
+        is full, the oldest id is removed.
+
+        Arguments:
+        - id (int) -- id to check and add
+
+        Returns: True if the id was already in the cache, otherwise False
+        """
+        if id in self.__ids:
+            return True
+        oldest = self.__ring[self.__position]
+        if oldest is not None:
+            self.__ids.discard(oldest)
+        self.__ring[self.__position] = id
+        self.__ids.add(id)
+        self.__position += 1
+        if self.__position == self.__capacity:
+            self.__position = 0
+        return False
+
+    def estimated_fp_rate(self):
+        """Returns the probability that an unknown id is reported as known.
+        Always 0, since this cache is exact."""
+        return 0.0
+
+
+def _mix_64(x):
+    """Mixes the bits of a 64 bit integer (splitmix64 finalizer)"""
+    x = ((x ^ (x >> 30)) * 0xbf58476d1ce4e5b9) & _MASK_64
+    x = ((x ^ (x >> 27)) * 0x94d049bb133111eb) & _MASK_64
+    return x ^ (x >> 31)
+
+
+def _blocked_fp_rate(ids_per_block, hashes):
+    """Returns the false positive rate of a full blocked Bloom filter. The
+    number of ids per block is poisson distributed.
+
+    Arguments:
+    - ids_per_block (float) -- average number of ids per block
+    - hashes (int) -- number of bits per id
+    """
+    fp_rate = 0.0
+    probability = exp(-ids_per_block)
+    limit = ceil(ids_per_block + 10 * ids_per_block**0.5 + 10)
+    for ids in range(limit):
+        bit_set = 1 - (1 - 1 / BLOCK_BITS)**(hashes * ids)
+        fp_rate += probability * bit_set**hashes
+        probability *= ids_per_block / (ids + 1)
+    return fp_rate
+
+
+class Bloom_id_cache:
+    """The Bloom_id_cache remembers at least the last window added ids in
+    BLOOM_GENERATIONS blocked Bloom filters. New ids are added to the newest
+    generation. Once it holds window / (generations - 1) ids, the oldest
+    generation is cleared and becomes the newest one.
+
+    Lookups can return false positives (an unknown id is reported as known)
+    with about the configured rate, but never false negatives within the
+    window. Ids reported as known are not added. The memory used is fixed and
+    independent of the message rate, but each lookup hashes the id and builds
+    a bit mask in Python, which makes it several times slower than Id_cache.
+    It only pays off when the window is too large to keep the ids in a set.
+
+    Class variables:
+    - per_generation (int) -- (private) ids added to a generation before
+      rotating
+    - blocks (int) -- (private) number of blocks per generation
+    - shifts (int Tuple) -- (private) offsets of the bit positions of an id in
+      its 128 bit hash, one per hash function
+    - salt (int) -- (private) random value mixed into all ids, so that peers
+      can not choose ids that collide in our filters
+    - filters (List of int Lists) -- (private) blocks of all generations,
+      newest last
+    - counts (int List) -- (private) ids added to each generation
+    - block_fp_rate (float Tuple) -- (private) false positive rate of a block
+      by number of set bits
+    """
+
+    def __init__(self, window, fp_rate, generations=BLOOM_GENERATIONS):
+        """
+        Arguments:
+        - window (int) -- minimum number of most recent ids that are
+          remembered
+        - fp_rate (float) -- targeted false positive rate, 0 < fp_rate < 1
+        - generations (int) -- (Optional, default: BLOOM_GENERATIONS) number
+          of Bloom filters, must be at least 2
+        """
+        self.__per_generation = ceil(window / (generations - 1))
+        # A lookup checks all generations, so each one gets a part of the
+        # false positive rate
+        generation_fp_rate = fp_rate / generations
+        # Start with the size of a classic Bloom filter and grow until the
+        # unevenly filled blocks reach the targeted rate
+        bits = -self.__per_generation * log(generation_fp_rate) / log(2)**2
+        self.__blocks = ceil(bits / BLOCK_BITS)
+        while True:
+            hashes = round(self.__blocks * BLOCK_BITS / self.__per_generation
+                           * log(2))
+            hashes = min(max(1, hashes), MAX_HASHES)
+            if (_blocked_fp_rate(self.__per_generation / self.__blocks,
+                                 hashes) <= generation_fp_rate):
+                break
+            self.__blocks = ceil(self.__blocks * 1.05)
+        self.__shifts = tuple(range(0, hashes * _POSITION_BITS,
+                                    _POSITION_BITS))
+        self.__salt = getrandbits(64)
+        self.__filters = [[0] * self.__blocks for _ in range(generations)]
+        self.__counts = [0] * generations
+        self.__block_fp_rate = tuple((bits_set / BLOCK_BITS)**hashes
+                                     for bits_set in range(BLOCK_BITS + 1))
+
+    def __len__(self):
+        """Returns the number of ids added to the remembered generations"""
+        return sum(self.__counts)
+
+    def __contains__(self, id):
+        """Returns True if the id is (probably) known"""
+        (block, mask) = self.__locate(id)
+        for filter in self.__filters:
+            if filter[block] & mask == mask:
+                return True
+        return False
+
+    def __repr__(self):
+        return (f"Bloom_id_cache<{len(self)} ids, "
+                f"{self.get_memory_size()} bytes, estimated fp rate: "
+                f"{self.estimated_fp_rate():.2e}>")
+
+    def __locate(self, id):
+        """Returns the block of the id and the mask of its bits"""
+        h1 = _mix_64(id ^ self.__salt)
+        h2 = _mix_64(h1)
+        hash = (h2 << 64) | h1
+        mask = 0
+        for shift in self.__shifts:
+            mask |= _BIT[(hash >> shift) & (BLOCK_BITS - 1)]
+        return (_mix_64(h2) % self.__blocks, mask)
+
+    def check_and_add(self, id):
+        """Adds the id to the cache, unless it is (probably) already known.
+
+        Arguments:
+        - id (int) -- id to check and add
+
+        Returns: True if the id was already in the cache, otherwise False
+        """
+        (block, mask) = self.__locate(id)
+        for filter in self.__filters:
+            if filter[block] & mask == mask:
+                return True
+
+        if self.__counts[-1] >= self.__per_generation:
+            self.__rotate()
+        self.__filters[-1][block] |= mask
+        self.__counts[-1] += 1
+        return False
+
+    def __rotate(self):
+        """Clears the oldest generation and makes it the newest one"""
+        self.__filters.pop(0)
+        self.__filters.append([0] * self.__blocks)
+        self.__counts.pop(0)
+        self.__counts.append(0)
+
+    def get_memory_size(self):
+        """Returns the number of bytes of all filter bits (without the
+        overhead of the Python objects holding them)"""
+        return len(self.__filters) * self.__blocks * BLOCK_BITS // 8
+
+    def estimated_fp_rate(self):
+        """Returns the estimated probability that an unknown id is reported as
+        known, based on the bits currently set in each generation. Counts the
+        bits of all blocks, so it is only meant for logging."""
+        probability_unknown = 1.0
+        for filter in self.__filters:
+            fill = sum(self.__block_fp_rate[_popcount(block)]
+                       for block in filter)
+            probability_unknown *= 1 - fill / self.__blocks
+        return 1 - probability_unknown
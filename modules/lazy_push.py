@@ -0,0 +1,206 @@
+"""
+This module provides the Lazy_push class, which implements the lazy push
+dissemination mode: large PEER ANNOUNCEs are pushed to a few peers, the
+others get a PEER IHAVE with the id and request the data with a PEER IWANT
+if they did not receive it yet.
+"""
+import logging
+from collections import OrderedDict, deque
+
+from modules.packet_parser import pack_peer_ihave
+
+# Dissemination modes, see config dissemination:
+# - eager: PEER ANNOUNCEs are sent to all peers of the sample
+# - lazy: large PEER ANNOUNCEs are sent to eager_fanout peers of the sample,
+#   the other peers get a PEER IHAVE
+DISSEMINATION_MODES = ["eager", "lazy"]
+
+# Memory budget of the payloads kept to answer PEER IWANTs in bytes
+PAYLOAD_CACHE_BYTES = 2**24
+
+# Seconds to wait for the PEER ANNOUNCE after sending a PEER IWANT, before
+# the next peer that sent a PEER IHAVE for it is asked
+IWANT_TIMEOUT = 1
+
+# Maximum number of ids waiting for a PEER ANNOUNCE after a PEER IWANT.
+# Further PEER IHAVEs are ignored
+MAX_PENDING_IWANTS = 4096
+
+
+class Lazy_push:
+    """The Lazy_push keeps the payloads of recently sent large PEER ANNOUNCEs
+    to answer PEER IWANTs, and the PEER IWANTs we sent that were not answered
+    yet.
+
+    Only peers that negotiated lazy push (Peer_connection.lazy_push, see
+    PEER_FLAG_LAZY_PUSH) get PEER IHAVEs, all other peers get the full PEER
+    ANNOUNCE. Whether an id is already known is decided by the caller (using
+    the known PEER ANNOUNCE ids of gossip).
+
+    The Lazy_push does not await while changing its state, so it does not
+    require a lock.
+
+    Class variables:
+    - timer_wheel (Timer_wheel / Actor_timers) -- (private) used for the PEER
+      IWANT timeouts
+    - metrics (Metrics) -- (private) metrics of gossip
+    - eager_fanout (int) -- (private) number of peers of a sample that get the
+      full PEER ANNOUNCE
+    - threshold (int) -- (private) PEER ANNOUNCEs with less data are always
+      sent to all peers
+    - max_bytes (int) -- (private) memory budget of payloads
+    - iwant_timeout (float) -- (private) see IWANT_TIMEOUT
+    - payloads (OrderedDict: int - Tuple) -- (private) sent payloads by id,
+      oldest first. Format: id : (ttl, dtype, data)
+    - bytes (int) -- (private) bytes of data in payloads
+    - pending (dictionary: int - List) -- (private) ids requested with a
+      PEER IWANT. Format: id : [peers that also sent a PEER IHAVE and were
+      not asked yet (deque), all peers that sent a PEER IHAVE (set), timer]
+    """
+
+    def __init__(self, timer_wheel, metrics, eager_fanout, threshold,
+                 max_bytes=PAYLOAD_CACHE_BYTES, iwant_timeout=IWANT_TIMEOUT):
+        """
+        Arguments:
+        - timer_wheel (Timer_wheel / Actor_timers) -- used for the PEER IWANT
+          timeouts
+        - metrics (Metrics) -- metrics of gossip
+        - eager_fanout (int) -- number of peers of a sample that get the full
+          PEER ANNOUNCE
+        - threshold (int) -- PEER ANNOUNCEs with less bytes of data are always
+          sent to all peers
+        - max_bytes (int) -- (Optional, default: PAYLOAD_CACHE_BYTES) memory
+          budget of the payloads
+        - iwant_timeout (float) -- (Optional, default: IWANT_TIMEOUT) seconds
+          to wait for the answer of a PEER IWANT
+        """
+        self.__timer_wheel = timer_wheel
+        self.__metrics = metrics
+        self.__eager_fanout = eager_fanout
+        self.__threshold = threshold
+        self.__max_bytes = max_bytes
+        self.__iwant_timeout = iwant_timeout
+        self.__payloads = OrderedDict()
+        self.__bytes = 0
+        self.__pending = {}
+
+    def __repr__(self):
+        return (f"Lazy_push(payloads: {len(self.__payloads)}, bytes: "
+                f"{self.__bytes}, pending iwants: {len(self.__pending)})")
+
+    async def push(self, peers, packet_id, ttl, dtype, data):
+        """Sends a PEER IHAVE to the peers of a sample that do not need the
+        full PEER ANNOUNCE and keeps the payload for their PEER IWANTs.
+
+        Arguments:
+        - peers (Peer_connection List) -- random sample of validated peers
+        - packet_id (int) -- id of the PEER ANNOUNCE
+        - ttl (int) -- ttl of the PEER ANNOUNCE
+        - dtype (int) -- datatype
+        - data (byte-object) -- data of the announce
+
+        Returns: the peers that should get the full PEER ANNOUNCE
+        """
+        if len(data) < self.__threshold:
+            return peers
+        eager = [peer for peer in peers if not peer.lazy_push]
+        lazy = [peer for peer in peers if peer.lazy_push]
+        missing = max(self.__eager_fanout - len(eager), 0)
+        eager.extend(lazy[:missing])
+        lazy = lazy[missing:]
+        if len(lazy) == 0:
+            return eager
+
+        self.__store(packet_id, ttl, dtype, data)
+        message = pack_peer_ihave(packet_id, ttl, dtype)
+        for peer in lazy:
+            if await peer.send_peer_ihave(packet_id, ttl, dtype, message):
+                self.__metrics.increment("peer_ihaves_sent")
+            else:
+                self.__metrics.increment("peer_announces_dropped")
+        return eager
+
+    def __store(self, packet_id, ttl, dtype, data):
+        """Keeps a payload for PEER IWANTs, evicting the oldest payloads to
+        stay within the memory budget"""
+        if packet_id in self.__payloads or len(data) > self.__max_bytes:
+            return
+        # Data can be a memoryview of a whole received chunk
+        data = bytes(data)
+        self.__payloads[packet_id] = (ttl, dtype, data)
+        self.__bytes += len(data)
+        while self.__bytes > self.__max_bytes:
+            (_, (_, _, evicted)) = self.__payloads.popitem(last=False)
+            self.__bytes -= len(evicted)
+
+    async def handle_ihave(self, packet_id, peer):
+        """Requests an unknown PEER ANNOUNCE announced by peer. If it was
+        already requested, peer is asked if the request times out.
+
+        Arguments:
+        - packet_id (int) -- id of the PEER ANNOUNCE, not known yet
+        - peer (Peer_connection) -- peer that sent the PEER IHAVE
+        """
+        pending = self.__pending.get(packet_id)
+        if pending is not None:
+            # Every peer is asked at most once, repeated PEER IHAVEs are
+            # ignored
+            if peer not in pending[1]:
+                pending[0].append(peer)
+                pending[1].add(peer)
+            return
+        if len(self.__pending) >= MAX_PENDING_IWANTS:
+            logging.debug(f"[PEER] Too many pending PEER IWANTs, ignoring "
+                          f"PEER IHAVE {packet_id} from {peer}")
+            return
+        timer = self.__timer_wheel.schedule(
+            self.__iwant_timeout, self.__on_iwant_timeout, packet_id)
+        self.__pending[packet_id] = [deque(), {peer}, timer]
+        await self.__send_iwant(peer, packet_id)
+
+    async def __send_iwant(self, peer, packet_id):
+        """Sends a PEER IWANT for packet_id to peer"""
+        self.__metrics.increment("peer_iwants_sent")
+        await peer.send_peer_iwant(packet_id)
+
+    def __on_iwant_timeout(self, packet_id):
+        """Gets called by the timer wheel if a PEER IWANT was not answered in
+        time. Returns the coroutine asking the next peer, if one is left."""
+        pending = self.__pending.get(packet_id)
+        if pending is None:
+            return None
+        self.__metrics.increment("peer_iwant_timeouts")
+        if len(pending[0]) == 0:
+            del self.__pending[packet_id]
+            return None
+        peer = pending[0].popleft()
+        pending[2] = self.__timer_wheel.schedule(
+            self.__iwant_timeout, self.__on_iwant_timeout, packet_id)
+        return self.__send_iwant(peer, packet_id)
+
+    def received(self, packet_id):
+        """Must be called for every received PEER ANNOUNCE, so it is not
+        requested again"""
+        pending = self.__pending.pop(packet_id, None)
+        if pending is not None:
+            pending[2].cancel()
+
+    async def handle_iwant(self, packet_id, peer):
+        """Sends a requested PEER ANNOUNCE to peer, if its payload is still
+        known.
+
+        Arguments:
+        - packet_id (int) -- id from the PEER IWANT
+        - peer (Peer_connection) -- peer that sent the PEER IWANT
+        """
+        payload = self.__payloads.get(packet_id)
+        if payload is None:
+            self.__metrics.increment("peer_iwant_misses")
+            logging.debug(f"[PEER] Payload of PEER IWANT {packet_id} from "
+                          f"{peer} is not known (anymore)")
+            return
+        (ttl, dtype, data) = payload
+        if await peer.send_peer_announce(packet_id, ttl, dtype, data):
+            self.__metrics.increment("peer_iwants_served")
+        else:
+            self.__metrics.increment("peer_announces_dropped")
@@ -0,0 +1,70 @@
+"""
+This module provides the Metrics class, which collects counters and timings
+of a gossip instance, e.g. sent messages or peers that were too slow.
+"""
+
+
+class Metrics:
+    """The Metrics class keeps named counters and observed values. Names are
+    created on first use.
+
+    Class variables:
+    - counters (dictionary: str - int) -- (private) counters, see increment
+    - observations (dictionary: str - List) -- (private) observed values.
+      Format: name : [count, total, max]
+    """
+
+    def __init__(self):
+        self.__counters = {}
+        self.__observations = {}
+
+    def __repr__(self):
+        return repr(self.get_statistics())
+
+    def increment(self, name, value=1):
+        """Increases the counter name by value.
+
+        Arguments:
+        - name (str) -- name of the counter
+        - value (int) -- (Optional, default: 1) value to add
+        """
+        self.__counters[name] = self.__counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        """Records a single value, e.g. the duration of an operation.
+
+        Arguments:
+        - name (str) -- name of the observation
+        - value (float) -- observed value
+        """
+        observation = self.__observations.get(name)
+        if observation is None:
+            self.__observations[name] = [1, value, value]
+            return
+        observation[0] += 1
+        observation[1] += value
+        observation[2] = max(observation[2], value)
+
+    def get(self, name):
+        """Returns the value of the counter name, 0 if it was never
+        increased"""
+        return self.__counters.get(name, 0)
+
+    def get_statistics(self):
+        """Returns a copy of all counters and observations.
+
+        Returns:
+            dictionary with all counter names mapping to their value and all
+            observation names mapping to a dictionary with the keys:
+            - count (int) -- number of observed values
+            - mean (float) -- mean of the observed values
+            - max (float) -- largest observed value
+        """
+        statistics = self.__counters.copy()
+        for (name, (count, total, maximum)) in self.__observations.items():
+            statistics[name] = {
+                "count": count,
+                "mean": total / count,
+                "max": maximum,
+            }
+        return statistics
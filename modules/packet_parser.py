@@ -17,6 +17,13 @@ PEER_INFO = 507
 PEER_CHALLENGE = 508
 PEER_VERIFICATION = 509
 PEER_VALIDATION = 510
+PEER_IHAVE = 511
+PEER_IWANT = 512
+
+# Capability flags in the reserved field of PEER INFO and PEER VALIDATION.
+# Nodes that do not know a flag ignore it
+# - lazy push: the node handles PEER IHAVE and PEER IWANT
+PEER_FLAG_LAZY_PUSH = 1
 
 # struct formats for API packets
 # !! no data is included as size is variable
@@ -32,6 +39,15 @@ FORMAT_PEER_INFO = "!HHHH"
 FORMAT_PEER_CHALLENGE = "!HHQ"
 FORMAT_PEER_VERIFICATION = "!HHQ"
 FORMAT_PEER_VALIDATION = "!HHHH"
+FORMAT_PEER_IHAVE = "!HHQBBH"
+FORMAT_PEER_IWANT = "!HHQ"
+
+# Size of the header (size and type) every packet starts with
+HEADER_SIZE = 4
+
+# Maximum number of bytes read from a connection at once. Can contain many
+# packets, see Frame_decoder
+READ_SIZE = 2**16
 
 
 def __get_header_size(buf):
@@ -62,6 +78,97 @@ def get_header_type(buf):
         return int.from_bytes(buf[2:4], "big")
 
 
+class Frame_decoder:
+    """The Frame_decoder splits a stream of bytes into packets (frames).
+    Chunks of any size can be fed into it, each complete frame is returned
+    as a read-only memoryview. Frames are not copied, unless they are split
+    over multiple chunks: then only the bytes of the split frame are copied
+    into the buffer, all following frames are views into the new chunk.
+
+    Returned frames reference the received chunks. Copy data that is kept for
+    a long time (bytes(frame)), so that the whole chunk can be freed.
+
+    Class variables:
+    - buffer (bytearray) -- (private) start of an incomplete frame
+    - buffered_frame (memoryview) -- (private) frame completed from the
+      buffer, only set during feed
+    """
+
+    def __init__(self):
+        self.__buffer = bytearray()
+        self.__buffered_frame = None
+
+    def __len__(self):
+        """Returns the number of buffered bytes of an incomplete frame"""
+        return len(self.__buffer)
+
+    def feed(self, chunk):
+        """Adds a chunk of received bytes and returns all frames completed by
+        it.
+
+        Arguments:
+        - chunk (byte-object) -- received bytes
+
+        Returns: List of frames (memoryview), can be empty
+
+        Throws a ValueError if a frame has a size smaller than HEADER_SIZE.
+        The stream can not be synchronized again afterwards.
+        """
+        # No copy if chunk is bytes, which StreamReader.read returns
+        data = bytes(chunk)
+        view = memoryview(data)
+        frames = []
+        position = 0
+        end = len(data)
+        if len(self.__buffer) > 0:
+            position = self.__complete_buffered(view)
+            if len(self.__buffer) > 0:
+                # The chunk did not complete the buffered frame
+                return frames
+            frames.append(self.__buffered_frame)
+            self.__buffered_frame = None
+
+        while end - position >= 2:
+            size = (data[position] << 8) | data[position + 1]
+            if size < HEADER_SIZE:
+                raise ValueError(f"Invalid frame size {size}, must be at "
+                                 f"least {HEADER_SIZE}")
+            if position + size > end:
+                break
+            frames.append(view[position:position + size])
+            position += size
+
+        if position < end:
+            self.__buffer += view[position:]
+        return frames
+
+    def __complete_buffered(self, view):
+        """Moves the missing bytes of the buffered frame from the head of
+        view into the buffer. If the frame is complete, it is stored in
+        buffered_frame and the buffer is cleared.
+
+        Returns: number of bytes taken from view
+        """
+        taken = 0
+        if len(self.__buffer) < 2:
+            # The size of the frame is split as well
+            taken = 2 - len(self.__buffer)
+            self.__buffer += view[:taken]
+            if len(self.__buffer) < 2:
+                return taken
+        size = (self.__buffer[0] << 8) | self.__buffer[1]
+        if size < HEADER_SIZE:
+            raise ValueError(f"Invalid frame size {size}, must be at least "
+                             f"{HEADER_SIZE}")
+        missing = size - len(self.__buffer)
+        self.__buffer += view[taken:taken + missing]
+        taken += missing
+        if len(self.__buffer) == size:
+            self.__buffered_frame = memoryview(bytes(self.__buffer))
+            self.__buffer.clear()
+        return min(taken, len(view))
+
+
 def __check_size(buf):
     """Compares the packet size to the size given in the header.
 
@@ -224,21 +331,36 @@ def build_gossip_notification(msg_id, datatype, data):
     - None if an error occurres
     - message as byte-object
     """
+    header = build_gossip_notification_header(msg_id, datatype, len(data))
+    if header is None:
+        return None
+    return header + data
 
+
+def build_gossip_notification_header(msg_id, datatype, data_size):
+    """Builds the header of a gossip notification packet. Sending the header
+    followed by data_size bytes of data results in the same packet as
+    build_gossip_notification, without copying the data.
+
+    Arguments:
+    - msg_id (int) -- message id
+    - datatype (int)
+    - data_size (int) -- length of the data in bytes
+
+    Returns:
+    - None if an error occurres
+    - header as byte-object
+    """
     if msg_id >= 2**16 or msg_id < 0:
         return None
-    elif datatype >= 2**16 or msg_id < 0:
+    elif datatype >= 2**16 or datatype < 0:
         return None
 
-    # data_bytes = bytes(data, 'utf-8')
-    data_bytes = data
-    size = 8 + len(data_bytes)
+    size = 8 + data_size
     if size >= 2**16:
         return None
-    buf = pack(FORMAT_GOSSIP_NOTIFICATION, size, GOSSIP_NOTIFICATION,
-               msg_id, datatype)
-    buf += data_bytes
-    return buf
+    return pack(FORMAT_GOSSIP_NOTIFICATION, size, GOSSIP_NOTIFICATION,
+                msg_id, datatype)
 
 
 #################
@@ -309,7 +431,7 @@ def parse_peer_offer(buf):
         logging.debug("[PARSER] Incorrect packet size in parse_peer_offer")
         return None
 
-    data = buf[4:].decode("utf-8").split(",")
+    data = bytes(buf[4:]).decode("utf-8").split(",")
     return data
 
 
@@ -338,6 +460,60 @@ def parse_peer_info(buf):
     return port
 
 
+def parse_peer_flags(buf):
+    """Reads the capability flags (see PEER_FLAG_LAZY_PUSH) in the reserved
+    field of a PEER INFO or PEER VALIDATION. Assumes that the message type is
+    PEER_INFO or PEER_VALIDATION.
+
+    Arguments:
+    - buf (byte-object) -- packet
+
+    Returns: flags (int) or None if an error occurred
+    """
+    if not __check_size(buf) or len(buf) != 8:
+        logging.debug("[PARSER] Incorrect packet size in parse_peer_flags")
+        return None
+
+    return int.from_bytes(buf[4:6], "big")
+
+
+def parse_peer_ihave(buf):
+    """Parses a PEER IHAVE message to a human-readable tuple
+    Assumes that the message type is PEER_IHAVE.
+
+    Arguments:
+    - buf (byte-object) -- packet
+
+    Returns:
+    - None if an error occurred, otherwise:
+    - tuple (id,  ttl, data_type)
+      as    (int, int, int)
+    """
+    if not __check_size(buf) or len(buf) != 16:
+        logging.debug("[PARSER] Incorrect packet size in parse_peer_ihave")
+        return None
+
+    (_, _, id, ttl, _, data_type) = unpack(FORMAT_PEER_IHAVE, buf)
+    return (id, ttl, data_type)
+
+
+def parse_peer_iwant(buf):
+    """Reads a PEER IWANT by checking the header and returning the requested
+    id. Assumes that the message type is PEER_IWANT.
+
+    Arguments:
+    - buf (byte-object) -- packet
+
+    Returns: id (int) or None if an error occurred
+    """
+    if not __check_size(buf) or len(buf) != 12:
+        logging.debug("[PARSER] Incorrect packet size in parse_peer_iwant")
+        return None
+
+    (_, _, id) = unpack(FORMAT_PEER_IWANT, buf)
+    return id
+
+
 def parse_peer_challenge(buf):
     """Reads a PEER_CHALLENGE by checking the header and returning the
     challenge
@@ -406,10 +582,27 @@ def pack_peer_announce(id, ttl, data_type, data):
     Returns:
       packet as byte-object
     """
-    size = 16 + len(data)
-    buf = pack(FORMAT_PEER_ANNOUNCE, size, PEER_ANNOUNCE,
-               id, ttl, 0, data_type) + data
-    return buf
+    return pack_peer_announce_header(id, ttl, data_type, len(data)) + data
+
+
+def pack_peer_announce_header(id, ttl, data_type, data_size):
+    """Packs the header of a peer announce message. Sending the header
+    followed by data_size bytes of data results in the same packet as
+    pack_peer_announce, without copying the data.
+
+    Arguments:
+    - id (int) -- unique message id for this message, stays the same when
+                  forwarding
+    - ttl (int) -- Time to live. 0 for infinite
+    - data_type (int)
+    - data_size (int) -- length of the data in bytes
+
+    Returns:
+      header as byte-object
+    """
+    size = 16 + data_size
+    return pack(FORMAT_PEER_ANNOUNCE, size, PEER_ANNOUNCE,
+                id, ttl, 0, data_type)
 
 
 def pack_peer_discovery():
@@ -435,16 +628,18 @@ def pack_peer_offer(data):
     return buf + data_bytes
 
 
-def pack_peer_info(p2p_listening_port):
+def pack_peer_info(p2p_listening_port, flags=0):
     """Packs a peer info message as byte-object.
 
     Arguments:
     - p2p_listening_port (int) -- Port this peer accepts new peer connections
       at
+    - flags (int) -- (Optional, default: 0) capability flags, see
+      PEER_FLAG_LAZY_PUSH
 
     Returns: peer info packet as byte-object
     """
-    buf = pack(FORMAT_PEER_INFO, 8, PEER_INFO, 0, p2p_listening_port)
+    buf = pack(FORMAT_PEER_INFO, 8, PEER_INFO, flags, p2p_listening_port)
     return buf
 
 
@@ -470,15 +665,43 @@ def pack_peer_verification(nonce):
     return pack(FORMAT_PEER_VERIFICATION, 12, PEER_VERIFICATION, nonce)
 
 
-def pack_peer_validation(valid):
+def pack_peer_validation(valid, flags=0):
     """Builds a PEER_VALIDATION packet.
 
     Arguments:
     - valid (boolean)
+    - flags (int) -- (Optional, default: 0) capability flags, see
+      PEER_FLAG_LAZY_PUSH
 
     Returns: buffer (byte-object b'...')"""
     if valid:
         bit = 1
     else:
         bit = 0
-    return pack(FORMAT_PEER_VALIDATION, 8, PEER_VALIDATION, 0, bit)
+    return pack(FORMAT_PEER_VALIDATION, 8, PEER_VALIDATION, flags, bit)
+
+
+def pack_peer_ihave(id, ttl, data_type):
+    """Builds a PEER_IHAVE packet, which announces the id of a PEER ANNOUNCE
+    without its data.
+
+    Arguments:
+    - id (int) -- id of the PEER ANNOUNCE
+    - ttl (int) -- ttl of the PEER ANNOUNCE
+    - data_type (int) -- datatype of the PEER ANNOUNCE
+
+    Returns: buffer (byte-object)
+    """
+    return pack(FORMAT_PEER_IHAVE, 16, PEER_IHAVE, id, ttl, 0, data_type)
+
+
+def pack_peer_iwant(id):
+    """Builds a PEER_IWANT packet, which requests a PEER ANNOUNCE announced
+    with a PEER IHAVE.
+
+    Arguments:
+    - id (int) -- id of the PEER ANNOUNCE
+
+    Returns: buffer (byte-object)
+    """
+    return pack(FORMAT_PEER_IWANT, 12, PEER_IWANT, id)
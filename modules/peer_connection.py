@@ -10,9 +10,9 @@ from random import getrandbits
 from modules.util import (
     parse_address,
     is_valid_address,
-    produce_pow_peer_challenge,
     valid_nonce_peer_challenge
 )
+from modules.peer_protocol import open_peer_protocol_connection
 from modules.packet_parser import (
     PEER_ANNOUNCE,
     PEER_CHALLENGE,
@@ -21,25 +21,37 @@ from modules.packet_parser import (
     PEER_INFO,
     PEER_VALIDATION,
     PEER_VERIFICATION,
+    PEER_IHAVE,
+    PEER_IWANT,
+    PEER_FLAG_LAZY_PUSH,
+    READ_SIZE,
+    Frame_decoder,
     check_peer_discovery,
     get_header_type,
-    pack_peer_announce,
+    pack_peer_announce_header,
     pack_peer_challenge,
     pack_peer_discovery,
     pack_peer_offer,
     pack_peer_info,
     pack_peer_validation,
     pack_peer_verification,
+    pack_peer_ihave,
+    pack_peer_iwant,
     parse_peer_announce,
     parse_peer_challenge,
     parse_peer_offer,
     parse_peer_info,
+    parse_peer_flags,
+    parse_peer_ihave,
+    parse_peer_iwant,
     parse_peer_validation,
     parse_peer_verification
 )
 
 
 # Timeout for challenges in seconds. After this timeout, a challenge is invalid
+# and the peer is disconnected. Peers that connect to us must also send their
+# PEER INFO within this timeframe
 CHALLENGE_TIMEOUT = 300
 
 # Timeout for peer offers. After sending a peer discovery, a peer offer is only
@@ -52,8 +64,10 @@ class Peer_connection:
 
     Class variables:
     - gossip (Gossip) -- gossip responsible for this peer
-    - reader (StreamReader) -- (private) asyncio StreamReader of connected peer
-    - writer (StreamWriter) -- (private) asyncio StreamWriter of connected peer
+    - reader (StreamReader) -- (private) asyncio StreamReader of connected
+      peer. None if the connection uses a Peer_protocol
+    - writer (StreamWriter / Peer_protocol) -- (private) asyncio StreamWriter
+      or Peer_protocol of connected peer
     - peer_p2p_listening_port (int) -- p2p_listening_port of connected peer
     - peer_challenge (Tuple: int, int) -- challenge with timeout send to
       connected node. None if none was send.
@@ -68,14 +82,35 @@ class Peer_connection:
       when last peer discovery was send. None if none was send or a peer offer
       was already received. Used to avoid receiving more offers than we request
       by sending peer discoveries
+    - pow_task (Task) -- (private) task solving a received peer challenge.
+      None if no challenge is beeing solved
+    - peer_offer_deadline (Timer) -- (private) resets
+      last_peer_discovery_send after PEER_OFFER_TIMEOUT. None if no peer
+      discovery is pending
+    - peer_offer_expired (boolean) -- (private) True if the last peer
+      discovery timed out. A late peer offer is ignored instead of closing
+      the connection
+    - handshake_deadline (Timer) -- (private) closes the connection if the
+      connected node is not validated in time. None if no deadline is set
+    - send_queue (Send_queue) -- (private) outgoing messages, written in
+      batches without blocking the sender. Control messages (e.g. PEER
+      CHALLENGE) are sent before queued PEER ANNOUNCEs, PEER ANNOUNCEs are
+      shared fairly between datatypes
+    - connect_rtt (float) -- time in seconds it took to open the connection.
+      None if the peer connected to us
+    - lazy_push (boolean) -- whether both nodes use lazy push and accept PEER
+      IHAVE and PEER IWANT (see PEER_FLAG_LAZY_PUSH). Set from the flags of
+      the received PEER INFO or PEER VALIDATION
     """
 
     def __init__(self, reader, writer, gossip, peer_p2p_listening_port=None,
-                 validated_us=False, validated_them=False):
+                 validated_us=False, validated_them=False, connect_rtt=None):
         """
         Arguments:
-        - reader (StreamReader) -- asyncio StreamReader of connected peer
-        - writer (StreamWriter) -- asyncio StreamWriter of connected peer
+        - reader (StreamReader) -- asyncio StreamReader of connected peer.
+          None if writer is a Peer_protocol
+        - writer (StreamWriter / Peer_protocol) -- asyncio StreamWriter of
+          connected peer or Peer_protocol of the connection
         - gossip (Gossip) -- gossip responsible for this peer
         - peer_p2p_listening_port (int) -- (Optional, default: None) Port the
           connected peer accepts new peer connections at
@@ -86,15 +121,30 @@ class Peer_connection:
           trustworthy. A node can prove itself trustworthy by getting validated
           by us (push peers), see Documentation. Nodes we connect to should be
           set to be trustworthy.
+        - connect_rtt (float) -- (Optional, default: None) time in seconds it
+          took to open the connection, if we connected to the peer
         """
         self.gossip = gossip
         self.__reader = reader
         self.__writer = writer
         self.peer_p2p_listening_port = peer_p2p_listening_port
+        self.connect_rtt = connect_rtt
+        self.lazy_push = False
         self.__peer_challenge = None
         self.__validated_them = validated_them
         self.__validated_us = validated_us
         self.__last_peer_discovery_send = None
+        self.__peer_offer_deadline = None
+        self.__peer_offer_expired = False
+        self.__pow_task = None
+        self.__handshake_deadline = None
+        self.__send_queue = gossip.create_send_queue(
+            writer, self, lambda: self.gossip.close_peer(self))
+
+        # Nodes that connected to us have to send a PEER INFO and solve our
+        # challenge in time
+        if not self.__validated_them:
+            self.__set_handshake_deadline(CHALLENGE_TIMEOUT)
 
     def __str__(self):
         """Called by str(Peer_connection). Uses the debug address"""
@@ -108,27 +158,59 @@ class Peer_connection:
 
     async def run(self):
         """Waits for incoming messages and handles them. Runs until the
-        connection is closed"""
+        connection is closed.
+        If the connection uses a Peer_protocol (no reader), the protocol
+        handles incoming messages and this function returns immediately."""
+        if self.__reader is None:
+            self.__writer.attach(self)
+            return
+        decoder = Frame_decoder()
         while True:
             if self.__writer.is_closing():
                 logging.debug(f"[PEER]: writer is_closing {self}")
                 break
             try:
-                if self.__writer.is_closing():
-                    break
-                size_bytes = await self.__reader.read(2)
-                size = int.from_bytes(size_bytes, "big")
-                buf = size_bytes + await self.__reader.read(size-2)
+                chunk = await self.__reader.read(READ_SIZE)
             except ConnectionError:
                 break
-            await self.__handle_incoming_message(buf)
+            if len(chunk) == 0:
+                logging.debug(f"[PEER]: connection closed by {self}")
+                break
+            try:
+                frames = decoder.feed(chunk)
+            except ValueError as e:
+                logging.info(f"[PEER] Disconnecting {self}: {e}")
+                break
+            # A single read can contain many messages
+            for frame in frames:
+                if self.__writer.is_closing():
+                    break
+                await self.__handle_incoming_message(frame)
         await self.gossip.close_peer(self)
 
+    async def handle_message(self, buf):
+        """Handles a single received message. Called by Peer_protocol, stream
+        based connections handle their messages in run.
+
+        Arguments:
+        - buf (byte-object) -- received message
+        """
+        await self.__handle_incoming_message(buf)
+
     async def close(self):
         """Closes the connection to the peer.
         Gossip.close_peer() should be called preferably, since it also removes
         the peer from the peer list."""
         logging.info(f"[PEER] Connection to {self} closed")
+        if self.__pow_task is not None:
+            self.__pow_task.cancel()
+            self.__pow_task = None
+        self.__cancel_handshake_deadline()
+        if self.__peer_offer_deadline is not None:
+            self.__peer_offer_deadline.cancel()
+            self.__peer_offer_deadline = None
+        # Write queued messages, the transport sends them before closing
+        self.__send_queue.close()
         try:
             self.__writer.close()
             await self.__writer.wait_closed()
@@ -136,6 +218,11 @@ class Peer_connection:
         except Exception:
             return
 
+    def get_send_statistics(self):
+        """Returns the statistics of the send queue, including queue depth
+        and bytes in flight. See Send_queue.get_statistics"""
+        return self.__send_queue.get_statistics()
+
     def get_peer_challenge(self):
         """Returns the peer challenge send to the connected peer together with
         its timeout, or None if none was send"""
@@ -216,44 +303,74 @@ class Peer_connection:
         validated by both sides. Use is_fully_validated to check."""
         message = pack_peer_discovery()
         self.__last_peer_discovery_send = time.time()
+        self.__peer_offer_expired = False
+        if self.__peer_offer_deadline is not None:
+            self.__peer_offer_deadline.cancel()
+        self.__peer_offer_deadline = self.gossip.timer_wheel.schedule(
+            PEER_OFFER_TIMEOUT, self.__on_peer_offer_deadline)
         logging.info(f"[PEER] Sending PEER DISCOVERY to: {self}")
-        await self.__send(message)
+        self.__send(message)
 
-    async def send_peer_announce(self, id, ttl, data_type, data):
+    async def send_peer_announce(self, id, ttl, data_type, data, header=None):
         """Sends a peer announce message. For documentation of parameters, see
         the project documentation.
         Assumes that the connection is validated by both sides. Use
-        is_fully_validated to check."""
-        message = pack_peer_announce(id, ttl, data_type, data)
+        is_fully_validated to check.
+
+        The header can be packed once with pack_peer_announce_header and
+        passed to all peers. Header and data are sent without copying data.
+
+        Returns: True if the announce was queued, False if it was dropped,
+        e.g. because the peer is congested (see Send_queue)
+        """
+        if header is None:
+            header = pack_peer_announce_header(id, ttl, data_type, len(data))
         logging.info(f"[PEER] Sending PEER ANNOUNCE with id: {id}, ttl: {ttl} "
                      f" and data type: {data_type}, to: {self}")
-        await self.__send(message)
+        return self.__send_queue.put(header, data, datatype=data_type)
+
+    async def send_peer_ihave(self, id, ttl, data_type, message=None):
+        """Sends a PEER IHAVE, announcing a PEER ANNOUNCE without its data.
+        Assumes that the connection is validated by both sides and that the
+        peer uses lazy push.
+
+        The message can be packed once with pack_peer_ihave and passed to all
+        peers.
+
+        Returns: True if the message was queued, False if it was dropped,
+        e.g. because the peer is congested (see Send_queue)
+        """
+        if message is None:
+            message = pack_peer_ihave(id, ttl, data_type)
+        logging.info(f"[PEER] Sending PEER IHAVE with id: {id} to: {self}")
+        return self.__send_queue.put(message, datatype=data_type)
+
+    async def send_peer_iwant(self, id):
+        """Sends a PEER IWANT, requesting the PEER ANNOUNCE with the given id.
+        Assumes that the connection is validated by both sides.
+        """
+        logging.info(f"[PEER] Sending PEER IWANT with id: {id} to: {self}")
+        self.__send(pack_peer_iwant(id))
 
     async def send_peer_challenge(self):
         """Sends a peer challenge message and saves the challenge with a
         timeout in __peer_challenge, if no challenge was send before.
-        If this is called an a challenge was already send, the no new challenge
-        will be send, but the peer will be closed if the challenge timeout ran
-        out.
+        The peer will be closed if it does not answer with a valid verification
+        before the challenge timeout runs out.
 
         Should only be called if we where not the initiator of the connection.
         See Project Documentation - Push Gossip
         """
         # Check if a peer challenge was already send
         if self.__peer_challenge != None:
-            # Disconnect it the challenge expired
-            if self.__peer_challenge[1] < time.time():
-                logging.warning(
-                    f"[PEER] PEER CHALLENGE timeout for {self} expired "
-                    f"{time.time() - self.__peer_challenge[1]}s ago")
-                await self.gossip.close_peer(self)
             return
 
         challenge = getrandbits(64)
         self.__peer_challenge = (challenge, time.time() + CHALLENGE_TIMEOUT)
+        self.__set_handshake_deadline(CHALLENGE_TIMEOUT)
         message = pack_peer_challenge(challenge)
         logging.info(f"[PEER] Sending PEER CHALLENGE to: {self}")
-        await self.__send(message)
+        self.__send(message)
 
     async def __send_peer_validation(self, valid):
         """Sends a peer validation message, updates validated_them and tells
@@ -263,10 +380,13 @@ class Peer_connection:
         - valid (bool) -- Valid bit - See project documentation
         """
         self.__validated_them = valid
-        message = pack_peer_validation(valid)
+        if valid:
+            self.__cancel_handshake_deadline()
+        message = pack_peer_validation(valid,
+                                       flags=self.gossip.get_peer_flags())
         logging.info(f"[PEER] Sending PEER VALIDATION with valid: {valid}, to:"
                      f" {self}")
-        await self.__send(message)
+        self.__send(message)
         # Tell gossip that this peer is now validated, if valid
         if valid:
             await self.gossip.validate_peer(self)
@@ -279,7 +399,51 @@ class Peer_connection:
         """
         message = pack_peer_verification(nonce)
         logging.info(f"[PEER] Sending PEER VERIFICATION to {self}")
-        await self.__send(message)
+        self.__send(message)
+
+    def __set_handshake_deadline(self, timeout):
+        """Closes the connection in timeout seconds if the connected node is
+        not validated until then. Replaces a previous deadline.
+
+        Arguments:
+        - timeout (float) -- seconds until the deadline
+        """
+        self.__cancel_handshake_deadline()
+        self.__handshake_deadline = self.gossip.timer_wheel.schedule(
+            timeout, self.__on_handshake_deadline)
+
+    def __cancel_handshake_deadline(self):
+        """Cancels the handshake deadline, if one is set"""
+        if self.__handshake_deadline is not None:
+            self.__handshake_deadline.cancel()
+            self.__handshake_deadline = None
+
+    def __on_handshake_deadline(self):
+        """Gets called when the handshake deadline ran out. Closes the
+        connection if the connected node is still not validated.
+
+        Returns: None or the coroutine closing the connection, which is
+        started by the timer wheel
+        """
+        self.__handshake_deadline = None
+        if self.__validated_them:
+            return
+        if self.__peer_challenge == None:
+            logging.warning(f"[PEER] No PEER INFO received from {self} within"
+                            f" {CHALLENGE_TIMEOUT}s")
+        else:
+            logging.warning(
+                f"[PEER] PEER CHALLENGE timeout for {self} expired")
+        return self.gossip.close_peer(self)
+
+    def __on_peer_offer_deadline(self):
+        """Gets called when no peer offer was received within
+        PEER_OFFER_TIMEOUT after sending a peer discovery."""
+        logging.debug(f"[PEER] No PEER OFFER received from {self} within "
+                      f"{PEER_OFFER_TIMEOUT}s")
+        self.__peer_offer_deadline = None
+        self.__last_peer_discovery_send = None
+        self.__peer_offer_expired = True
 
     async def __send_peer_offer(self):
         """Sends a peer offer. Should only be called if the connection is
@@ -299,20 +463,19 @@ class Peer_connection:
         message = pack_peer_offer(addresses)
         logging.info(
             f"[PEER] Sending PEER OFFER to {self} with peers: {addresses}")
-        await self.__send(message)
+        self.__send(message)
 
-    async def __send(self, message):
-        """Sends a message to the connected peer. Should be awaited
+    def __send(self, *buffers):
+        """Enqueues a control message for the connected peer. Control messages
+        are sent before all queued PEER ANNOUNCEs, so handshakes do not time
+        out under load. Does not wait for the network, the send queue writes
+        queued messages in batches.
 
         Arguments:
-        - message (byte-object) -- message that should be send
+        - buffers (byte-objects) -- message that should be send, can be split
+          into multiple buffers (e.g. header and data) to avoid copying them
         """
-        try:
-            self.__writer.write(message)
-            await self.__writer.drain()
-        except ConnectionResetError:
-            # Will already close if run was called
-            return
+        self.__send_queue.put(*buffers)
 
     async def __handle_incoming_message(self, buf):
         """Checks the type of an incoming message in byte format and calls the
@@ -353,6 +516,12 @@ class Peer_connection:
         elif type == PEER_VALIDATION:
             logging.info(f"[PEER] Received PEER_VALIDATION from {self}")
             await self.__handle_peer_validation(buf)
+        elif type == PEER_IHAVE:
+            logging.info(f"[PEER] Received PEER_IHAVE from {self}")
+            await self.__handle_peer_ihave(buf)
+        elif type == PEER_IWANT:
+            logging.info(f"[PEER] Received PEER_IWANT from {self}")
+            await self.__handle_peer_iwant(buf)
         else:
             logging.info(f"[PEER] Received message with unknown type {type} "
                          f"from {self}")
@@ -397,6 +566,52 @@ class Peer_connection:
         (id, ttl, data_type, data) = msg
         await self.gossip.handle_peer_announce(id, ttl, data_type, data, self)
 
+    async def __handle_peer_ihave(self, buf):
+        """Handles a peer ihave message and forwards it to gossip. Assumes
+        that the connection is validated by both sides.
+
+        Arguments:
+        - buf (byte-object) -- received message in byte format. The type must
+          be PEER_IHAVE
+        """
+        msg = parse_peer_ihave(buf)
+        if msg == None:
+            logging.info(f"[PEER] Closing {self} because an malformed PEER "
+                         "IHAVE message was received")
+            await self.gossip.close_peer(self)
+            return
+
+        (id, ttl, data_type) = msg
+        await self.gossip.handle_peer_ihave(id, ttl, data_type, self)
+
+    async def __handle_peer_iwant(self, buf):
+        """Handles a peer iwant message and forwards it to gossip. Assumes
+        that the connection is validated by both sides.
+
+        Arguments:
+        - buf (byte-object) -- received message in byte format. The type must
+          be PEER_IWANT
+        """
+        id = parse_peer_iwant(buf)
+        if id == None:
+            logging.info(f"[PEER] Closing {self} because an malformed PEER "
+                         "IWANT message was received")
+            await self.gossip.close_peer(self)
+            return
+
+        await self.gossip.handle_peer_iwant(id, self)
+
+    def __update_lazy_push(self, buf):
+        """Enables lazy push if the flags of a received PEER INFO or PEER
+        VALIDATION and our own flags contain PEER_FLAG_LAZY_PUSH. Disables it
+        if the flags can not be parsed"""
+        flags = parse_peer_flags(buf)
+        if flags is None:
+            self.lazy_push = False
+            return
+        flags &= self.gossip.get_peer_flags()
+        self.lazy_push = bool(flags & PEER_FLAG_LAZY_PUSH)
+
     async def __handle_peer_discovery(self, buf):
         """Handles a peer discovery message and calls __send_peer_offer() to
         send a response. Assumes that the connection is validated by both sides
@@ -444,6 +659,13 @@ class Peer_connection:
                 await self.gossip.close_peer(self)
                 return
 
+        # Ignore offer if it was not send within a specific timeframe
+        if self.__peer_offer_expired:
+            logging.debug(f"[PEER] ignoring peer offer from {self} because "
+                          "timeout ran out.")
+            self.__peer_offer_expired = False
+            return
+
         # Close the peer if we did not send a peer discovery
         # / not request a peer offer
         if self.__last_peer_discovery_send == None:
@@ -452,13 +674,6 @@ class Peer_connection:
             await self.gossip.close_peer(self)
             return
 
-        # Ignore offer if it was not send within a specific timeframe
-        if self.__last_peer_discovery_send + PEER_OFFER_TIMEOUT < time.time():
-            logging.debug(f"[PEER] ignoring peer offer from {self} because "
-                          "timeout ran out.")
-            self.__last_peer_discovery_send = None
-            return
-
         # check if the offer contains our own address
         p2p_address = self.gossip.config.p2p_address
         if p2p_address in data:
@@ -468,6 +683,8 @@ class Peer_connection:
 
         # save data / pass it to gossip
         self.__last_peer_discovery_send = None
+        self.__peer_offer_deadline.cancel()
+        self.__peer_offer_deadline = None
         await self.gossip.handle_peer_offer(data)
 
     async def __handle_peer_challenge(self, buf):
@@ -483,8 +700,25 @@ class Peer_connection:
                          "CHALLENGE message was received")
             await self.gossip.close_peer(self)
             return
-        # solve the challenge
-        nonce = produce_pow_peer_challenge(challenge)
+
+        # solve the challenge in the background. A new challenge replaces the
+        # old one
+        if self.__pow_task is not None:
+            self.__pow_task.cancel()
+        self.__pow_task = asyncio.create_task(
+            self.__solve_peer_challenge(challenge))
+
+    async def __solve_peer_challenge(self, challenge):
+        """Solves the given challenge using the pow solver of gossip and sends
+        a peer verification with the found nonce. Gets cancelled if the
+        connection is closed.
+
+        Arguments:
+        - challenge (int) -- challenge received in peer challenge
+        """
+        (nonce, _, _) = await self.gossip.pow_solver.solve(
+            challenge, CHALLENGE_TIMEOUT)
+        self.__pow_task = None
         if nonce == None:
             return
         await self.__send_peer_verification(nonce)
@@ -538,10 +772,17 @@ class Peer_connection:
         assert type(valid) is bool
         logging.info(f"[PEER] Received validation with valid = {valid}")
         self.__validated_us = valid
+        self.__update_lazy_push(buf)
         if not valid:
             logging.info(f"[PEER] Closing {self} because PEER VALIDATION "
                          "contained invalid")
             await self.gossip.close_peer(self)
+            return
+        self.gossip.update_peer(self)
+        if self.connect_rtt is not None:
+            # We connected to this peer, remember it for the next start
+            self.gossip.address_book.record_success(
+                self.get_peer_p2p_listening_address(), self.connect_rtt)
 
     async def __handle_peer_info(self, buf):
         """Handles a peer info message. Saves the received p2p_listening_port.
@@ -566,6 +807,13 @@ class Peer_connection:
         # save new port
         logging.debug(f"[PEER] Saving p2p_listening_port {port}")
         self.peer_p2p_listening_port = port
+        self.__update_lazy_push(buf)
+        self.gossip.update_peer(self)
+
+        # Start the handshake right away, if the connected node still needs to
+        # be validated. send_peer_challenge only sends one challenge
+        if not self.__validated_them:
+            await self.send_peer_challenge()
 
 
 async def peer_connection_factory(addresses, gossip, p2p_listening_port):
@@ -599,7 +847,9 @@ async def peer_connection_factory(addresses, gossip, p2p_listening_port):
 
 async def __connect_peer(address, gossip, p2p_listening_port):
     """Opens a connection to the given ip & port and creates a Peer_connection
-    and send a peer info message.
+    and send a peer info message. Connecting may take at most
+    config.connect_timeout seconds. Failures and successes are recorded in
+    gossip.dial_backoff.
 
     Arguments:
     - ip (str) -- target ip address
@@ -613,17 +863,37 @@ async def __connect_peer(address, gossip, p2p_listening_port):
     """
     (ip, port) = parse_address(address)
     logging.info("[PEER] Connecting to ip: {}, port: {}".format(ip, port))
+    if gossip.config.peer_transport == "protocol":
+        open_connection = open_peer_protocol_connection
+    else:
+        open_connection = asyncio.open_connection
+    writer = None
     try:
-        reader, writer = await asyncio.open_connection(ip, port)
-    except ConnectionRefusedError:
-        logging.info(f"[PEER] Failed to connect to ip: {ip}, port: {port}")
+        start = time.monotonic()
+        reader, writer = await asyncio.wait_for(
+            open_connection(ip, port), gossip.config.connect_timeout)
+        connect_rtt = time.monotonic() - start
+        await __send_peer_info(writer, p2p_listening_port,
+                               gossip.get_peer_flags())
+    except (OSError, asyncio.TimeoutError) as e:
+        if isinstance(e, asyncio.TimeoutError):
+            gossip.metrics.increment("peer_connect_timeouts")
+        else:
+            gossip.metrics.increment("peer_connect_failures")
+        delay = gossip.dial_backoff.record_failure(address)
+        gossip.address_book.record_failure(address)
+        logging.info(f"[PEER] Failed to connect to ip: {ip}, port: {port} "
+                     f"({e!r}), retrying in {delay:.0f}s at the earliest")
+        if writer is not None:
+            writer.close()
         return None
 
-    await __send_peer_info(writer, p2p_listening_port)
-    return Peer_connection(reader, writer, gossip, port, validated_them=True)
+    gossip.dial_backoff.record_success(address)
+    return Peer_connection(reader, writer, gossip, port, validated_them=True,
+                           connect_rtt=connect_rtt)
 
 
-async def __send_peer_info(writer, p2p_listening_port):
+async def __send_peer_info(writer, p2p_listening_port, flags):
     """Sends a PEER INFO message with p2p_listening_port to the given
     StreamWriter
 
@@ -631,8 +901,9 @@ async def __send_peer_info(writer, p2p_listening_port):
     - writer (StreamWriter) -- StreamWriter connected to a new peer
     - p2p_listening_port (int) -- Port this peer accepts new peer connections
       at
+    - flags (int) -- capability flags, see Gossip.get_peer_flags
     """
-    info_packet = pack_peer_info(p2p_listening_port)
+    info_packet = pack_peer_info(p2p_listening_port, flags)
     logging.info("[PEER] Sending PEER INFO with p2p port {} to {}".format(
         p2p_listening_port, writer.get_extra_info("peername")))
     writer.write(info_packet)
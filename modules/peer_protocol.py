@@ -0,0 +1,232 @@
+"""
+This module provides the Peer_protocol class, an asyncio.Protocol based
+transport for Peer_connections. It is used instead of StreamReader and
+StreamWriter if peer_transport is set to "protocol" in the config.
+
+Received bytes are split into frames in data_received and handed to the
+Peer_connection directly, so idle connections do not need a task. The
+protocol also implements the parts of the StreamWriter interface used by
+Peer_connection (write, writelines, drain, close, wait_closed, is_closing and
+get_extra_info), so it can be passed as writer.
+
+Use peer_protocol_server and open_peer_protocol_connection to create
+connections.
+"""
+import asyncio
+import logging
+from collections import deque
+
+from modules.packet_parser import Frame_decoder
+
+# Reading from the socket is paused while more frames than this wait for the
+# Peer_connection and resumed once the half of them is handled
+MAX_PENDING_FRAMES = 1024
+
+# Transports available for peer connections, see the peer_transport config
+PEER_TRANSPORTS = ["stream", "protocol"]
+
+
+class Peer_protocol(asyncio.Protocol):
+    """The Peer_protocol receives frames for a single Peer_connection and
+    provides the writer interface for it.
+
+    Frames are queued until they are handled by the Peer_connection. A dispatch
+    task only exists while frames are queued, messages of one connection are
+    handled in order.
+
+    Class variables:
+    - transport (Transport) -- (private) transport of the connection. None
+      until connection_made was called
+    - peer (Peer_connection) -- (private) receiver of all frames. None until
+      attach was called, frames received before are queued
+    - decoder (Frame_decoder) -- (private) splits received bytes into frames
+    - pending (memoryview deque) -- (private) frames waiting to be handled
+    - dispatch_task (Task) -- (private) task handling pending frames. None if
+      no frames are pending
+    - reading_paused (boolean) -- (private) True if reading was paused because
+      too many frames are pending
+    - write_paused (boolean) -- (private) True if the transport asked us to
+      stop writing (write buffer above the high-water mark)
+    - drain_waiters (Future deque) -- (private) futures of drain calls waiting
+      for resume_writing
+    - closed (Future) -- (private) done when the connection is lost
+    - on_connection (function) -- (private) coroutine function called with
+      (None, self) when the connection is made. Used by peer_protocol_server
+    """
+
+    def __init__(self, on_connection=None):
+        """
+        Arguments:
+        - on_connection (function) -- (Optional, default: None) coroutine
+          function called with (None, self) when the connection is made, like
+          the callback of asyncio.start_server
+        """
+        self.__transport = None
+        self.__peer = None
+        self.__decoder = Frame_decoder()
+        self.__pending = deque()
+        self.__dispatch_task = None
+        self.__reading_paused = False
+        self.__write_paused = False
+        self.__drain_waiters = deque()
+        self.__closed = asyncio.get_running_loop().create_future()
+        self.__on_connection = on_connection
+
+    # Protocol callbacks
+
+    def connection_made(self, transport):
+        self.__transport = transport
+        if self.__on_connection is not None:
+            asyncio.create_task(self.__on_connection(None, self))
+
+    def data_received(self, data):
+        try:
+            frames = self.__decoder.feed(data)
+        except ValueError as e:
+            logging.info("[PEER] Disconnecting "
+                         f"{self.get_extra_info('peername')}: {e}")
+            self.__transport.close()
+            return
+        if len(frames) == 0:
+            return
+        self.__pending.extend(frames)
+        if (len(self.__pending) > MAX_PENDING_FRAMES
+                and not self.__reading_paused):
+            self.__reading_paused = True
+            self.__transport.pause_reading()
+        self.__start_dispatch()
+
+    def connection_lost(self, exc):
+        if not self.__closed.done():
+            self.__closed.set_result(None)
+        # Wake up all writers, their data will not be sent
+        while len(self.__drain_waiters) > 0:
+            waiter = self.__drain_waiters.popleft()
+            if not waiter.done():
+                waiter.set_exception(ConnectionResetError("Connection lost"))
+        self.__pending.clear()
+        if self.__peer is not None:
+            asyncio.create_task(self.__peer.gossip.close_peer(self.__peer))
+
+    def pause_writing(self):
+        self.__write_paused = True
+
+    def resume_writing(self):
+        self.__write_paused = False
+        while len(self.__drain_waiters) > 0:
+            waiter = self.__drain_waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+
+    # Dispatching frames to the Peer_connection
+
+    def attach(self, peer):
+        """Sets the Peer_connection that handles all received frames. Frames
+        received before are handled now.
+
+        Arguments:
+        - peer (Peer_connection) -- connection using this protocol
+        """
+        self.__peer = peer
+        if self.__closed.done():
+            asyncio.create_task(peer.gossip.close_peer(peer))
+            return
+        self.__start_dispatch()
+
+    def __start_dispatch(self):
+        """Starts the dispatch task if frames are pending and a Peer_connection
+        is attached"""
+        if (self.__dispatch_task is None and self.__peer is not None
+                and len(self.__pending) > 0):
+            self.__dispatch_task = asyncio.create_task(self.__dispatch())
+
+    async def __dispatch(self):
+        """Hands all pending frames to the Peer_connection, in order"""
+        pending = self.__pending
+        handle_message = self.__peer.handle_message
+        is_closing = self.__transport.is_closing
+        try:
+            while len(pending) > 0 and not is_closing():
+                await handle_message(pending.popleft())
+                if (self.__reading_paused
+                        and len(pending) <= MAX_PENDING_FRAMES // 2):
+                    self.__reading_paused = False
+                    self.__transport.resume_reading()
+            pending.clear()
+        finally:
+            self.__dispatch_task = None
+
+    # StreamWriter interface
+
+    @property
+    def transport(self):
+        return self.__transport
+
+    def write(self, data):
+        self.__transport.write(data)
+
+    def writelines(self, data):
+        self.__transport.writelines(data)
+
+    async def drain(self):
+        """Waits until the write buffer of the transport is below its
+        high-water mark. Throws a ConnectionResetError if the connection is
+        lost."""
+        if self.__closed.done():
+            raise ConnectionResetError("Connection lost")
+        if not self.__write_paused:
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self.__drain_waiters.append(waiter)
+        await waiter
+
+    def close(self):
+        if self.__transport is not None:
+            self.__transport.close()
+
+    async def wait_closed(self):
+        await self.__closed
+
+    def is_closing(self):
+        return self.__transport is None or self.__transport.is_closing()
+
+    def get_extra_info(self, name, default=None):
+        if self.__transport is None:
+            return default
+        return self.__transport.get_extra_info(name, default)
+
+
+async def peer_protocol_server(host, port, on_connection_fnc):
+    """Opens a socket server for peers using Peer_protocol and calls
+    on_connection_fnc when a new peer connects. Like connection_handler, this
+    function keeps waiting for new peers and does not return.
+
+    Arguments:
+       host -- host address for server
+       port -- port for server
+       on_connection_fnc -- coroutine function that gets called with
+                            (None, Peer_protocol) when a peer is connected.
+    """
+    logging.info(f"Opening peer protocol server at host: {host}, port: "
+                 f"{port}")
+    loop = asyncio.get_running_loop()
+    server = await loop.create_server(
+        lambda: Peer_protocol(on_connection_fnc), host, port)
+
+    async with server:
+        await server.serve_forever()
+
+
+async def open_peer_protocol_connection(host, port):
+    """Connects to a peer using Peer_protocol. Counterpart of
+    asyncio.open_connection.
+
+    Arguments:
+       host -- host address of the peer
+       port -- port of the peer
+
+    Returns: tuple (None, Peer_protocol), the protocol is used as writer
+    """
+    loop = asyncio.get_running_loop()
+    (_, protocol) = await loop.create_connection(Peer_protocol, host, port)
+    return (None, protocol)
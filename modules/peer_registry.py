@@ -0,0 +1,175 @@
+"""
+This module provides the Peer_registry class, which keeps track of all peer
+connections of a gossip instance and their roles.
+"""
+from collections import namedtuple
+
+# Roles of a peer connection:
+# - unverified: connected to us, not validated yet
+# - push: connected to us and validated by us
+# - pull: we connected to it
+UNVERIFIED = "unverified"
+PUSH = "push"
+PULL = "pull"
+PEER_ROLES = [UNVERIFIED, PUSH, PULL]
+
+# Immutable view of the validated peers, see Peer_registry.get_snapshot
+# - peers (Peer_connection Tuple) -- fully validated push and pull peers
+# - version (int) -- incremented whenever the validated peers change
+Peer_snapshot = namedtuple("Peer_snapshot", ["peers", "version"])
+
+
+class Peer_registry:
+    """The Peer_registry stores every Peer_connection with its role. Peers of
+    a role are kept in the order they were added, so the oldest peer of a
+    role can be found in O(1). The registry also indexes peers by p2p
+    listening address and keeps the set of fully validated push and pull
+    peers (the receivers of PEER ANNOUNCEs) up to date. All operations are
+    O(1), except the ones returning lists.
+
+    Push peers are always considered validated, pull peers once
+    is_fully_validated returns True. update has to be called when the p2p
+    listening address or the validation of a peer changes.
+
+    Whenever the validated peers change, a new Peer_snapshot is published.
+    Readers (e.g. the PEER ANNOUNCE fan-out) use the snapshot as is, without
+    copying it. A snapshot never changes after it was published.
+
+    The registry does not await, so it does not require a lock.
+
+    Class variables:
+    - roles (dictionary: str - dictionary) -- (private) peers of each role,
+      oldest first. Format: role : {Peer_connection: None}
+    - role_of (dictionary: Peer_connection - str) -- (private) role of each
+      peer
+    - address_of (dictionary: Peer_connection - str) -- (private) indexed p2p
+      listening address of each peer, if known
+    - by_address (dictionary: str - Peer_connection) -- (private) peers by p2p
+      listening address. If multiple connections have the same address, the
+      latest one is indexed
+    - validated (dictionary: Peer_connection - None) -- (private) fully
+      validated push and pull peers, in the order they were validated
+    - snapshot (Peer_snapshot) -- (private) latest snapshot of the validated
+      peers
+    """
+
+    def __init__(self):
+        self.__roles = {role: {} for role in PEER_ROLES}
+        self.__role_of = {}
+        self.__address_of = {}
+        self.__by_address = {}
+        self.__validated = {}
+        self.__snapshot = Peer_snapshot((), 0)
+
+    def __len__(self):
+        """Returns the number of peers"""
+        return len(self.__role_of)
+
+    def __contains__(self, peer):
+        return peer in self.__role_of
+
+    def add(self, peer, role):
+        """Adds a peer or changes its role. A peer that changes its role is
+        the newest peer of its new role.
+
+        Arguments:
+        - peer (Peer_connection) -- peer to add
+        - role (str) -- see PEER_ROLES
+        """
+        old_role = self.__role_of.get(peer)
+        if old_role is not None:
+            del self.__roles[old_role][peer]
+        self.__roles[role][peer] = None
+        self.__role_of[peer] = role
+        self.update(peer)
+
+    def remove(self, peer):
+        """Removes a peer.
+
+        Arguments:
+        - peer (Peer_connection) -- peer to remove
+
+        Returns: the role of the removed peer or None if it was not found
+        """
+        role = self.__role_of.pop(peer, None)
+        if role is None:
+            return None
+        del self.__roles[role][peer]
+        self.__set_validated(peer, False)
+        address = self.__address_of.pop(peer, None)
+        if address is not None and self.__by_address.get(address) is peer:
+            del self.__by_address[address]
+        return role
+
+    def update(self, peer):
+        """Updates the address index and the validated set of a peer. Must be
+        called after its p2p listening address or validation changed.
+
+        Arguments:
+        - peer (Peer_connection) -- peer that changed
+        """
+        role = self.__role_of.get(peer)
+        if role is None:
+            return
+        address = peer.get_peer_p2p_listening_address()
+        old_address = self.__address_of.get(peer)
+        if address != old_address:
+            if (old_address is not None
+                    and self.__by_address.get(old_address) is peer):
+                del self.__by_address[old_address]
+            if address:
+                self.__address_of[peer] = address
+                self.__by_address[address] = peer
+            else:
+                self.__address_of.pop(peer, None)
+
+        self.__set_validated(
+            peer, role == PUSH or (role == PULL and peer.is_fully_validated()))
+
+    def __set_validated(self, peer, validated):
+        """Adds or removes a peer from the validated peers and publishes a new
+        snapshot if they changed"""
+        if validated == (peer in self.__validated):
+            return
+        if validated:
+            self.__validated[peer] = None
+        else:
+            del self.__validated[peer]
+        self.__snapshot = Peer_snapshot(tuple(self.__validated),
+                                        self.__snapshot.version + 1)
+
+    def get_role(self, peer):
+        """Returns the role of peer or None if it is unknown"""
+        return self.__role_of.get(peer)
+
+    def count(self, role):
+        """Returns the number of peers with the given role"""
+        return len(self.__roles[role])
+
+    def get_oldest(self, role):
+        """Returns the peer of the given role that was added first, None if
+        there are no peers of the role"""
+        return next(iter(self.__roles[role]), None)
+
+    def get_peers(self, role):
+        """Returns a list of all peers with the given role, oldest first"""
+        return list(self.__roles[role])
+
+    def get_snapshot(self):
+        """Returns the Peer_snapshot of all fully validated push and pull
+        peers. The snapshot is immutable and stays valid after the peers
+        changed."""
+        return self.__snapshot
+
+    def find(self, address):
+        """Returns the peer with the given p2p listening address or None
+
+        Arguments:
+        - address (str) -- Format: host_ip:port
+        """
+        return self.__by_address.get(address)
+
+    def get_addresses(self):
+        """Returns the p2p listening addresses of all peers with a known
+        address"""
+        return list(self.__by_address)
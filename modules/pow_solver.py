@@ -0,0 +1,207 @@
+"""
+This module provides the Pow_solver class, which solves peer challenges in a
+pool of worker processes, so that the event loop is not blocked while
+searching for a nonce.
+"""
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from modules.util import POW_DIFFICULTY, search_nonce_range
+
+
+# Number of nonces checked by a single job in a worker process. A solve is
+# split into jobs of this size, so a cancelled solve keeps a worker busy for
+# at most one job.
+NONCES_PER_JOB = 2**18
+
+
+class Pow_solver:
+    """The Pow_solver solves peer challenges in a process pool. The pool is
+    shared by all Peer_connections of a gossip instance and started on the
+    first solve.
+
+    A single challenge can be split into multiple slices, which are searched
+    in parallel. Slice i checks the nonces i, i+slices, i+2*slices, ... . The
+    first slice that finds a nonce stops all other slices.
+
+    Class variables:
+    - workers (int) -- (private) number of worker processes
+    - slices (int) -- (private) number of slices a single challenge is split
+      into
+    - difficulty (int) -- (private) number of leading zero bytes of a valid
+      nonce
+    - executor (ProcessPoolExecutor) -- (private) pool used for solving. None
+      until the first challenge is solved
+    - statistics (dictionary: str - number) -- (private) time-to-solve
+      statistics, see get_statistics
+    """
+
+    def __init__(self, workers, slices=1, difficulty=POW_DIFFICULTY):
+        """
+        Arguments:
+        - workers (int) -- number of worker processes. 0 to use one worker per
+          cpu core
+        - slices (int) -- (Optional, default: 1) number of slices a single
+          challenge is split into. 0 to use one slice per worker
+        - difficulty (int) -- (Optional, default: POW_DIFFICULTY) number of
+          leading zero bytes of a valid nonce
+        """
+        if workers == 0:
+            workers = os.cpu_count() or 1
+        if slices == 0:
+            slices = workers
+        self.__workers = workers
+        self.__slices = slices
+        self.__difficulty = difficulty
+        self.__executor = None
+        self.__statistics = {
+            "solved": 0,
+            "failed": 0,
+            "pool_restarts": 0,
+            "total_time": 0.0,
+            "last_time": 0.0,
+            "max_time": 0.0,
+            "nonces_checked": 0,
+        }
+
+    def __get_executor(self):
+        """Returns the process pool, starts it if required"""
+        if self.__executor is None:
+            logging.debug(f"[POW] Starting solver with {self.__workers} "
+                          f"worker processes and {self.__slices} slices per "
+                          "challenge")
+            self.__executor = ProcessPoolExecutor(max_workers=self.__workers)
+        return self.__executor
+
+    def get_statistics(self):
+        """Returns a copy of the time-to-solve statistics.
+
+        Returns:
+            dictionary with the keys:
+            - solved (int) -- number of solved challenges
+            - failed (int) -- number of challenges without nonce (timeout or
+              crashed worker process)
+            - pool_restarts (int) -- number of times the pool was replaced
+              because a worker process died
+            - total_time (float) -- seconds spent on solved challenges
+            - last_time (float) -- seconds spent on the last solved challenge
+            - max_time (float) -- longest time spent on a solved challenge
+            - nonces_checked (int) -- nonces checked for solved challenges
+        """
+        return self.__statistics.copy()
+
+    async def solve(self, challenge, timeout=None):
+        """Searches a valid nonce for the given challenge without blocking the
+        event loop. Cancelling the awaiting task cancels the solve.
+
+        Arguments:
+        - challenge (byte-object / int): challenge from peer challenge
+        - timeout (float) -- (Optional, default: None) time in seconds after
+          which the search is aborted. None for no timeout
+
+        Returns:
+            tuple (nonce, time_to_solve, nonces_checked)
+            as    (int  , float        , int           )
+            nonce is None if no nonce was found before the timeout ran out
+            or a worker process died.
+            nonces_checked counts all finished jobs and is therefore a
+            multiple of NONCES_PER_JOB.
+        """
+        start = time.time()
+        progress = [0]
+        try:
+            nonce = await asyncio.wait_for(
+                self.__solve(challenge, progress), timeout)
+        except asyncio.TimeoutError:
+            nonce = None
+        except BrokenProcessPool as e:
+            # The pool was replaced by __solve_slice, the next solve uses the
+            # new pool
+            logging.error(f"[POW] A worker process died while solving: {e}")
+            nonce = None
+        elapsed = time.time() - start
+
+        if nonce is None:
+            self.__statistics["failed"] += 1
+            logging.warning(f"[POW] Failed to find nonce after {elapsed:.2f}s"
+                            f" and {progress[0]} nonces")
+            return (None, elapsed, progress[0])
+
+        self.__statistics["solved"] += 1
+        self.__statistics["total_time"] += elapsed
+        self.__statistics["last_time"] = elapsed
+        self.__statistics["max_time"] = max(self.__statistics["max_time"],
+                                            elapsed)
+        self.__statistics["nonces_checked"] += progress[0]
+        logging.info(f"[POW] Solved challenge in {elapsed:.2f}s with "
+                     f"{self.__slices} slices ({progress[0]} nonces, "
+                     f"{progress[0] / max(elapsed, 1e-9):.0f} nonces/s)")
+        return (nonce, elapsed, progress[0])
+
+    async def __solve(self, challenge, progress):
+        """Searches all slices in parallel and returns the first nonce found.
+        The remaining slices are cancelled."""
+        tasks = [asyncio.create_task(self.__solve_slice(challenge, i,
+                                                        progress))
+                 for i in range(self.__slices)]
+        try:
+            pending = set(tasks)
+            while len(pending) > 0:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.result() is not None:
+                        return task.result()
+            return None
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def __solve_slice(self, challenge, index, progress):
+        """Submits jobs of NONCES_PER_JOB nonces of slice index to the process
+        pool until a valid nonce is found. Only one job per slice is pending
+        at a time, so a cancelled slice stops after its current job.
+
+        Arguments:
+        - challenge (int) -- challenge from peer challenge
+        - index (int) -- index of the slice, 0 <= index < slices
+        - progress (int List) -- single element list counting checked nonces
+        """
+        loop = asyncio.get_running_loop()
+        job_size = NONCES_PER_JOB * self.__slices
+        for start in range(index, 2**64, job_size):
+            executor = self.__get_executor()
+            try:
+                nonce = await loop.run_in_executor(
+                    executor, search_nonce_range, challenge, start,
+                    min(start + job_size, 2**64), self.__difficulty,
+                    self.__slices)
+            except BrokenProcessPool:
+                self.__discard_executor(executor)
+                raise
+            progress[0] += NONCES_PER_JOB
+            if nonce is not None:
+                return nonce
+        return None
+
+    def __discard_executor(self, executor):
+        """Shuts down a broken pool, so the next job starts a new one. Other
+        slices and solves may fail on the same pool, it is only replaced
+        once."""
+        if self.__executor is not executor:
+            return
+        logging.warning("[POW] Restarting the solver after a worker process "
+                        "died")
+        self.__statistics["pool_restarts"] += 1
+        self.__executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        """Stops the worker processes. Pending jobs are cancelled."""
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False, cancel_futures=True)
+            self.__executor = None
@@ -0,0 +1,487 @@
+"""
+This module provides the Send_queue class, a bounded outbound queue of a
+single connection. Frames are enqueued without waiting for the network and
+written in batches by a single flusher task. Control frames are always sent
+before data frames, data frames are shared fairly between datatypes. Slow
+consumers are handled with watermarks, see SLOW_CONSUMER_POLICIES.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+
+from modules.util import write_buffers
+
+# Maximum number of frames waiting in a Send_queue. Further frames are dropped
+SEND_QUEUE_FRAMES = 4096
+
+# Data frames written per batch (in bytes). Control frames enqueued while a
+# batch is drained only wait for this batch, not for all queued data frames
+SEND_BATCH_BYTES = 65536
+
+# Bytes a datatype with weight 1 may send per round of the deficit round
+# robin scheduler
+QUANTUM_BYTES = 4096
+
+# Policies for data frames (announces and notifications) while a connection
+# is congested (buffered bytes went above the high watermark and did not fall
+# below the low watermark yet):
+# - drop_oldest: drop queued data frames, oldest first, to make room
+# - drop_new: drop the new frame
+# - disconnect: queue the frame, disconnect if the connection stays
+#   congested for longer than the timeout
+SLOW_CONSUMER_POLICIES = ["drop_oldest", "drop_new", "disconnect"]
+
+
+def parse_datatype_weights(text):
+    """Parses the weights of datatypes for the deficit round robin
+    scheduler.
+
+    Arguments:
+    - text (str) -- comma separated list of <datatype>=<weight>. Example:
+      "1=4, 7=2"
+
+    Returns: dictionary: int - int
+
+    Raises: ValueError if text is not in a valid format
+    """
+    weights = {}
+    for item in text.replace(" ", "").split(","):
+        if len(item) == 0:
+            continue
+        (datatype, _, weight) = item.partition("=")
+        weights[int(datatype)] = int(weight)
+    return weights
+
+
+class Send_queue:
+    """The Send_queue buffers outgoing frames of a connection. A flusher task
+    is started when the first frame is enqueued. It writes queued frames with
+    a single write_buffers call, awaits a single drain and stops once the
+    queue is empty. Frames enqueued while the flusher waits for drain are
+    written in the next batch.
+
+    Frames are either control frames (e.g. handshake messages) or data frames
+    of a datatype (announces and notifications). Every batch starts with all
+    queued control frames, followed by at most batch_bytes of data frames.
+    Data frames are picked with deficit round robin: every datatype gets
+    QUANTUM_BYTES * weight bytes per round, so busy datatypes can not starve
+    others.
+
+    The buffered bytes of a connection are the queued bytes plus the bytes in
+    the write buffer of the transport. If they exceed the high watermark, the
+    connection is congested until they fall below the low watermark. While
+    congested, data frames are handled according to the policy. Control
+    frames are always queued: if the queue holds max_frames frames, new data
+    frames are dropped, while a new control frame replaces the oldest data
+    frame.
+
+    Class variables:
+    - writer (StreamWriter / Peer_protocol) -- (private) writer of the
+      connection
+    - name (object) -- (private) connection using this queue, only used in
+      logs
+    - max_frames (int) -- (private) maximum number of queued frames, only
+      exceeded by control frames if no data frames are queued
+    - batch_bytes (int) -- (private) maximum bytes of data frames per batch
+    - weights (dictionary: int - int) -- (private) weight of a datatype,
+      datatypes not in weights have weight 1
+    - high_watermark (int) -- (private) buffered bytes above which the
+      connection is congested. None for no limit
+    - low_watermark (int) -- (private) buffered bytes below which a congested
+      connection recovers
+    - policy (str) -- (private) see SLOW_CONSUMER_POLICIES
+    - timeout (float) -- (private) seconds a connection may stay congested
+      with the policy disconnect
+    - on_slow_consumer (function) -- (private) called without arguments if
+      the connection stayed congested for timeout seconds. Can return a
+      coroutine, which is started as task
+    - timer_wheel (Timer_wheel) -- (private) used for the congestion timeout
+    - clock (function) -- (private) returns the current time in seconds, used
+      for the write latency
+    - control (deque of Tuples) -- (private) queued control frames.
+      Format: (buffers (byte-object Tuple), size (int), sequence (int),
+      queued_at (float))
+    - data (dictionary: int - deque of Tuples) -- (private) queued data
+      frames of each datatype, same format as control. Only contains
+      datatypes with queued frames
+    - active (int deque) -- (private) round robin order of the datatypes in
+      data
+    - deficits (dictionary: int - int) -- (private) bytes each datatype in
+      data may still send in the current round
+    - sequence (int) -- (private) sequence number of the next frame, used to
+      find the oldest data frame
+    - length (int) -- (private) number of queued frames
+    - queued_bytes (int) -- (private) bytes of all queued frames
+    - data_bytes (int) -- (private) bytes of the queued data frames
+    - congested (boolean) -- (private) True while the connection is congested
+    - congestion_timer (Timer) -- (private) pending congestion timeout. None
+      if not congested or the policy is not disconnect
+    - flusher (Task) -- (private) task writing queued frames. None if the
+      queue is empty
+    - closed (boolean) -- (private) True after close or a write error
+    - statistics (dictionary: str - int) -- (private) see get_statistics
+    - latency (List) -- (private) write latency of the drained frames: time
+      from put until the batch of the frame was drained.
+      Format: [count, total, max]
+    """
+
+    def __init__(self, writer, name="", max_frames=SEND_QUEUE_FRAMES,
+                 high_watermark=None, low_watermark=0, policy="drop_oldest",
+                 timeout=None, on_slow_consumer=None, timer_wheel=None,
+                 batch_bytes=SEND_BATCH_BYTES, weights=None,
+                 clock=time.monotonic):
+        """
+        Arguments:
+        - writer (StreamWriter / Peer_protocol) -- writer of the connection
+        - name (object) -- (Optional, default: "") connection using this
+          queue, only used in logs
+        - max_frames (int) -- (Optional, default: SEND_QUEUE_FRAMES) maximum
+          number of queued frames
+        - high_watermark (int) -- (Optional, default: None) buffered bytes
+          above which the connection is congested. None for no limit
+        - low_watermark (int) -- (Optional, default: 0) buffered bytes below
+          which a congested connection recovers
+        - policy (str) -- (Optional, default: "drop_oldest") see
+          SLOW_CONSUMER_POLICIES
+        - timeout (float) -- (Optional, default: None) seconds a connection
+          may stay congested with the policy disconnect
+        - on_slow_consumer (function) -- (Optional, default: None) called if
+          the connection stayed congested for timeout seconds
+        - timer_wheel (Timer_wheel) -- (Optional, default: None) required for
+          the policy disconnect
+        - batch_bytes (int) -- (Optional, default: SEND_BATCH_BYTES) maximum
+          bytes of data frames per batch
+        - weights (dictionary: int - int) -- (Optional, default: None) weight
+          of each datatype. Datatypes not in weights have weight 1
+        - clock (function) -- (Optional, default: time.monotonic) returns the
+          current time in seconds
+        """
+        self.__writer = writer
+        self.__name = name
+        self.__max_frames = max_frames
+        self.__batch_bytes = batch_bytes
+        self.__weights = weights if weights is not None else {}
+        self.__high_watermark = high_watermark
+        self.__low_watermark = low_watermark
+        self.__policy = policy
+        self.__timeout = timeout
+        self.__on_slow_consumer = on_slow_consumer
+        self.__timer_wheel = timer_wheel
+        self.__clock = clock
+        self.__control = deque()
+        self.__data = {}
+        self.__active = deque()
+        self.__deficits = {}
+        self.__sequence = 0
+        self.__length = 0
+        self.__queued_bytes = 0
+        self.__data_bytes = 0
+        self.__congested = False
+        self.__congestion_timer = None
+        self.__flusher = None
+        self.__closed = False
+        self.__statistics = {
+            "sent_frames": 0,
+            "sent_bytes": 0,
+            "dropped_frames": 0,
+            "flushes": 0,
+            "congestions": 0,
+        }
+        self.__latency = [0, 0, 0]
+
+    def __len__(self):
+        """Returns the number of queued frames (queue depth)"""
+        return self.__length
+
+    def put(self, *buffers, datatype=None):
+        """Enqueues a frame. Does not wait for the network.
+
+        Arguments:
+        - buffers (byte-objects) -- frame, can be split into multiple buffers
+          to avoid copying them
+        - datatype (int) -- (Optional, default: None) datatype of a data
+          frame. None for control frames, which are sent before all data
+          frames and are never dropped because the queue is full or congested
+
+        Returns: True if the frame was queued, False if it was dropped
+        because the queue is full, congested or closed
+        """
+        if self.__closed:
+            return False
+        size = sum(len(buffer) for buffer in buffers)
+        if self.__length >= self.__max_frames:
+            if datatype is not None:
+                self.__drop(f"Send queue of {self.__name} is full")
+                return False
+            if len(self.__data) > 0:
+                self.__drop_oldest_frame()
+                self.__drop(f"Send queue of {self.__name} is full, oldest "
+                            "frame")
+
+        self.__update_congestion(size)
+        if datatype is not None and self.__congested:
+            if self.__policy == "drop_new":
+                self.__drop(f"{self.__name} is congested")
+                return False
+            if (self.__policy == "drop_oldest"
+                    and not self.__drop_oldest(size)):
+                self.__drop(f"{self.__name} is congested")
+                return False
+
+        frame = (buffers, size, self.__sequence, self.__clock())
+        self.__sequence += 1
+        if datatype is None:
+            self.__control.append(frame)
+        else:
+            if datatype in self.__data:
+                self.__data[datatype].append(frame)
+            else:
+                self.__data[datatype] = deque((frame,))
+                self.__deficits[datatype] = 0
+                self.__active.append(datatype)
+            self.__data_bytes += size
+        self.__length += 1
+        self.__queued_bytes += size
+        if self.__flusher is None:
+            self.__flusher = asyncio.create_task(self.__flush())
+        return True
+
+    def __drop(self, reason):
+        """Counts and logs a dropped frame"""
+        self.__statistics["dropped_frames"] += 1
+        logging.debug(f"[SEND] {reason}, dropping frame")
+
+    def __drop_oldest(self, size):
+        """Drops queued data frames, oldest first, until size bytes are freed.
+        Returns False and drops nothing if not enough data frames are
+        queued."""
+        if self.__data_bytes < size:
+            return False
+        while size > 0:
+            size -= self.__drop_oldest_frame()[1]
+            self.__drop(f"{self.__name} is congested, oldest frame")
+        return True
+
+    def __drop_oldest_frame(self):
+        """Removes and returns the oldest queued data frame"""
+        # The oldest frame is at the head of one of the datatype queues
+        datatype = min(self.__data,
+                       key=lambda datatype: self.__data[datatype][0][2])
+        return self.__pop_data(datatype)
+
+    def __pop_data(self, datatype):
+        """Removes and returns the first data frame of datatype"""
+        frames = self.__data[datatype]
+        frame = frames.popleft()
+        if len(frames) == 0:
+            del self.__data[datatype]
+            del self.__deficits[datatype]
+            self.__active.remove(datatype)
+        self.__length -= 1
+        self.__queued_bytes -= frame[1]
+        self.__data_bytes -= frame[1]
+        return frame
+
+    def get_buffered_bytes(self):
+        """Returns the queued bytes plus the bytes in flight"""
+        return self.__queued_bytes + self.get_bytes_in_flight()
+
+    def is_congested(self):
+        """Returns True if the buffered bytes exceeded the high watermark and
+        did not fall below the low watermark since"""
+        return self.__congested
+
+    def __update_congestion(self, size=0):
+        """Updates the congestion state using the watermarks.
+
+        Arguments:
+        - size (int) -- (Optional, default: 0) bytes that are about to be
+          queued
+        """
+        if self.__high_watermark is None:
+            return
+        buffered = self.get_buffered_bytes() + size
+        if not self.__congested and buffered > self.__high_watermark:
+            self.__congested = True
+            self.__statistics["congestions"] += 1
+            logging.info(f"[SEND] {self.__name} is congested, {buffered} "
+                         "bytes buffered")
+            if self.__policy == "disconnect" and self.__timeout is not None:
+                self.__congestion_timer = self.__timer_wheel.schedule(
+                    self.__timeout, self.__on_congestion_timeout)
+        elif self.__congested and buffered < self.__low_watermark:
+            self.__congested = False
+            logging.info(f"[SEND] {self.__name} recovered from congestion")
+            self.__cancel_congestion_timer()
+
+    def __cancel_congestion_timer(self):
+        if self.__congestion_timer is not None:
+            self.__congestion_timer.cancel()
+            self.__congestion_timer = None
+
+    def __on_congestion_timeout(self):
+        """Gets called by the timer wheel if the connection stayed congested
+        for timeout seconds"""
+        self.__congestion_timer = None
+        self.__update_congestion()
+        if not self.__congested or self.__closed:
+            return None
+        logging.warning(f"[SEND] {self.__name} stayed congested for "
+                        f"{self.__timeout}s, disconnecting slow consumer")
+        if self.__on_slow_consumer is not None:
+            return self.__on_slow_consumer()
+        return None
+
+    def get_queued_bytes(self):
+        """Returns the number of bytes waiting in the queue"""
+        return self.__queued_bytes
+
+    def get_bytes_in_flight(self):
+        """Returns the number of bytes written to the transport, which are not
+        sent yet (write buffer of the transport)"""
+        transport = getattr(self.__writer, "transport", None)
+        if transport is None:
+            return 0
+        return transport.get_write_buffer_size()
+
+    def get_statistics(self):
+        """Returns a copy of the statistics of this queue.
+
+        Returns:
+            dictionary with the keys:
+            - depth (int) -- queued frames
+            - control_depth (int) -- queued control frames
+            - queued_bytes (int) -- bytes of queued frames
+            - bytes_in_flight (int) -- see get_bytes_in_flight
+            - sent_frames (int) -- frames written to the transport
+            - sent_bytes (int) -- bytes written to the transport
+            - dropped_frames (int) -- frames dropped because the queue was
+              full or congested
+            - flushes (int) -- batches written, sent_frames / flushes is the
+              average batch size
+            - congestions (int) -- number of times the connection became
+              congested
+            - congested (bool) -- whether the connection is congested
+            - write_latency (dictionary) -- seconds from put until the frame
+              was drained, with the keys count, mean and max (see Metrics)
+        """
+        statistics = self.__statistics.copy()
+        (count, total, maximum) = self.__latency
+        statistics["write_latency"] = {
+            "count": count,
+            "mean": total / count if count > 0 else 0,
+            "max": maximum,
+        }
+        statistics["congested"] = self.__congested
+        statistics["depth"] = self.__length
+        statistics["control_depth"] = len(self.__control)
+        statistics["queued_bytes"] = self.__queued_bytes
+        statistics["bytes_in_flight"] = self.get_bytes_in_flight()
+        return statistics
+
+    async def flush(self):
+        """Waits until all queued frames are written and drained"""
+        while self.__flusher is not None:
+            await asyncio.wait([self.__flusher])
+
+    def close(self):
+        """Writes all queued frames to the transport without waiting and stops
+        the flusher. Should be called before closing the writer, so queued
+        frames are sent before the connection is closed."""
+        if self.__closed:
+            return
+        self.__closed = True
+        self.__cancel_congestion_timer()
+        if self.__flusher is not None:
+            self.__flusher.cancel()
+            self.__flusher = None
+        if self.__length > 0 and not self.__writer.is_closing():
+            self.__write_batch(None)
+        self.__clear()
+
+    def __clear(self):
+        """Removes all queued frames"""
+        self.__control.clear()
+        self.__data.clear()
+        self.__active.clear()
+        self.__deficits.clear()
+        self.__length = 0
+        self.__queued_bytes = 0
+        self.__data_bytes = 0
+
+    def __next_data_frame(self):
+        """Removes and returns the next data frame using deficit round robin.
+        The datatype at the head of active sends while its deficit covers its
+        next frame, otherwise it gets its quantum and the next datatype
+        continues."""
+        while True:
+            datatype = self.__active[0]
+            size = self.__data[datatype][0][1]
+            if self.__deficits[datatype] >= size:
+                self.__deficits[datatype] -= size
+                return self.__pop_data(datatype)
+            self.__deficits[datatype] += (QUANTUM_BYTES
+                                          * self.__weights.get(datatype, 1))
+            self.__active.rotate(-1)
+
+    def __write_batch(self, batch_bytes):
+        """Writes all queued control frames and the next data frames to the
+        writer.
+
+        Arguments:
+        - batch_bytes (int) -- maximum bytes of data frames. None to write
+          all queued frames
+
+        Returns: the written frames
+        """
+        frames = list(self.__control)
+        self.__length -= len(frames)
+        self.__queued_bytes -= sum(frame[1] for frame in frames)
+        self.__control.clear()
+        data_bytes = 0
+        while (len(self.__active) > 0
+               and (batch_bytes is None or data_bytes < batch_bytes)):
+            frame = self.__next_data_frame()
+            data_bytes += frame[1]
+            frames.append(frame)
+
+        buffers = []
+        for frame in frames:
+            buffers.extend(frame[0])
+        self.__statistics["sent_frames"] += len(frames)
+        self.__statistics["sent_bytes"] += sum(frame[1] for frame in frames)
+        self.__statistics["flushes"] += 1
+        write_buffers(self.__writer, buffers)
+        return frames
+
+    def __observe_latency(self, frames):
+        """Records the write latency of drained frames"""
+        now = self.__clock()
+        latency = self.__latency
+        latency[0] += len(frames)
+        for frame in frames:
+            latency[1] += now - frame[3]
+        # The first frame of a batch is not always the oldest one, control
+        # frames overtake data frames
+        latency[2] = max(latency[2],
+                         now - min(frame[3] for frame in frames))
+
+    async def __flush(self):
+        """Writes queued frames in batches until the queue is empty"""
+        try:
+            while self.__length > 0 and not self.__closed:
+                if self.__writer.is_closing():
+                    break
+                frames = self.__write_batch(self.__batch_bytes)
+                await self.__writer.drain()
+                self.__observe_latency(frames)
+                self.__update_congestion()
+        except (ConnectionError, OSError) as e:
+            # The connection is closed by its read side
+            logging.debug(f"[SEND] Failed to send to {self.__name}: {e}")
+            self.__closed = True
+            self.__clear()
+        finally:
+            if self.__flusher is asyncio.current_task():
+                self.__flusher = None
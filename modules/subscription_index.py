@@ -0,0 +1,102 @@
+"""
+This module provides the Subscription_index class, which keeps track of the
+datatypes APIs subscribed to.
+"""
+
+
+class Subscription_index:
+    """The Subscription_index maps every datatype to its subscribing APIs and
+    every API to the datatypes it subscribed to. Subscribing and
+    unsubscribing are O(1), removing an API is O(k) for k subscribed
+    datatypes. An API subscribes to a datatype at most once.
+
+    get_subscribers returns an immutable tuple, which stays valid after the
+    subscriptions changed, so it can be iterated while awaiting. The tuple of
+    a datatype is built once after its subscribers changed.
+
+    The index does not await, so it does not require a lock.
+
+    Class variables:
+    - subscribers (dictionary: int - dictionary) -- (private) subscribers of
+      each datatype, in the order they subscribed.
+      Format: datatype : {Api_connection: None}
+    - datatypes (dictionary: Api_connection - set) -- (private) subscribed
+      datatypes of each API
+    - tuples (dictionary: int - Tuple) -- (private) cached subscriber tuples,
+      removed when the subscribers of the datatype change
+    """
+
+    def __init__(self):
+        self.__subscribers = {}
+        self.__datatypes = {}
+        self.__tuples = {}
+
+    def __len__(self):
+        """Returns the number of subscribed APIs"""
+        return len(self.__datatypes)
+
+    def __contains__(self, api):
+        return api in self.__datatypes
+
+    def __repr__(self):
+        return repr({datatype: list(apis)
+                     for (datatype, apis) in self.__subscribers.items()})
+
+    def subscribe(self, datatype, api):
+        """Subscribes api to datatype.
+
+        Arguments:
+        - datatype (int) -- datatype of the GOSSIP NOTIFY
+        - api (Api_connection) -- subscribing API
+
+        Returns: False if api already subscribed to datatype, True otherwise
+        """
+        apis = self.__subscribers.setdefault(datatype, {})
+        if api in apis:
+            return False
+        apis[api] = None
+        self.__datatypes.setdefault(api, set()).add(datatype)
+        self.__tuples.pop(datatype, None)
+        return True
+
+    def unsubscribe(self, datatype, api):
+        """Removes the subscription of api to datatype.
+
+        Returns: False if api did not subscribe to datatype, True otherwise
+        """
+        apis = self.__subscribers.get(datatype)
+        if apis is None or api not in apis:
+            return False
+        del apis[api]
+        if len(apis) == 0:
+            del self.__subscribers[datatype]
+        datatypes = self.__datatypes[api]
+        datatypes.discard(datatype)
+        if len(datatypes) == 0:
+            del self.__datatypes[api]
+        self.__tuples.pop(datatype, None)
+        return True
+
+    def remove(self, api):
+        """Removes all subscriptions of api, e.g. after it disconnected.
+
+        Returns: the datatypes api was subscribed to (int List)
+        """
+        datatypes = list(self.__datatypes.get(api, ()))
+        for datatype in datatypes:
+            self.unsubscribe(datatype, api)
+        return datatypes
+
+    def get_subscribers(self, datatype):
+        """Returns the subscribers of datatype as immutable tuple, in the order
+        they subscribed. Empty if there are none."""
+        subscribers = self.__tuples.get(datatype)
+        if subscribers is None:
+            subscribers = tuple(self.__subscribers.get(datatype, ()))
+            if len(subscribers) > 0:
+                self.__tuples[datatype] = subscribers
+        return subscribers
+
+    def get_datatypes(self, api):
+        """Returns the datatypes api subscribed to (int List)"""
+        return list(self.__datatypes.get(api, ()))
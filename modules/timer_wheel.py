@@ -0,0 +1,196 @@
+"""
+This module provides the Timer_wheel class, a hierarchical timer wheel used
+for all protocol deadlines of a gossip instance (e.g. challenge timeouts, peer
+offer timeouts and announces waiting for validation).
+"""
+import asyncio
+import logging
+import time
+from math import ceil
+
+
+class Timer:
+    """A Timer represents a single deadline registered at a Timer_wheel. It is
+    returned by Timer_wheel.schedule and can be used to cancel the deadline.
+
+    Class variables:
+    - expires (int) -- tick at which the timer expires
+    - callback (function) -- function called on expiry. If it returns a
+      coroutine, the coroutine is started as a task
+    - args (Tuple) -- arguments passed to callback
+    - slot (Timer set) -- slot of the wheel this timer is currently stored in.
+      None if the timer expired or was cancelled
+    - wheel (Timer_wheel) -- wheel this timer is registered at
+    - cancelled (bool) -- True if cancel was called, also if the timer
+      already expired
+    """
+    __slots__ = ("expires", "callback", "args", "slot", "wheel", "cancelled")
+
+    def __init__(self, expires, callback, args, wheel):
+        self.expires = expires
+        self.callback = callback
+        self.args = args
+        self.slot = None
+        self.wheel = wheel
+        self.cancelled = False
+
+    def cancel(self):
+        """Cancels the timer. Only sets cancelled if the timer already expired
+        or was cancelled."""
+        self.cancelled = True
+        if self.slot is not None:
+            self.slot.discard(self)
+            self.slot = None
+            self.wheel.remove_timer()
+
+    def is_pending(self):
+        """Returns True if the timer neither expired nor was cancelled"""
+        return self.slot is not None
+
+
+class Timer_wheel:
+    """The Timer_wheel keeps track of deadlines in levels of slots. Level 0
+    has one slot per tick, every slot of level n covers `slots` slots of level
+    n-1. Timers are moved to lower levels when their slot is reached, so
+    scheduling and cancelling a timer is O(1) and a single task (run) handles
+    all deadlines.
+
+    Class variables:
+    - resolution (float) -- (private) length of a tick in seconds. Timers
+      expire at most one tick late
+    - slots (int) -- (private) number of slots per level
+    - wheels (List of Timer set Lists) -- (private) slots of all levels
+    - overflow (Timer set) -- (private) timers beyond the range of the highest
+      level
+    - tick (int) -- (private) current tick
+    - clock (function) -- (private) returns the current time in seconds
+    - pending (int) -- (private) number of pending timers
+    """
+
+    def __init__(self, resolution=0.1, slots=64, levels=4,
+                 clock=time.monotonic):
+        """
+        Arguments:
+        - resolution (float) -- (Optional, default: 0.1) length of a tick in
+          seconds
+        - slots (int) -- (Optional, default: 64) slots per level
+        - levels (int) -- (Optional, default: 4) number of levels. The
+          highest level reaches resolution * slots**levels seconds
+        - clock (function) -- (Optional, default: time.monotonic) returns the
+          current time in seconds
+        """
+        self.__resolution = resolution
+        self.__slots = slots
+        self.__wheels = [[set() for _ in range(slots)]
+                         for _ in range(levels)]
+        self.__overflow = set()
+        self.__clock = clock
+        self.__tick = self.__current_tick()
+        self.__pending = 0
+
+    def __len__(self):
+        """Returns the number of pending timers"""
+        return self.__pending
+
+    def __current_tick(self):
+        """Returns the tick of the current time"""
+        return int(self.__clock() / self.__resolution)
+
+    def schedule(self, delay, callback, *args):
+        """Calls callback(*args) in delay seconds.
+
+        Arguments:
+        - delay (float) -- seconds until the callback is called
+        - callback (function) -- function to call. If it returns a coroutine,
+          the coroutine is started as a task
+        - args -- arguments for callback
+
+        Returns: Timer, can be used to cancel the deadline
+        """
+        ticks = max(1, ceil(delay / self.__resolution))
+        timer = Timer(self.__tick + ticks, callback, args, self)
+        self.__insert(timer)
+        self.__pending += 1
+        return timer
+
+    def remove_timer(self):
+        """Gets called by Timer.cancel to update the pending count. Should not
+        be called otherwise."""
+        self.__pending -= 1
+
+    def __insert(self, timer):
+        """Adds the timer to the slot of the lowest level that covers its
+        expiry"""
+        delta = timer.expires - self.__tick
+        # ticks covered by a single slot of the current level
+        unit = 1
+        for wheel in self.__wheels:
+            if delta < unit * self.__slots:
+                slot = wheel[(timer.expires // unit) % self.__slots]
+                break
+            unit *= self.__slots
+        else:
+            slot = self.__overflow
+        slot.add(timer)
+        timer.slot = slot
+
+    def advance(self, now=None):
+        """Advances the wheel to the given time and calls the callbacks of all
+        expired timers.
+
+        Arguments:
+        - now (float) -- (Optional, default: None) current time in seconds.
+          None to use the clock
+        """
+        if now is None:
+            target = self.__current_tick()
+        else:
+            target = int(now / self.__resolution)
+
+        while self.__tick < target:
+            self.__tick += 1
+            self.__cascade()
+            slot = self.__wheels[0][self.__tick % self.__slots]
+            for timer in list(slot):
+                # A callback may have cancelled a timer of the same tick
+                if timer.slot is not slot:
+                    continue
+                slot.discard(timer)
+                timer.slot = None
+                self.__pending -= 1
+                self.__fire(timer)
+
+    def __cascade(self):
+        """Moves the timers of higher levels, whose slot is reached at the
+        current tick, to lower levels"""
+        span = 1
+        for level in range(1, len(self.__wheels)):
+            span *= self.__slots
+            if self.__tick % span != 0:
+                return
+            slot = self.__wheels[level][(self.__tick // span) % self.__slots]
+            timers = list(slot)
+            slot.clear()
+            for timer in timers:
+                self.__insert(timer)
+
+        # The highest level wrapped around, retry overflowing timers
+        timers = list(self.__overflow)
+        self.__overflow.clear()
+        for timer in timers:
+            self.__insert(timer)
+
+    def __fire(self, timer):
+        """Calls the callback of an expired timer"""
+        try:
+            result = timer.callback(*timer.args)
+            if asyncio.iscoroutine(result):
+                asyncio.create_task(result)
+        except Exception as e:
+            logging.exception(f"[TIMER] Timer callback failed: {e}")
+
+    async def run(self):
+        """Advances the wheel every tick. Runs forever."""
+        while True:
+            await asyncio.sleep(self.__resolution)
+            self.advance()
@@ -1,43 +1,34 @@
 """This module provides utility functions that don't fit elsewhere.
-Contains Setqueue class / datastructure and proof of work (pow) functions for
-peer challenge.
+Contains proof of work (pow) functions for peer challenge.
 
 The parse_address function provided in this module can be used to
 parse IPv4 or IPv6 addresses with port into a tuple (See parse_address).
 To validate ip addresses, is_valid_address can be used
 """
 
-import queue
 import logging
 import hashlib
 import time
 import ipaddress
 import socket
+import sys
+from struct import Struct
 
 
-# FIFO Queue which will not add duplicates
-# Source: https://stackoverflow.com/a/16506527
-# Hint: To get the length: "qsize()" function.
-class Setqueue(queue.Queue):
-    def __str__(self):
-        return str(list(self.queue))
+# Number of leading zero bytes the SHA256 hash of challenge and nonce must
+# have to be valid (3 bytes = 24 bits)
+POW_DIFFICULTY = 3
 
-    def __repr__(self):
-        return str(list(self.queue))
+# Packs a nonce into a preallocated buffer, see search_nonce_range
+__nonce_struct = Struct("!Q")
 
-    # Use a set as a basis to avoid duplicates
-    def _init(self, maxsize):
-        self.queue = set()
+# Since Python 3.12, writelines of socket transports sends all buffers with a
+# single sendmsg. Before, the buffers are joined into a new bytes object.
+__SCATTER_GATHER_WRITELINES = sys.version_info >= (3, 12)
 
-    def _put(self, item):
-        self.queue.add(item)
-
-    def _get(self):
-        return self.queue.pop()
-
-    def contains(self, item):
-        with self.mutex:
-            return item in self.queue
+# Buffers smaller than this are joined before writing them, if writelines
+# does not support scatter-gather. Larger buffers are written without copy
+__JOIN_LIMIT = 4096
 
 
 def parse_address(address):
@@ -100,44 +91,115 @@ def resolve_address(address):
     return address
 
 
-def valid_nonce_peer_challenge(challenge, nonce):
+def write_buffers(writer, buffers):
+    """Writes multiple buffers (e.g. a header and a shared payload) to a
+    StreamWriter without concatenating them. Does not drain the writer.
+
+    Arguments:
+    - writer (StreamWriter) -- writer to write to
+    - buffers (byte-object List / Tuple) -- buffers in the order they should
+      be sent
+    """
+    if __SCATTER_GATHER_WRITELINES:
+        writer.writelines(buffers)
+        return
+
+    # Separate writes send each buffer directly if the socket accepts it, so
+    # large buffers are only copied if the transport has to buffer them.
+    # Consecutive small buffers are joined to avoid a send per buffer.
+    small = []
+    for buffer in buffers:
+        if len(buffer) < __JOIN_LIMIT:
+            small.append(buffer)
+            continue
+        if len(small) > 0:
+            writer.write(b''.join(small))
+            small = []
+        writer.write(buffer)
+    if len(small) == 1:
+        writer.write(small[0])
+    elif len(small) > 1:
+        writer.write(b''.join(small))
+
+
+def valid_nonce_peer_challenge(challenge, nonce, difficulty=POW_DIFFICULTY):
     """Checks if the given nonce produces a valid hash with the given challenge
 
     Arguments:
     - challenge (byte-object / int): challenge from peer challenge
     - nonce (byte-object / int): nonce for challenge
+    - difficulty (int) -- (Optional, default: POW_DIFFICULTY) number of
+      leading zero bytes required
 
     Returns:
-        True if the first 16 bits of the SHA256 hash value from the package are
-        0.
+        True if the first 24 bits (difficulty bytes) of the SHA256 hash value
+        from the package are 0.
     """
     if type(challenge) not in [bytes, bytearray]:
         challenge = int(challenge).to_bytes(8, 'big')
     if type(nonce) not in [bytes, bytearray]:
         nonce = int(nonce).to_bytes(8, 'big')
 
-    hash = hashlib.sha256(challenge + nonce).hexdigest()
-    return hash[:6] == '000000'
+    digest = hashlib.sha256(challenge + nonce).digest()
+    return digest[:difficulty] == bytes(difficulty)
 
 
-def produce_pow_peer_challenge(challenge):
+def produce_pow_peer_challenge(challenge, difficulty=POW_DIFFICULTY):
     """Attempts to find a valid nonce for a peer challenge message.
 
     Arguments:
     - challenge (byte-object / int): challenge from peer challenge
+    - difficulty (int) -- (Optional, default: POW_DIFFICULTY) number of
+      leading zero bytes required
 
     Returns:
         Valid nonce (int) if found or None if no nonce was found.
     """
+    start = time.time()
+    logging.debug("searching for nonce")
+    nonce = search_nonce_range(challenge, 0, 2**64, difficulty)
+    if nonce is not None:
+        logging.debug(f"Found nonce after {time.time()-start} seconds")
+        return nonce
+    logging.warning(f"Failed to find nonce after {time.time()-start} seconds")
+    return None
+
+
+def search_nonce_range(challenge, start, stop, difficulty=POW_DIFFICULTY,
+                       step=1):
+    """Searches for a valid nonce for a peer challenge message within the
+    given range of nonces. Used to split the search into smaller jobs and
+    strided slices, see Pow_solver.
+
+    The challenge is only hashed once, every nonce continues from a copy of
+    that hash state (midstate). Nonces are packed into a reused buffer and the
+    raw digest is checked for leading zero bytes.
+
+    Arguments:
+    - challenge (byte-object / int): challenge from peer challenge
+    - start (int): first nonce to check
+    - stop (int): first nonce not to check anymore (exclusive)
+    - difficulty (int) -- (Optional, default: POW_DIFFICULTY) number of
+      leading zero bytes required
+    - step (int) -- (Optional, default: 1) only every step-th nonce starting
+      at start is checked
+
+    Returns:
+        Valid nonce (int) if found or None if no nonce was found in the range.
+    """
     if type(challenge) not in [bytes, bytearray]:
         challenge = int(challenge).to_bytes(8, 'big')
 
-    start = time.time()
-    max = 2**64
-    logging.debug("searching for nonce")
-    for nonce in range(max):
-        if valid_nonce_peer_challenge(challenge, nonce):
-            logging.debug(f"Found nonce after {time.time()-start} seconds")
+    # Local names to avoid attribute lookups in the loop
+    copy_midstate = hashlib.sha256(challenge).copy
+    pack_nonce = __nonce_struct.pack_into
+    nonce_buf = bytearray(8)
+    zeros = bytes(difficulty)
+
+    for nonce in range(start, stop, step):
+        pack_nonce(nonce_buf, 0, nonce)
+        hash = copy_midstate()
+        hash.update(nonce_buf)
+        if hash.digest().startswith(zeros):
             return nonce
-    logging.warning(f"Failed to find nonce after {time.time()-start} seconds")
     return None
@@ -0,0 +1,99 @@
+"""Benchmark of the memory allocated to forward a single PEER ANNOUNCE.
+HOWTO:
+    Run this program. No running instance of gossip is required.
+
+A PEER ANNOUNCE with PAYLOAD bytes of data is sent to PEERS peers and as
+GOSSIP NOTIFICATION to SUBSCRIBERS apis. The writers keep references to all
+buffers they get (like a transport that can not send immediately), so
+tracemalloc shows all bytes allocated for the frames of one message.
+
+Compared are:
+- copy per connection: pack_peer_announce / build_gossip_notification per
+  connection, as before
+- joined writelines: shared header, but the buffers are joined (writelines of
+  Python < 3.12)
+- shared buffers: shared header and payload (write_buffers)
+"""
+
+import tracemalloc
+import context
+from modules.util import write_buffers
+from modules.packet_parser import (
+    build_gossip_notification,
+    build_gossip_notification_header,
+    pack_peer_announce,
+    pack_peer_announce_header
+)
+
+PAYLOAD = 60000
+PEERS = 15
+SUBSCRIBERS = 10
+MESSAGES = 100
+
+
+class Recording_writer:
+    """StreamWriter replacement that keeps all written buffers"""
+
+    def __init__(self):
+        self.buffers = []
+
+    def write(self, data):
+        self.buffers.append(data)
+
+    def writelines(self, data):
+        self.buffers.extend(data)
+
+
+class Joining_writer(Recording_writer):
+    """Writer with the writelines of Python < 3.12"""
+
+    def writelines(self, data):
+        self.buffers.append(b''.join(data))
+
+
+def copy_per_connection(data, peers, apis):
+    for writer in peers:
+        writer.write(pack_peer_announce(1, 5, 1, data))
+    for writer in apis:
+        writer.write(build_gossip_notification(1, 1, data))
+
+
+def shared_header(data, peers, apis, write):
+    header = pack_peer_announce_header(1, 5, 1, len(data))
+    for writer in peers:
+        write(writer, (header, data))
+    header = build_gossip_notification_header(1, 1, len(data))
+    for writer in apis:
+        write(writer, (header, data))
+
+
+def measure(name, writer_class, send):
+    """Prints the bytes allocated per forwarded message"""
+    data = bytes(PAYLOAD)
+    peers = [writer_class() for _ in range(PEERS)]
+    apis = [writer_class() for _ in range(SUBSCRIBERS)]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for _ in range(MESSAGES):
+        send(data, peers, apis)
+    allocated = (tracemalloc.get_traced_memory()[0] - before) / MESSAGES
+    tracemalloc.stop()
+    print(f"[benchmark_fanout_alloc] {name:<20} {allocated:>12,.0f} "
+          f"bytes/message ({allocated / PAYLOAD:.2f}x payload)")
+
+
+def main():
+    print(f"[benchmark_fanout_alloc] payload: {PAYLOAD} bytes, peers: "
+          f"{PEERS}, subscribers: {SUBSCRIBERS}")
+    measure("copy per connection", Recording_writer, copy_per_connection)
+    measure("joined writelines", Joining_writer,
+            lambda data, peers, apis: shared_header(
+                data, peers, apis, lambda writer, buffers:
+                writer.writelines(buffers)))
+    measure("shared buffers", Recording_writer,
+            lambda data, peers, apis: shared_header(
+                data, peers, apis, write_buffers))
+
+
+if __name__ == "__main__":
+    main()
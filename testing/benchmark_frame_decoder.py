@@ -0,0 +1,67 @@
+"""Benchmark of reading packets from a connection.
+HOWTO:
+    Run this program. No running instance of gossip is required.
+
+FRAMES small PEER ANNOUNCEs are fed into an asyncio StreamReader and read
+- per packet: read(2) for the size, then read(size-2), as before
+- with Frame_decoder: read(READ_SIZE) and split the chunks into frames
+and the number of packets per second is printed.
+"""
+
+import asyncio
+import time
+import context
+from modules.packet_parser import (
+    READ_SIZE,
+    Frame_decoder,
+    pack_peer_announce
+)
+
+FRAMES = 200000
+PAYLOAD = 32
+
+
+def make_reader(stream):
+    reader = asyncio.StreamReader(limit=len(stream) + 1)
+    reader.feed_data(stream)
+    reader.feed_eof()
+    return reader
+
+
+async def read_per_packet(reader):
+    frames = 0
+    while True:
+        size_bytes = await reader.read(2)
+        if len(size_bytes) == 0:
+            return frames
+        size = int.from_bytes(size_bytes, "big")
+        buf = size_bytes + await reader.read(size-2)
+        frames += 1
+
+
+async def read_with_decoder(reader):
+    frames = 0
+    decoder = Frame_decoder()
+    while True:
+        chunk = await reader.read(READ_SIZE)
+        if len(chunk) == 0:
+            return frames
+        for frame in decoder.feed(chunk):
+            frames += 1
+
+
+async def main():
+    stream = b''.join(pack_peer_announce(i, 1, 1, bytes(PAYLOAD))
+                      for i in range(FRAMES))
+    for (name, read) in [("per packet", read_per_packet),
+                         ("Frame_decoder", read_with_decoder)]:
+        reader = make_reader(stream)
+        start = time.perf_counter()
+        frames = await read(reader)
+        rate = frames / (time.perf_counter() - start)
+        print(f"[benchmark_frame_decoder] {name:<14} {rate:>12,.0f} "
+              "packets/sec")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
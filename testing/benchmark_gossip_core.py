@@ -0,0 +1,110 @@
+"""Benchmark of the PEER ANNOUNCE throughput of the gossip cores (see config
+gossip_core).
+HOWTO:
+    Run this program. No running instance of gossip is required.
+
+SENDERS peers concurrently send MESSAGES PEER ANNOUNCEs in total. Each is
+notified to SUBSCRIBERS apis, which validate it concurrently, and forwarded to
+the other peers once all of them validated it. The peers and apis only record
+the messages, like connections with a Send_queue that never block.
+
+Measured is the time until all messages were forwarded, with:
+- locks: Gossip changes its state itself, guarded by locks
+- actor: a Gossip_actor owns the state and processes commands
+"""
+
+import asyncio
+import time
+import context
+from modules.gossip import Gossip
+from modules.peer_registry import PUSH
+from test_gossip import make_config
+
+MESSAGES = 20000
+SENDERS = 8
+SUBSCRIBERS = 4
+PAYLOAD = 64
+DTYPE = 1
+
+
+class Counting_peer:
+    """Peer that counts the messages forwarded to it"""
+
+    def __init__(self, forwarded):
+        self.forwarded = forwarded
+
+    def is_fully_validated(self):
+        return True
+
+    def get_peer_p2p_listening_address(self):
+        return None
+
+    async def send_peer_announce(self, id, ttl, data_type, data,
+                                 header=None):
+        self.forwarded.add(id)
+        return True
+
+
+class Validating_api:
+    """API that validates every notification in its own coroutine, like an
+    Api_connection reading GOSSIP VALIDATIONs"""
+
+    def __init__(self):
+        self.pending = asyncio.Queue()
+
+    async def send_gossip_notification(self, msg_id, dtype, data,
+                                       header=None):
+        self.pending.put_nowait(msg_id)
+        return True
+
+    async def run(self, gossip):
+        while True:
+            msg_id = await self.pending.get()
+            await gossip.handle_gossip_validation(msg_id, True, self)
+
+
+async def measure(core):
+    """Returns the forwarded messages per second of the given core"""
+    gossip = Gossip(make_config(gossip_core=core, degree=SENDERS,
+                                cache_size=MESSAGES,
+                                announce_store_bytes=2**30))
+    forwarded = set()
+    senders = [Counting_peer(forwarded) for _ in range(SENDERS)]
+    for peer in senders:
+        gossip._Gossip__peers.add(peer, PUSH)
+    apis = [Validating_api() for _ in range(SUBSCRIBERS)]
+    tasks = []
+    for api in apis:
+        await gossip.add_subscriber(DTYPE, api)
+        tasks.append(asyncio.create_task(api.run(gossip)))
+
+    async def send(index, peer):
+        data = bytes(PAYLOAD)
+        for packet_id in range(index, MESSAGES, SENDERS):
+            await gossip.handle_peer_announce(packet_id, 5, DTYPE, data,
+                                              peer)
+            # A peer reads the next message from the socket in a new step
+            await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[send(index, peer)
+                           for (index, peer) in enumerate(senders)])
+    while len(forwarded) < MESSAGES:
+        await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+    for task in tasks:
+        task.cancel()
+    return MESSAGES / elapsed
+
+
+def main():
+    print(f"[benchmark_gossip_core] messages: {MESSAGES}, senders: "
+          f"{SENDERS}, subscribers: {SUBSCRIBERS}")
+    for core in ["locks", "actor"]:
+        rate = asyncio.run(measure(core))
+        print(f"[benchmark_gossip_core] {core:<6} {rate:>10,.0f} "
+              f"messages/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Microbenchmark of the PEER ANNOUNCE id cache.
+HOWTO:
+    Run this program. No running instance of gossip is required.
+
+Feeds 1M random 64 bit ids (with 10% duplicates) into Id_cache.check_and_add
+and into the previous Setqueue based lookup and insert, and prints ids/sec.
+Bloom_id_cache is run with a window of CAPACITY ids and BLOOM_FP_RATE. It
+is expected to be the slowest, it saves memory for large windows, not time.
+"""
+
+import queue
+from random import getrandbits, random
+import time
+import context
+from modules.id_cache import Id_cache, Bloom_id_cache
+
+IDS = 1000000
+CAPACITY = 50000
+BLOOM_FP_RATE = 0.001
+
+
+class Setqueue(queue.Queue):
+    """Dedup queue as used before Id_cache"""
+
+    def _init(self, maxsize):
+        self.queue = set()
+
+    def _put(self, item):
+        self.queue.add(item)
+
+    def _get(self):
+        return self.queue.pop()
+
+    def contains(self, item):
+        with self.mutex:
+            return item in self.queue
+
+
+def generate_ids():
+    """Returns IDS ids, every tenth id is a recently seen one"""
+    ids = []
+    for i in range(IDS):
+        if i > 10 and random() < 0.1:
+            ids.append(ids[-10])
+        else:
+            ids.append(getrandbits(64))
+    return ids
+
+
+def run_setqueue(ids):
+    cache = Setqueue(CAPACITY)
+    duplicates = 0
+    for id in ids:
+        if cache.contains(id):
+            duplicates += 1
+            continue
+        if cache.full():
+            cache.get()
+        cache.put(id)
+    return duplicates
+
+
+def run_id_cache(ids):
+    cache = Id_cache(CAPACITY)
+    check_and_add = cache.check_and_add
+    duplicates = 0
+    for id in ids:
+        if check_and_add(id):
+            duplicates += 1
+    return duplicates
+
+
+def run_bloom_id_cache(ids):
+    cache = Bloom_id_cache(CAPACITY, BLOOM_FP_RATE)
+    check_and_add = cache.check_and_add
+    duplicates = 0
+    for id in ids:
+        if check_and_add(id):
+            duplicates += 1
+    print(f"[benchmark_id_cache] {cache}")
+    return duplicates
+
+
+def main():
+    ids = generate_ids()
+    for (name, run) in [("Setqueue", run_setqueue),
+                        ("Id_cache", run_id_cache),
+                        ("Bloom", run_bloom_id_cache)]:
+        start = time.perf_counter()
+        duplicates = run(ids)
+        rate = IDS / (time.perf_counter() - start)
+        print(f"[benchmark_id_cache] {name:<9} {rate:>12,.0f} ids/sec, "
+              f"{duplicates} duplicates detected")
+
+
+if __name__ == "__main__":
+    main()
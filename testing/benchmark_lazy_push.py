@@ -0,0 +1,131 @@
+"""Benchmark of the bandwidth used by the dissemination modes (see config
+dissemination).
+HOWTO:
+    Run this program. No running instance of gossip is required.
+
+NODES gossip instances run in this process and are connected over loopback
+TCP connections, each node to DEGREE others. Every node has one api
+subscribed to DTYPE, which validates every notification. MESSAGES PEER
+ANNOUNCEs with PAYLOAD bytes of data are announced by random nodes.
+
+Measured are the bytes sent between the nodes until no messages are sent
+anymore, and the coverage (share of nodes that notified their api), with:
+- eager: PEER ANNOUNCEs are sent to all peers of the sample
+- lazy: PEER ANNOUNCEs are sent to eager_fanout peers of the sample, the
+  others get a PEER IHAVE and request the data with a PEER IWANT
+"""
+
+import asyncio
+import random
+import time
+import context
+from modules.gossip import Gossip
+from modules.peer_connection import Peer_connection
+from modules.peer_registry import PUSH
+from test_gossip import make_config
+
+NODES = 16
+DEGREE = 4
+MESSAGES = 50
+PAYLOAD = 32 * 1024
+DTYPE = 1
+EAGER_FANOUT = 1
+SEED = 1
+
+
+class Validating_api:
+    """API that records and validates every notification"""
+
+    def __init__(self, gossip, notified):
+        self.gossip = gossip
+        self.notified = notified
+
+    async def send_gossip_notification(self, msg_id, dtype, data,
+                                       header=None):
+        self.notified.add((self, bytes(data[:8])))
+        asyncio.create_task(
+            self.gossip.handle_gossip_validation(msg_id, True, self))
+        return True
+
+
+async def connect(first, second, lazy, peers):
+    """Connects two nodes over loopback and starts both Peer_connections.
+    The handshake is skipped, lazy push is enabled as if both nodes sent
+    PEER_FLAG_LAZY_PUSH"""
+    accepted = asyncio.get_running_loop().create_future()
+    server = await asyncio.start_server(
+        lambda reader, writer: accepted.set_result((reader, writer)),
+        "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    (reader, writer) = await asyncio.open_connection("127.0.0.1", port)
+    for (gossip, streams) in [(first, (reader, writer)),
+                              (second, await accepted)]:
+        peer = Peer_connection(*streams, gossip, validated_us=True,
+                               validated_them=True)
+        peer.lazy_push = lazy
+        gossip._Gossip__peers.add(peer, PUSH)
+        peers.append(peer)
+        asyncio.create_task(peer.run())
+    server.close()
+
+
+def get_sent_bytes(peers):
+    return sum(peer.get_send_statistics()["sent_bytes"] for peer in peers)
+
+
+async def measure(dissemination):
+    """Returns the sent bytes, coverage and seconds until quiescence"""
+    random.seed(SEED)
+    nodes = [Gossip(make_config(dissemination=dissemination, degree=DEGREE,
+                                eager_fanout=EAGER_FANOUT))
+             for _ in range(NODES)]
+    peers = []
+    # A ring keeps the network connected, random chords add the other links
+    links = {(i, (i + 1) % NODES) for i in range(NODES)}
+    for i in range(NODES):
+        while sum(i in link for link in links) < DEGREE:
+            j = random.randrange(NODES)
+            if i != j and (i, j) not in links and (j, i) not in links:
+                links.add((i, j))
+    for (i, j) in sorted(links):
+        await connect(nodes[i], nodes[j], dissemination == "lazy", peers)
+
+    notified = set()
+    for gossip in nodes:
+        await gossip.add_subscriber(DTYPE, Validating_api(gossip, notified))
+
+    start = time.perf_counter()
+    for index in range(MESSAGES):
+        # The first bytes identify the message for the coverage
+        data = index.to_bytes(8, "big") + bytes(PAYLOAD - 8)
+        await random.choice(nodes).handle_gossip_announce(0, DTYPE, data)
+
+    # Wait until no more bytes are sent
+    sent = -1
+    while sent != get_sent_bytes(peers):
+        sent = get_sent_bytes(peers)
+        await asyncio.sleep(0.2)
+    elapsed = time.perf_counter() - start - 0.2
+    for peer in peers:
+        await peer.close()
+    coverage = len(notified) / ((NODES - 1) * MESSAGES)
+    return (sent, coverage, elapsed)
+
+
+def main():
+    print(f"[benchmark_lazy_push] nodes: {NODES}, degree: {DEGREE}, "
+          f"messages: {MESSAGES}, payload: {PAYLOAD} bytes, eager_fanout: "
+          f"{EAGER_FANOUT}")
+    results = {}
+    for dissemination in ["eager", "lazy"]:
+        (sent, coverage, elapsed) = asyncio.run(measure(dissemination))
+        results[dissemination] = sent
+        print(f"[benchmark_lazy_push] {dissemination:<5} "
+              f"{sent / 2**20:>8.1f} MiB sent, coverage: {coverage:.1%}, "
+              f"{elapsed:.2f}s")
+    saved = 1 - results["lazy"] / results["eager"]
+    print(f"[benchmark_lazy_push] lazy push saved {saved:.1%} of the bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Benchmark of the peer transports (config option peer_transport).
+HOWTO:
+    Run this program. No running instance of gossip is required.
+
+For both transports this program measures
+- the memory per idle connection: CONNECTIONS loopback connections are
+  opened and the memory allocated for them (both ends) is measured with
+  tracemalloc
+- the cpu time per message: MESSAGES small PEER ANNOUNCEs are sent over a
+  single connection and the process time until all are handled is measured.
+  Messages are written in batches of 1000 (many messages per read) and one
+  by one (about one message per read)
+
+The stream transport is measured with the same read loop as
+Peer_connection.run (one task per connection), the protocol transport with
+Peer_protocol.
+"""
+
+import asyncio
+import time
+import tracemalloc
+from types import SimpleNamespace
+import context
+from modules.packet_parser import READ_SIZE, Frame_decoder, pack_peer_announce
+from modules.peer_protocol import Peer_protocol, open_peer_protocol_connection
+
+CONNECTIONS = 500
+MESSAGES = 200000
+
+
+class Counting_peer:
+    """Stands in for Peer_connection, counts handled messages"""
+
+    def __init__(self, expected=None):
+        self.count = 0
+        self.expected = expected
+        self.done = asyncio.Event()
+        self.gossip = SimpleNamespace(close_peer=self.close_peer)
+
+    async def close_peer(self, peer):
+        return
+
+    async def handle_message(self, buf):
+        self.count += 1
+        if self.count == self.expected:
+            self.done.set()
+
+    async def run_stream(self, reader):
+        """Read loop of Peer_connection.run"""
+        decoder = Frame_decoder()
+        while True:
+            chunk = await reader.read(READ_SIZE)
+            if len(chunk) == 0:
+                return
+            for frame in decoder.feed(chunk):
+                await self.handle_message(frame)
+
+
+async def start_stream_server(peers):
+    async def on_connection(reader, writer):
+        peer = peers.pop(0) if len(peers) > 0 else Counting_peer()
+        asyncio.create_task(peer.run_stream(reader))
+    return await asyncio.start_server(on_connection, "127.0.0.1", 0)
+
+
+async def start_protocol_server(peers):
+    async def on_connection(reader, protocol):
+        peer = peers.pop(0) if len(peers) > 0 else Counting_peer()
+        protocol.attach(peer)
+    return await asyncio.get_running_loop().create_server(
+        lambda: Peer_protocol(on_connection), "127.0.0.1", 0)
+
+
+async def open_stream(port):
+    (reader, writer) = await asyncio.open_connection("127.0.0.1", port)
+    asyncio.create_task(Counting_peer().run_stream(reader))
+    return writer
+
+
+async def open_protocol(port):
+    (_, protocol) = await open_peer_protocol_connection("127.0.0.1", port)
+    protocol.attach(Counting_peer())
+    return protocol
+
+
+async def measure_idle_memory(start_server, open_client):
+    server = await start_server([])
+    port = server.sockets[0].getsockname()[1]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    clients = [await open_client(port) for _ in range(CONNECTIONS)]
+    await asyncio.sleep(0.5)
+    per_connection = ((tracemalloc.get_traced_memory()[0] - before)
+                      / CONNECTIONS)
+    tracemalloc.stop()
+    for client in clients:
+        client.close()
+    server.close()
+    await asyncio.sleep(0.2)
+    return per_connection
+
+
+async def measure_cpu_per_message(start_server, open_client, batch):
+    messages = MESSAGES if batch > 1 else MESSAGES // 10
+    peer = Counting_peer(messages)
+    server = await start_server([peer])
+    port = server.sockets[0].getsockname()[1]
+    client = await open_client(port)
+    packets = [pack_peer_announce(i, 1, 1, bytes(32))
+               for i in range(messages)]
+    start = time.process_time()
+    for i in range(0, messages, batch):
+        client.writelines(packets[i:i + batch])
+        await client.drain()
+        if batch == 1:
+            # Give the receiver the chance to read every message
+            await asyncio.sleep(0)
+    await peer.done.wait()
+    per_message = (time.process_time() - start) / messages
+    client.close()
+    server.close()
+    return per_message
+
+
+async def main():
+    for (name, start_server, open_client) in [
+            ("stream", start_stream_server, open_stream),
+            ("protocol", start_protocol_server, open_protocol)]:
+        memory = await measure_idle_memory(start_server, open_client)
+        batched = await measure_cpu_per_message(start_server, open_client,
+                                                1000)
+        single = await measure_cpu_per_message(start_server, open_client, 1)
+        print(f"[benchmark_peer_transport] {name:<9} "
+              f"{memory:>8,.0f} bytes per idle connection, cpu per message: "
+              f"{batched * 1e6:>5.2f} us (batched), "
+              f"{single * 1e6:>5.2f} us (one by one)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
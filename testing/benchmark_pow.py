@@ -0,0 +1,55 @@
+"""Benchmark of the nonce search for peer challenges.
+HOWTO:
+    Run this program. No running instance of gossip is required.
+
+Compares the nonces/sec of the previous search (hash challenge + nonce from
+scratch and compare the hexdigest) with search_nonce_range (midstate copy,
+reused nonce buffer and raw digest check).
+"""
+
+import time
+import hashlib
+from random import getrandbits
+from context import util as util
+
+# Number of nonces to check per run
+NONCES = 500000
+RUNS = 3
+
+
+def hexdigest_search(challenge, start, stop):
+    """Nonce search as implemented before the midstate search"""
+    challenge = int(challenge).to_bytes(8, 'big')
+    for nonce in range(start, stop):
+        hash = hashlib.sha256(challenge + nonce.to_bytes(8, 'big'))
+        if hash.hexdigest()[:6] == '000000':
+            return nonce
+    return None
+
+
+def benchmark(name, search):
+    """Runs search RUNS times over NONCES nonces and prints the best rate"""
+    best = 0
+    for _ in range(RUNS):
+        challenge = getrandbits(64)
+        start = time.perf_counter()
+        # 2^64 difficulty is never reached, so all nonces are checked
+        search(challenge, 0, NONCES)
+        rate = NONCES / (time.perf_counter() - start)
+        best = max(best, rate)
+    print(f"[benchmark_pow] {name:<10} {best:>12,.0f} nonces/sec")
+    return best
+
+
+def main():
+    before = benchmark("hexdigest", hexdigest_search)
+    after = benchmark("midstate", lambda challenge, start, stop:
+                      util.search_nonce_range(challenge, start, stop, 32))
+    print(f"[benchmark_pow] speedup: {after / before:.2f}x")
+    expected = 2**(8 * util.POW_DIFFICULTY)
+    print(f"[benchmark_pow] expected time to solve a challenge: "
+          f"{expected / before:.1f}s before, {expected / after:.1f}s after")
+
+
+if __name__ == "__main__":
+    main()
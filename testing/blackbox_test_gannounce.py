@@ -40,7 +40,7 @@ async def test_gossip_announce():
                              pp.GOSSIP_NOTIFY, 0, 1))
 
     # Connect peers, perform handshake
-    print("Connecting peers, performing Handshake by waiting for intervall..")
+    print("Connecting peers, performing Handshake..")
     peer.connect(('127.0.0.1', 6001))
     task_handshake = asyncio.create_task(perform_handshake(peer, 6001))
 
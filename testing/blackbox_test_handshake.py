@@ -2,7 +2,8 @@
 HOWTO:
     1. Run the main.py on the default port.
     2. Run this program
-    3. Be patient after PEER INFO, we have to wait for the interval (see doc)
+    3. Be patient after PEER INFO, the challenge is sent right away, but
+       solving it takes a few seconds
 
 This program is a mock peer that tries to perform the handshake.
 """
@@ -25,9 +26,7 @@ async def test_handshake():
     peer.connect(('127.0.0.1', 6001))
     print("[test_handshake] Sending mock peers PEER INFO")
     peer.send(pp.pack_peer_info(6300))
-    print("[test_handshake] Waiting for the PEER CHALLENGE at the end of the "
-          +
-          "receivers interval...")
+    print("[test_handshake] Waiting for the PEER CHALLENGE...")
     buf = await await_message(peer)
     print("[test_handshake] Received PEER CHALLENGE")
     if len(buf) == int.from_bytes(buf[:2], "big"):
@@ -36,7 +36,7 @@ async def test_peer_announce():
                              pp.GOSSIP_NOTIFY, 0, 1))
 
     # Connect peers, perform handshake
-    print("Connecting peers, performing Handshake by waiting for intervall..")
+    print("Connecting peers, performing Handshake..")
     peer1.connect(('127.0.0.1', 6001))
     task_handshake1 = asyncio.create_task(perform_handshake(peer1, 6001))
     peer2.connect(('127.0.0.1', 6001))
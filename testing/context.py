@@ -1,10 +1,9 @@
 import os
 import sys
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
-                '../modules')))
-import packet_parser
-import util
-import util
+# Adds the repository root to the path. The modules are imported from the
+# modules package, so modules/util.py does not shadow testing/util.py
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
                 '..')))
-from config import Config
+from modules import packet_parser
+from modules import util
+from modules.config import Config
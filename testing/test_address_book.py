@@ -0,0 +1,131 @@
+import unittest
+import tempfile
+import os
+import context
+from modules.address_book import (
+    Address_book,
+    COMPACT_MIN_LINES,
+    FLUSH_DELAY
+)
+from modules.timer_wheel import Timer_wheel
+from test_timer_wheel import Fake_clock
+
+
+class Test_address_book(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000000
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "peers.jsonl")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def open(self, max_entries=10):
+        return Address_book(self.path, max_entries, clock=lambda: self.now)
+
+    def test_reload(self):
+        book = self.open()
+        book.record_success("127.0.0.1:6001", 0.01)
+        book.record_success("127.0.0.1:6002")
+        book.record_failure("127.0.0.1:6002")
+        # Unknown addresses are not added by failures
+        book.record_failure("127.0.0.1:6003")
+
+        loaded = self.open()
+        self.assertEqual(len(loaded), 2)
+        self.assertEqual(loaded.get_entry("127.0.0.1:6001"),
+                         {"last_seen": self.now, "rtt": 0.01, "failures": 0})
+        self.assertEqual(loaded.get_entry("127.0.0.1:6002")["failures"], 1)
+        self.assertNotIn("127.0.0.1:6003", loaded)
+
+    def test_score_order(self):
+        book = self.open()
+        book.record_success("old:1", 0.01)
+        self.now += 600
+        book.record_success("fast:1", 0.01)
+        book.record_success("slow:1", 0.5)
+        book.record_success("failed:1", 0.01)
+        book.record_failure("failed:1")
+        self.assertEqual(book.get_best(4),
+                         ["fast:1", "slow:1", "old:1", "failed:1"])
+        self.assertEqual(book.get_best(1), ["fast:1"])
+
+    def test_success_resets_failures(self):
+        book = self.open()
+        book.record_success("a:1", 0.1)
+        book.record_failure("a:1")
+        book.record_success("a:1", 0.2)
+        entry = book.get_entry("a:1")
+        self.assertEqual(entry["failures"], 0)
+        # The rtt is smoothed
+        self.assertAlmostEqual(entry["rtt"], 0.125)
+
+    def test_evict_lowest_score(self):
+        book = self.open(max_entries=2)
+        book.record_success("a:1")
+        book.record_success("b:1")
+        book.record_failure("b:1")
+        book.record_success("c:1")
+        self.assertEqual(sorted(book.get_best(3)), ["a:1", "c:1"])
+        # The eviction is persisted
+        self.assertEqual(sorted(self.open(max_entries=2).get_best(3)),
+                         ["a:1", "c:1"])
+
+    def test_evict_after_updates(self):
+        # Outdated scores of updated entries are not used for evictions
+        book = self.open(max_entries=3)
+        for address in ["a:1", "b:1", "c:1"]:
+            book.record_success(address)
+            self.now += 1
+        # a is now the newest, b has the lowest score
+        book.record_success("a:1")
+        for _ in range(10):
+            book.record_failure("c:1")
+        book.record_success("c:1")
+        book.record_success("d:1")
+        self.assertEqual(sorted(book.get_best(4)), ["a:1", "c:1", "d:1"])
+        book.record_failure("a:1")
+        book.record_success("e:1")
+        self.assertEqual(sorted(book.get_best(4)), ["c:1", "d:1", "e:1"])
+
+    def test_delayed_flush(self):
+        # With a timer wheel, changes are written together after FLUSH_DELAY
+        clock = Fake_clock()
+        wheel = Timer_wheel(resolution=1, clock=clock)
+        book = Address_book(self.path, 10, clock=lambda: self.now,
+                            timer_wheel=wheel)
+        book.record_success("a:1")
+        book.record_success("b:1")
+        book.record_failure("a:1")
+        self.assertFalse(os.path.exists(self.path))
+        clock.now += FLUSH_DELAY
+        wheel.advance()
+        with open(self.path) as f:
+            self.assertEqual(len(f.readlines()), 2)
+        self.assertEqual(self.open().get_entry("a:1")["failures"], 1)
+
+    def test_compaction(self):
+        book = self.open()
+        for _ in range(COMPACT_MIN_LINES * 2):
+            book.record_success("a:1")
+        with open(self.path) as f:
+            lines = len(f.readlines())
+        self.assertLessEqual(lines, COMPACT_MIN_LINES)
+        self.assertEqual(self.open().get_best(2), ["a:1"])
+
+    def test_invalid_lines_are_skipped(self):
+        book = self.open()
+        book.record_success("a:1")
+        with open(self.path, "a") as f:
+            f.write('[1, 2]\n{"address": "b:1", "last_se')
+        self.assertEqual(self.open().get_best(2), ["a:1"])
+
+    def test_in_memory(self):
+        book = Address_book("", 10)
+        book.record_success("a:1")
+        self.assertEqual(book.get_best(1), ["a:1"])
+        self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,209 @@
+import unittest
+import context
+from modules.timer_wheel import Timer_wheel
+from modules.announce_store import (
+    Announce_store,
+    ENTRY_OVERHEAD,
+    Validation_policy,
+    parse_validation_policies
+)
+
+
+class Fake_clock:
+    """Clock that only advances when set"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Test_announce_store(unittest.TestCase):
+    def setUp(self):
+        self.clock = Fake_clock()
+        self.wheel = Timer_wheel(resolution=1, clock=self.clock)
+
+    def __store(self, max_bytes=10000, max_age=60, policy="oldest",
+                validation_policies=None, on_timeout=None):
+        return Announce_store(self.wheel, max_bytes, max_age, policy,
+                              validation_policies, on_timeout)
+
+    def test_validate(self):
+        # The announce is returned after the last validator validated it
+        store = self.__store()
+        msg_id = store.add(2**60, 5, 1, b"data", "peer", ["api_1", "api_2"])
+        self.assertTrue(msg_id < 2**16)
+        self.assertIn(2**60, store)
+        self.assertIsNone(store.validate(msg_id, "api_1"))
+        # Validating twice or by a non validator does nothing
+        self.assertIsNone(store.validate(msg_id, "api_1"))
+        self.assertIsNone(store.validate(msg_id, "api_3"))
+        self.assertEqual(store.validate(msg_id, "api_2"),
+                         (2**60, 5, 1, b"data", "peer"))
+        self.assertEqual(len(store), 0)
+        self.assertEqual(store.get_statistics()["forwarded"], 1)
+        self.assertEqual(store.get_statistics()["bytes"], 0)
+
+    def test_reject(self):
+        store = self.__store()
+        msg_id = store.add(1, 5, 1, b"data", "peer", ["api_1"])
+        store.reject(msg_id)
+        self.assertIsNone(store.validate(msg_id, "api_1"))
+        self.assertEqual(store.get_statistics()["rejected"], 1)
+
+    def test_duplicate_packet_id(self):
+        # The id cache can forget a packet id while its announce is stored
+        store = self.__store()
+        msg_id = store.add(7, 5, 1, b"data", "peer", ["api_1"])
+        self.assertIsNone(store.add(7, 5, 1, b"data", "peer", ["api_1"]))
+        self.assertEqual(len(store), 1)
+        self.assertEqual(store.get_statistics()["duplicates"], 1)
+        self.assertEqual(store.validate(msg_id, "api_1"),
+                         (7, 5, 1, b"data", "peer"))
+        self.assertNotIn(7, store)
+
+    def test_unique_notification_ids(self):
+        store = self.__store(max_bytes=2**30)
+        ids = [store.add(i, 5, 1, b"", "peer", ["api"]) for i in range(1000)]
+        self.assertEqual(len(set(ids)), 1000)
+        self.assertNotIn(store.next_notification_id(), ids)
+
+    def test_expire(self):
+        # Announces are dropped after max_age
+        store = self.__store(max_age=10)
+        msg_id = store.add(1, 5, 1, b"data", "peer", ["api_1"])
+        self.clock.now = 5
+        self.wheel.advance()
+        self.assertEqual(len(store), 1)
+        self.clock.now = 11
+        self.wheel.advance()
+        self.assertEqual(len(store), 0)
+        self.assertIsNone(store.validate(msg_id, "api_1"))
+        self.assertEqual(store.get_statistics()["expired"], 1)
+
+    def test_evict_oldest(self):
+        # The oldest announces are evicted to stay within the budget
+        store = self.__store(max_bytes=3 * (ENTRY_OVERHEAD + 10))
+        ids = [store.add(i, 5, 1, bytes(10), "peer", ["api"])
+               for i in range(5)]
+        self.assertEqual(len(store), 3)
+        self.assertNotIn(0, store)
+        self.assertNotIn(1, store)
+        self.assertIn(4, store)
+        self.assertEqual(store.get_statistics()["evicted"], 2)
+        self.assertEqual(store.get_statistics()["bytes"],
+                         3 * (ENTRY_OVERHEAD + 10))
+        self.assertIsNotNone(store.validate(ids[4], "api"))
+
+    def test_reject_policy(self):
+        # New announces are dropped if the store is full
+        store = self.__store(max_bytes=2 * (ENTRY_OVERHEAD + 10),
+                             policy="reject")
+        ids = [store.add(i, 5, 1, bytes(10), "peer", ["api"])
+               for i in range(3)]
+        self.assertIsNone(ids[2])
+        self.assertIn(0, store)
+        self.assertNotIn(2, store)
+        self.assertEqual(store.get_statistics()["rejected"], 1)
+
+    def test_remove_api(self):
+        # Announces validated by all remaining validators are completed,
+        # announces nobody validated are dropped
+        store = self.__store()
+        store.add(1, 5, 1, b"a", "peer", ["api_1"])
+        msg_id = store.add(2, 5, 1, b"b", "peer", ["api_1", "api_2"])
+        validated = store.add(3, 5, 1, b"c", "peer", ["api_1", "api_2"])
+        store.validate(validated, "api_2")
+        completed = store.remove_api("api_1")
+        self.assertEqual(completed, [(3, 5, 1, b"c", "peer")])
+        self.assertNotIn(1, store)
+        self.assertEqual(len(store), 1)
+        self.assertEqual(store.get_statistics()["abandoned"], 1)
+        self.assertEqual(store.validate(msg_id, "api_2"),
+                         (2, 5, 1, b"b", "peer"))
+        # The last validator leaves without validating
+        msg_id = store.add(4, 5, 1, b"d", "peer", ["api_2"])
+        self.assertEqual(store.remove_api("api_2"), [])
+        self.assertEqual(len(store), 0)
+
+
+class Test_validation_policies(unittest.TestCase):
+    def setUp(self):
+        self.clock = Fake_clock()
+        self.wheel = Timer_wheel(resolution=1, clock=self.clock)
+        self.timed_out = []
+        self.store = Announce_store(
+            self.wheel, 10000, 60, "oldest",
+            parse_validation_policies("1=all, 2=quorum:2, 3=timeout:5"),
+            self.timed_out.append)
+
+    def test_parse(self):
+        self.assertEqual(parse_validation_policies(" 4 = quorum:3,"),
+                         {4: Validation_policy("quorum", 3)})
+        self.assertEqual(self.store.get_validation_policy(9),
+                         Validation_policy("all", None))
+        for text in ["1=any", "1=quorum", "x=all", "1=timeout:x"]:
+            with self.assertRaises(ValueError):
+                parse_validation_policies(text)
+
+    def test_quorum(self):
+        # Forwarded after the second of three validations
+        msg_id = self.store.add(1, 5, 2, b"a", "peer", ["a", "b", "c"])
+        self.assertIsNone(self.store.validate(msg_id, "a"))
+        self.assertIsNone(self.store.validate(msg_id, "a"))
+        self.assertEqual(self.store.validate(msg_id, "c"),
+                         (1, 5, 2, b"a", "peer"))
+        self.assertIsNone(self.store.validate(msg_id, "b"))
+        self.assertEqual(len(self.store), 0)
+
+    def test_quorum_larger_than_validators(self):
+        msg_id = self.store.add(1, 5, 2, b"a", "peer", ["a"])
+        self.assertIsNotNone(self.store.validate(msg_id, "a"))
+
+    def test_quorum_remove_api(self):
+        # The quorum is still required after validators left. The announce
+        # is dropped once it can not be reached anymore
+        msg_id = self.store.add(1, 5, 2, b"a", "peer", ["a", "b", "c"])
+        self.store.validate(msg_id, "a")
+        self.assertEqual(self.store.remove_api("b"), [])
+        self.assertIn(1, self.store)
+        self.assertEqual(self.store.remove_api("c"), [])
+        self.assertNotIn(1, self.store)
+        self.assertEqual(self.store.get_statistics()["abandoned"], 1)
+
+    def test_timeout_remove_api(self):
+        # Without validators the announce still waits for the timeout, since
+        # nobody rejected it
+        self.store.add(1, 5, 3, b"a", "peer", ["a", "b"])
+        self.assertEqual(self.store.remove_api("a"), [])
+        self.assertEqual(self.store.remove_api("b"), [])
+        self.assertIn(1, self.store)
+        self.clock.now = 6
+        self.wheel.advance()
+        self.assertEqual(self.timed_out, [(1, 5, 3, b"a", "peer")])
+        self.assertEqual(self.store.get_statistics()["abandoned"], 0)
+        self.assertEqual(self.store.get_statistics()["timeouts"], 1)
+
+    def test_timeout(self):
+        # Forwarded after the timeout unless rejected
+        self.store.add(1, 5, 3, b"a", "peer", ["a", "b"])
+        rejected = self.store.add(2, 5, 3, b"b", "peer", ["a", "b"])
+        self.store.reject(rejected)
+        self.clock.now = 6
+        self.wheel.advance()
+        self.assertEqual(self.timed_out, [(1, 5, 3, b"a", "peer")])
+        self.assertEqual(len(self.store), 0)
+        self.assertEqual(self.store.get_statistics()["timeouts"], 1)
+
+    def test_timeout_all_validated(self):
+        # All validations forward before the timeout
+        msg_id = self.store.add(1, 5, 3, b"a", "peer", ["a"])
+        self.assertIsNotNone(self.store.validate(msg_id, "a"))
+        self.clock.now = 6
+        self.wheel.advance()
+        self.assertEqual(self.timed_out, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
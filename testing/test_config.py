@@ -140,6 +140,99 @@ class Test_config(unittest.TestCase):
         generate_test_config(known_peers="127.0.0.1:1000, 127.0.0.1:1000")
         self.__check_raises_valid_exception(ValueError)
 
+    def test_invalid_pow_workers(self):
+        # Check if an ValueError is raised when pow_workers is negative
+        generate_test_config(pow_workers="-1")
+        self.__check_raises_valid_exception(ValueError)
+
+    def test_valid_pow_workers(self):
+        # Check if no Error is raised when pow_workers is 0 (one per core)
+        generate_test_config(pow_workers="0")
+        self.__check_raises_no_exception()
+
+        # Check if no Error is raised when pow_workers is positive
+        generate_test_config(pow_workers="4")
+        self.__check_raises_no_exception()
+
+    def test_invalid_pow_slices(self):
+        # Check if an ValueError is raised when pow_slices is negative
+        generate_test_config(pow_slices="-1")
+        self.__check_raises_valid_exception(ValueError)
+
+    def test_invalid_dedup_backend(self):
+        # Check if an ValueError is raised when dedup_backend is unknown
+        generate_test_config(dedup_backend="fuzzy")
+        self.__check_raises_valid_exception(ValueError)
+
+    def test_valid_dedup_backend(self):
+        # Check if no Error is raised when a known backend is given
+        generate_test_config(dedup_backend="bloom", bloom_fp_rate="0.01")
+        self.__check_raises_no_exception()
+
+    def test_gossip_core(self):
+        # Check if an ValueError is raised when gossip_core is unknown
+        generate_test_config(gossip_core="threads")
+        self.__check_raises_valid_exception(ValueError)
+        generate_test_config(gossip_core="actor")
+        self.__check_raises_no_exception()
+
+    def test_validation_policies(self):
+        # Check if an ValueError is raised when a validation policy is invalid
+        for policies in ["1=quorum:0", "70000=all", "1=timeout:-1",
+                         "1=first"]:
+            generate_test_config(validation_policies=policies)
+            self.__check_raises_valid_exception(ValueError)
+        generate_test_config(validation_policies="1=quorum:2, 2=timeout:0.5")
+        self.__check_raises_no_exception()
+
+    def test_datatype_weights(self):
+        # Check if an ValueError is raised when a datatype weight is invalid
+        for weights in ["1=0", "70000=2", "1=fast", "1=1.5"]:
+            generate_test_config(datatype_weights=weights)
+            self.__check_raises_valid_exception(ValueError)
+        generate_test_config(datatype_weights="1=4, 7=2")
+        self.__check_raises_no_exception()
+
+    def test_dissemination(self):
+        # Check if an ValueError is raised when dissemination is unknown or
+        # eager_fanout is negative
+        generate_test_config(dissemination="flood")
+        self.__check_raises_valid_exception(ValueError)
+        generate_test_config(dissemination="lazy", eager_fanout="-1")
+        self.__check_raises_valid_exception(ValueError)
+        generate_test_config(dissemination="lazy", eager_fanout="0")
+        self.__check_raises_no_exception()
+
+    def test_invalid_bloom_fp_rate(self):
+        # Check if an ValueError is raised when bloom_fp_rate is not in (0, 1)
+        generate_test_config(bloom_fp_rate="1")
+        self.__check_raises_valid_exception(ValueError)
+        generate_test_config(bloom_fp_rate="0")
+        self.__check_raises_valid_exception(ValueError)
+
+    def test_invalid_send_watermarks(self):
+        # Check if an ValueError is raised when the low watermark is not below
+        # the high watermark
+        generate_test_config(send_high_watermark="1000",
+                             send_low_watermark="1000")
+        self.__check_raises_valid_exception(ValueError)
+        generate_test_config(send_high_watermark="-1")
+        self.__check_raises_valid_exception(ValueError)
+
+    def test_valid_send_watermarks(self):
+        generate_test_config(send_high_watermark="1000",
+                             send_low_watermark="500")
+        self.__check_raises_no_exception()
+
+    def test_invalid_slow_consumer_policy(self):
+        # Check if an ValueError is raised when slow_consumer_policy is unknown
+        generate_test_config(slow_consumer_policy="block")
+        self.__check_raises_valid_exception(ValueError)
+
+    def test_valid_slow_consumer_policy(self):
+        generate_test_config(slow_consumer_policy="disconnect")
+        self.__check_raises_no_exception()
+
     def test_valid_known_peers(self):
         # Check if no Error is raised when the known_peers is a single space
         # -> is considert empty
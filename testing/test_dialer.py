@@ -0,0 +1,160 @@
+import unittest
+import asyncio
+import socket
+import context
+from modules.gossip import Gossip
+from modules.dialer import Dial_backoff
+from modules.peer_connection import peer_connection_factory
+from modules.peer_registry import PULL
+from test_gossip import make_config
+
+
+def unused_address():
+    """Returns an address nobody listens at"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"127.0.0.1:{sock.getsockname()[1]}"
+
+
+async def start_servers(count):
+    """Starts count servers that accept connections and never answer.
+    Returns (servers, addresses)"""
+    async def on_connection(reader, writer):
+        await reader.read()
+
+    servers = [await asyncio.start_server(on_connection, "127.0.0.1", 0)
+               for _ in range(count)]
+    addresses = [f"127.0.0.1:{server.sockets[0].getsockname()[1]}"
+                 for server in servers]
+    return (servers, addresses)
+
+
+async def wait_idle(dialer):
+    for _ in range(100):
+        if len(dialer.get_dialing()) == 0:
+            return
+        await asyncio.sleep(0.01)
+
+
+class Test_dialer(unittest.TestCase):
+    def test_offer_returns_immediately(self):
+        async def run():
+            gossip = Gossip(make_config())
+            (servers, addresses) = await start_servers(2)
+            await gossip.handle_peer_offer(addresses + [unused_address()])
+            # Nothing is connected yet, the dialer works in the background
+            self.assertEqual(gossip._Gossip__peers.count(PULL), 0)
+            self.assertEqual(len(gossip.dialer.get_dialing()), 3)
+            await wait_idle(gossip.dialer)
+            connected = await gossip.get_peer_addresses()
+            for server in servers:
+                server.close()
+            return (addresses, connected)
+
+        (addresses, connected) = asyncio.run(run())
+        self.assertEqual(sorted(connected), sorted(addresses))
+
+    def test_concurrency_limit(self):
+        async def run():
+            gossip = Gossip(make_config(dial_concurrency=2))
+            (servers, addresses) = await start_servers(5)
+            gossip.dialer.offer(addresses)
+            self.assertEqual(len(gossip.dialer.get_dialing()), 2)
+            self.assertEqual(len(gossip.dialer.get_candidates()), 3)
+            await wait_idle(gossip.dialer)
+            connected = await gossip.get_peer_addresses()
+            for server in servers:
+                server.close()
+            return connected
+
+        self.assertEqual(len(asyncio.run(run())), 5)
+
+    def test_pull_peer_capacity(self):
+        # Only as many peers as missing pull peers are dialed
+        async def run():
+            gossip = Gossip(make_config(max_connections=4))
+            (servers, addresses) = await start_servers(4)
+            gossip.dialer.offer(addresses)
+            self.assertEqual(len(gossip.dialer.get_dialing()), 2)
+            await wait_idle(gossip.dialer)
+            connected = await gossip.get_peer_addresses()
+            for server in servers:
+                server.close()
+            return connected
+
+        self.assertEqual(len(asyncio.run(run())), 2)
+
+    def test_already_connected_address(self):
+        # An address connected while dialing it again is not added twice
+        async def run():
+            gossip = Gossip(make_config())
+            (servers, addresses) = await start_servers(1)
+            peers = []
+            for _ in range(2):
+                peers += await peer_connection_factory(addresses, gossip, 6001)
+            added = [await gossip.add_pull_peer(peer) for peer in peers]
+            connected = await gossip.get_peer_addresses()
+            await peers[0].close()
+            servers[0].close()
+            return (added, connected, addresses)
+
+        (added, connected, addresses) = asyncio.run(run())
+        self.assertEqual(added, [True, False])
+        self.assertEqual(connected, addresses)
+
+    def test_failed_address_is_backed_off(self):
+        async def run():
+            gossip = Gossip(make_config())
+            address = unused_address()
+            await gossip.handle_peer_offer([address])
+            await wait_idle(gossip.dialer)
+            self.assertTrue(gossip.dial_backoff.is_blocked(address))
+            # Offered again, the address is skipped
+            await gossip.handle_peer_offer([address])
+            return gossip
+
+        gossip = asyncio.run(run())
+        self.assertEqual(gossip.dialer.get_dialing(), [])
+        self.assertEqual(gossip.metrics.get("peer_connect_failures"), 1)
+
+
+class Test_dial_backoff(unittest.TestCase):
+    def setUp(self):
+        self.now = 0
+        self.backoff = Dial_backoff(10, 100, max_entries=3,
+                                    clock=lambda: self.now,
+                                    random=lambda: 0)
+
+    def test_exponential(self):
+        delays = [self.backoff.record_failure("a:1") for _ in range(6)]
+        self.assertEqual(delays, [10, 20, 40, 80, 100, 100])
+        self.assertEqual(self.backoff.get_failures("a:1"), 6)
+
+    def test_blocked_until_delay_expired(self):
+        self.backoff.record_failure("a:1")
+        self.assertEqual(self.backoff.filter(["a:1", "b:2"]), ["b:2"])
+        self.now = 10
+        self.assertFalse(self.backoff.is_blocked("a:1"))
+        # The next failure doubles the delay
+        self.assertEqual(self.backoff.record_failure("a:1"), 20)
+
+    def test_success_resets(self):
+        self.backoff.record_failure("a:1")
+        self.backoff.record_success("a:1")
+        self.assertFalse(self.backoff.is_blocked("a:1"))
+        self.assertEqual(self.backoff.record_failure("a:1"), 10)
+
+    def test_jitter(self):
+        backoff = Dial_backoff(10, 100, random=lambda: 0.999)
+        self.assertAlmostEqual(backoff.record_failure("a:1"), 5, places=1)
+
+    def test_bounded(self):
+        for port in range(5):
+            self.backoff.record_failure(f"a:{port}")
+        self.assertEqual(len(self.backoff), 3)
+        self.assertFalse(self.backoff.is_blocked("a:0"))
+        self.assertTrue(self.backoff.is_blocked("a:4"))
+
+
+if __name__ == "__main__":
+    unittest.main()
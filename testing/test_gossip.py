@@ -0,0 +1,178 @@
+import unittest
+from unittest import mock
+import asyncio
+from util import delete_file, generate_test_config
+from context import Config
+from modules.gossip import Gossip
+from modules.packet_parser import pack_peer_announce_header
+from modules.peer_registry import PUSH
+from modules.send_queue import Send_queue
+from test_send_queue import Fake_writer
+
+TEST_CONFIG = "autogen_gossip_testconfig.ini"
+
+
+def make_config(**kwargs):
+    """Returns a Config parsed from generate_test_config, so all other
+    variables have their defaults. The given keyword arguments replace the
+    parsed values after the checks"""
+    generate_test_config(TEST_CONFIG, pow_workers="1", pow_slices="1")
+    try:
+        config = Config(TEST_CONFIG)
+    finally:
+        delete_file(TEST_CONFIG)
+    for key in kwargs:
+        setattr(config, key, kwargs[key])
+    return config
+
+
+class Fake_peer:
+    """Peer that queues PEER ANNOUNCEs in a Send_queue like Peer_connection
+    and records the queued ids. The writer of a stalled peer never drains,
+    congested peers drop all PEER ANNOUNCEs"""
+
+    def __init__(self, stalled=False, congested=False):
+        self.writer = Fake_writer()
+        if stalled:
+            self.writer.blocked.clear()
+        self.send_queue = Send_queue(
+            self.writer, self, high_watermark=0 if congested else None,
+            policy="drop_new")
+        self.received = []
+
+    def is_fully_validated(self):
+        return True
+
+    def get_peer_p2p_listening_address(self):
+        return None
+
+    async def send_peer_announce(self, id, ttl, data_type, data,
+                                 header=None):
+        if header is None:
+            header = pack_peer_announce_header(id, ttl, data_type, len(data))
+        if not self.send_queue.put(header, data, datatype=data_type):
+            return False
+        self.received.append(id)
+        return True
+
+
+class Fake_api:
+    """API that records GOSSIP NOTIFICATIONs"""
+
+    def __init__(self):
+        self.notifications = []
+        self.closed = False
+
+    async def send_gossip_notification(self, msg_id, dtype, data,
+                                       header=None):
+        self.notifications.append((msg_id, dtype, bytes(data)))
+        return True
+
+    async def close(self):
+        self.closed = True
+
+
+class Test_gossip_fan_out(unittest.TestCase):
+    def test_stalled_peer_does_not_block(self):
+        # A stalled peer must neither delay the other peers nor the caller,
+        # its PEER ANNOUNCE waits in its send queue
+        async def run():
+            gossip = Gossip(make_config())
+            stalled = Fake_peer(stalled=True)
+            fast = [Fake_peer() for _ in range(5)]
+            for peer in [stalled] + fast:
+                gossip._Gossip__peers.add(peer, PUSH)
+            await asyncio.wait_for(gossip.handle_gossip_announce(4, 1,
+                                                                 b"data"), 1)
+            for peer in fast:
+                await asyncio.wait_for(peer.send_queue.flush(), 1)
+            return (gossip, stalled, fast)
+
+        (gossip, stalled, fast) = asyncio.run(run())
+        for peer in fast:
+            self.assertEqual(len(peer.received), 1)
+            self.assertEqual(peer.writer.drained, len(peer.writer.data))
+        statistics = stalled.send_queue.get_statistics()
+        self.assertEqual(statistics["sent_frames"], 1)
+        self.assertGreater(statistics["bytes_in_flight"], 0)
+        self.assertEqual(gossip.metrics.get("peer_announces_sent"), 6)
+
+    def test_congested_peer_is_counted(self):
+        async def run():
+            gossip = Gossip(make_config())
+            congested = Fake_peer(congested=True)
+            peers = [congested] + [Fake_peer() for _ in range(3)]
+            for peer in peers:
+                gossip._Gossip__peers.add(peer, PUSH)
+            await gossip.handle_gossip_announce(4, 1, b"data")
+            return gossip
+
+        gossip = asyncio.run(run())
+        self.assertEqual(gossip.metrics.get("peer_announces_sent"), 3)
+        self.assertEqual(gossip.metrics.get("peer_announces_dropped"), 1)
+
+
+class Test_gossip_delivery(unittest.TestCase):
+    def test_last_hop_is_delivered(self):
+        # PEER ANNOUNCEs with ttl 1 are notified, but never forwarded
+        async def run():
+            gossip = Gossip(make_config())
+            peer = Fake_peer()
+            gossip._Gossip__peers.add(peer, PUSH)
+            api = Fake_api()
+            await gossip.add_subscriber(1, api)
+            # Subscribing twice does not duplicate notifications
+            await gossip.add_subscriber(1, api)
+            await gossip.handle_peer_announce(7, 1, 1, b"data", Fake_peer())
+            msg_id = api.notifications[0][0]
+            await gossip.handle_gossip_validation(msg_id, True, api)
+            return (api, peer)
+
+        (api, peer) = asyncio.run(run())
+        self.assertEqual(len(api.notifications), 1)
+        self.assertEqual(api.notifications[0][1:], (1, b"data"))
+        self.assertEqual(peer.received, [])
+
+    def test_last_hop_without_notification_id(self):
+        # If all notification ids are used by stored announces, the last hop
+        # is dropped and counted
+        async def run(core):
+            gossip = Gossip(make_config(gossip_core=core))
+            api = Fake_api()
+            await gossip.add_subscriber(1, api)
+            with mock.patch.object(gossip._Gossip__announces_to_verify,
+                                   "next_notification_id",
+                                   return_value=None):
+                await gossip.handle_peer_announce(7, 1, 1, b"data",
+                                                  Fake_peer())
+                if core == "actor":
+                    await gossip._Gossip__core.flush()
+            return (gossip, api)
+
+        for core in ["locks", "actor"]:
+            (gossip, api) = asyncio.run(run(core))
+            self.assertEqual(api.notifications, [])
+            self.assertEqual(
+                gossip.metrics.get("last_hop_announces_dropped"), 1)
+
+
+class Test_gossip_close(unittest.TestCase):
+    def test_run_closes_on_cancel(self):
+        # The pow solver and the actor are stopped when run is cancelled
+        async def run():
+            gossip = Gossip(make_config(gossip_core="actor"))
+            await gossip._Gossip__core.flush()
+            solver = gossip.pow_solver
+            with mock.patch.object(solver, "shutdown") as shutdown, \
+                    mock.patch.object(gossip, "_Gossip__run",
+                                      side_effect=asyncio.CancelledError):
+                with self.assertRaises(asyncio.CancelledError):
+                    await gossip.run()
+            self.assertEqual(shutdown.call_count, 1)
+            self.assertIsNone(gossip._Gossip__core._Gossip_actor__task)
+
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+import unittest
+import asyncio
+import time
+import context
+from modules.announce_store import parse_validation_policies
+from modules.gossip import Gossip
+from modules.peer_registry import PUSH
+from test_gossip import make_config, Fake_peer, Fake_api
+
+
+async def drain(gossip):
+    """Waits until the actor of gossip processed all commands"""
+    await gossip._Gossip__core.flush()
+
+
+class Test_gossip_actor(unittest.TestCase):
+    def setUp(self):
+        self.sender = Fake_peer()
+        self.peers = [Fake_peer() for _ in range(3)]
+        self.apis = [Fake_api(), Fake_api()]
+
+    async def start(self, **kwargs):
+        gossip = Gossip(make_config(gossip_core="actor", **kwargs))
+        for peer in [self.sender] + self.peers:
+            gossip._Gossip__peers.add(peer, PUSH)
+        for api in self.apis:
+            await gossip.add_subscriber(1, api)
+        return gossip
+
+    def test_forward_after_all_validations(self):
+        async def run():
+            gossip = await self.start()
+            await gossip.handle_peer_announce(42, 5, 1, b"data", self.sender)
+            # Duplicates are dropped
+            await gossip.handle_peer_announce(42, 5, 1, b"data", self.sender)
+            await drain(gossip)
+            msg_id = self.apis[0].notifications[0][0]
+            await gossip.handle_gossip_validation(msg_id, True, self.apis[0])
+            await drain(gossip)
+            self.assertEqual(sum(len(p.received) for p in self.peers), 0)
+            await gossip.handle_gossip_validation(msg_id, True, self.apis[1])
+            await drain(gossip)
+
+        asyncio.run(run())
+        for api in self.apis:
+            self.assertEqual(len(api.notifications), 1)
+        for peer in self.peers:
+            self.assertEqual(peer.received, [42])
+        self.assertEqual(self.sender.received, [])
+
+    def test_rejected_and_last_hop(self):
+        async def run():
+            gossip = await self.start()
+            await gossip.handle_peer_announce(1, 5, 1, b"data", self.sender)
+            # ttl 1: notify only, never forwarded
+            await gossip.handle_peer_announce(2, 1, 1, b"data", self.sender)
+            # No subscribers: dropped
+            await gossip.handle_peer_announce(3, 5, 2, b"data", self.sender)
+            await drain(gossip)
+            for (msg_id, _, _) in self.apis[0].notifications:
+                await gossip.handle_gossip_validation(msg_id, False,
+                                                      self.apis[0])
+            for (msg_id, _, _) in self.apis[1].notifications:
+                await gossip.handle_gossip_validation(msg_id, True,
+                                                      self.apis[1])
+            await drain(gossip)
+
+        asyncio.run(run())
+        self.assertEqual(len(self.apis[0].notifications), 2)
+        for peer in self.peers:
+            self.assertEqual(peer.received, [])
+
+    def test_close_api_completes_validation(self):
+        async def run():
+            gossip = await self.start()
+            await gossip.handle_peer_announce(42, 5, 1, b"data", self.sender)
+            await drain(gossip)
+            msg_id = self.apis[0].notifications[0][0]
+            await gossip.handle_gossip_validation(msg_id, True, self.apis[0])
+            # Returns after the api was removed from the actor
+            await gossip.close_api(self.apis[1])
+            await gossip.handle_peer_announce(43, 5, 1, b"data", self.sender)
+            await drain(gossip)
+
+        asyncio.run(run())
+        self.assertTrue(self.apis[1].closed)
+        self.assertEqual(len(self.apis[1].notifications), 1)
+        self.assertEqual(len(self.apis[0].notifications), 2)
+        for peer in self.peers:
+            self.assertEqual(peer.received, [42])
+
+    def test_validation_timeout_in_actor(self):
+        # The deadline of the validation policy timeout is run by the actor
+        async def run():
+            gossip = await self.start(
+                validation_policies=parse_validation_policies("1=timeout:1"))
+            await gossip.handle_peer_announce(42, 5, 1, b"data", self.sender)
+            await drain(gossip)
+            gossip.timer_wheel.advance(time.monotonic() + 2)
+            # The expired timer queues its command in a task
+            await asyncio.sleep(0)
+            await drain(gossip)
+
+        asyncio.run(run())
+        for peer in self.peers:
+            self.assertEqual(peer.received, [42])
+
+    def test_rejected_after_deadline_expired(self):
+        # A rejection processed before the command of the expired deadline
+        # cancels it
+        async def run():
+            gossip = await self.start(
+                validation_policies=parse_validation_policies("1=timeout:1"))
+            await gossip.handle_peer_announce(42, 5, 1, b"data", self.sender)
+            await drain(gossip)
+            gossip.timer_wheel.advance(time.monotonic() + 2)
+            msg_id = self.apis[0].notifications[0][0]
+            await gossip.handle_gossip_validation(msg_id, False, self.apis[0])
+            await asyncio.sleep(0)
+            await drain(gossip)
+
+        asyncio.run(run())
+        for peer in self.peers:
+            self.assertEqual(peer.received, [])
+
+    def test_debug_log_of_actor_state(self):
+        # The subscribers are logged by the actor, which owns them
+        async def run():
+            gossip = await self.start()
+            with self.assertLogs(level="DEBUG") as logs:
+                await gossip.log_gossip_debug()
+            return logs.output
+
+        output = [line for line in asyncio.run(run())
+                  if "current subscribers" in line]
+        self.assertEqual(len(output), 1)
+        self.assertIn(repr(self.apis[0]), output[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+import context
+from random import getrandbits
+from modules.id_cache import Id_cache, Bloom_id_cache
+
+
+class Test_id_cache(unittest.TestCase):
+    def test_check_and_add(self):
+        cache = Id_cache(10)
+        self.assertFalse(cache.check_and_add(1))
+        self.assertTrue(cache.check_and_add(1))
+        self.assertIn(1, cache)
+        self.assertNotIn(2, cache)
+        self.assertEqual(len(cache), 1)
+
+    def test_fifo_eviction(self):
+        # The oldest ids are evicted first
+        cache = Id_cache(3)
+        for id in range(5):
+            cache.check_and_add(id)
+        self.assertEqual(len(cache), 3)
+        self.assertNotIn(0, cache)
+        self.assertNotIn(1, cache)
+        for id in range(2, 5):
+            self.assertIn(id, cache)
+        self.assertEqual(repr(cache), "[2, 3, 4]")
+
+    def test_duplicate_does_not_evict(self):
+        # Adding a known id must not evict another id
+        cache = Id_cache(2)
+        cache.check_and_add(1)
+        cache.check_and_add(2)
+        self.assertTrue(cache.check_and_add(1))
+        self.assertIn(2, cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_recent_id_survives(self):
+        # The most recent capacity ids are always known
+        cache = Id_cache(100)
+        for id in range(10000):
+            cache.check_and_add(id)
+            self.assertIn(id, cache)
+            if id >= 99:
+                self.assertIn(id - 99, cache)
+                self.assertNotIn(id - 100, cache)
+
+
+class Test_bloom_id_cache(unittest.TestCase):
+    def test_check_and_add(self):
+        cache = Bloom_id_cache(1000, 0.01)
+        self.assertFalse(cache.check_and_add(1))
+        self.assertTrue(cache.check_and_add(1))
+        self.assertIn(1, cache)
+        self.assertEqual(len(cache), 1)
+
+    def test_window_has_no_false_negatives(self):
+        # The last window added ids must always be known. Ids reported as
+        # known (false positives) are not added
+        cache = Bloom_id_cache(1000, 0.01)
+        ids = []
+        for _ in range(5000):
+            id = getrandbits(64)
+            if not cache.check_and_add(id):
+                ids.append(id)
+            self.assertIn(ids[max(0, len(ids) - 1000)], cache)
+        for id in ids[-1000:]:
+            self.assertIn(id, cache)
+
+    def test_old_ids_are_forgotten(self):
+        # Ids far outside the window are dropped with the old generations
+        cache = Bloom_id_cache(100, 0.001)
+        old = [getrandbits(64) for _ in range(100)]
+        for id in old:
+            cache.check_and_add(id)
+        for _ in range(1000):
+            cache.check_and_add(getrandbits(64))
+        known = sum(1 for id in old if id in cache)
+        self.assertLess(known, 10)
+
+    def test_fixed_memory(self):
+        # The memory used does not grow with the number of ids
+        cache = Bloom_id_cache(1000, 0.01)
+        size = cache.get_memory_size()
+        for _ in range(10000):
+            cache.check_and_add(getrandbits(64))
+        self.assertEqual(cache.get_memory_size(), size)
+
+    def test_fp_rate(self):
+        # The measured and estimated false positive rate stay near the target
+        cache = Bloom_id_cache(10000, 0.01)
+        for _ in range(20000):
+            cache.check_and_add(getrandbits(64))
+        false_positives = sum(1 for _ in range(20000)
+                              if getrandbits(64) in cache)
+        self.assertLess(false_positives / 20000, 0.02)
+        self.assertLess(cache.estimated_fp_rate(), 0.02)
+        self.assertGreater(cache.estimated_fp_rate(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+import unittest
+import asyncio
+import context
+from modules.lazy_push import Lazy_push
+from modules.metrics import Metrics
+from modules.timer_wheel import Timer_wheel
+from modules.gossip import Gossip
+from modules.peer_registry import PUSH
+from test_gossip import make_config, Fake_api
+from test_timer_wheel import Fake_clock
+
+
+class Lazy_peer:
+    """Peer that records PEER ANNOUNCEs, PEER IHAVEs and PEER IWANTs"""
+
+    def __init__(self, lazy_push=True):
+        self.lazy_push = lazy_push
+        self.received = []
+        self.ihaves = []
+        self.iwants = []
+
+    def is_fully_validated(self):
+        return True
+
+    def get_peer_p2p_listening_address(self):
+        return None
+
+    async def send_peer_announce(self, id, ttl, data_type, data,
+                                 header=None):
+        self.received.append(id)
+        return True
+
+    async def send_peer_ihave(self, id, ttl, data_type, message=None):
+        self.ihaves.append(id)
+        return True
+
+    async def send_peer_iwant(self, id):
+        self.iwants.append(id)
+
+
+class Test_lazy_push(unittest.TestCase):
+    def setUp(self):
+        self.clock = Fake_clock()
+        self.metrics = Metrics()
+        self.lazy_push = Lazy_push(
+            Timer_wheel(resolution=1, clock=self.clock), self.metrics,
+            eager_fanout=2, threshold=100, iwant_timeout=1)
+        self.wheel = self.lazy_push._Lazy_push__timer_wheel
+
+    def test_push_splits_sample(self):
+        peers = [Lazy_peer(False)] + [Lazy_peer() for _ in range(4)]
+
+        async def run():
+            small = await self.lazy_push.push(peers, 1, 5, 1, bytes(10))
+            eager = await self.lazy_push.push(peers, 2, 5, 1, bytes(100))
+            return (small, eager)
+
+        (small, eager) = asyncio.run(run())
+        self.assertEqual(small, peers)
+        # Peers without lazy push always get the full PEER ANNOUNCE
+        self.assertEqual(eager, peers[:2])
+        for peer in peers[2:]:
+            self.assertEqual(peer.ihaves, [2])
+        self.assertEqual(self.metrics.get("peer_ihaves_sent"), 3)
+
+    def test_iwant_is_served(self):
+        peer = Lazy_peer()
+
+        async def run():
+            await self.lazy_push.push([Lazy_peer(), Lazy_peer(), peer], 42,
+                                      5, 1, bytes(100))
+            await self.lazy_push.handle_iwant(42, peer)
+            await self.lazy_push.handle_iwant(43, peer)
+
+        asyncio.run(run())
+        self.assertEqual(peer.received, [42])
+        self.assertEqual(self.metrics.get("peer_iwants_served"), 1)
+        self.assertEqual(self.metrics.get("peer_iwant_misses"), 1)
+
+    def test_iwant_retries_next_peer(self):
+        peers = [Lazy_peer() for _ in range(3)]
+
+        async def run():
+            for peer in peers:
+                await self.lazy_push.handle_ihave(42, peer)
+            while len(peers[1].iwants) == 0:
+                self.clock.now += 1
+                self.wheel.advance()
+                # The timer callback sends the PEER IWANT in a new task
+                await asyncio.sleep(0)
+            self.lazy_push.received(42)
+            self.clock.now += 5
+            self.wheel.advance()
+            await asyncio.sleep(0)
+
+        asyncio.run(run())
+        self.assertEqual([peer.iwants for peer in peers], [[42], [42], []])
+        self.assertEqual(self.metrics.get("peer_iwants_sent"), 2)
+        self.assertEqual(self.metrics.get("peer_iwant_timeouts"), 1)
+
+    def test_repeated_ihave(self):
+        # Repeated PEER IHAVEs of a peer neither grow the pending state nor
+        # make us ask the peer again
+        peers = [Lazy_peer() for _ in range(2)]
+
+        async def run():
+            for _ in range(100):
+                for peer in peers:
+                    await self.lazy_push.handle_ihave(42, peer)
+            pending = self.lazy_push._Lazy_push__pending[42]
+            self.assertEqual(list(pending[0]), [peers[1]])
+            for _ in range(5):
+                self.clock.now += 1
+                self.wheel.advance()
+                await asyncio.sleep(0)
+
+        asyncio.run(run())
+        self.assertEqual([peer.iwants for peer in peers], [[42], [42]])
+        self.assertNotIn(42, self.lazy_push._Lazy_push__pending)
+
+
+class Test_gossip_lazy_push(unittest.TestCase):
+    def test_ihave_of_known_announce(self):
+        sender = Lazy_peer()
+        api = Fake_api()
+
+        async def run():
+            gossip = Gossip(make_config(dissemination="lazy"))
+            gossip._Gossip__peers.add(sender, PUSH)
+            await gossip.add_subscriber(1, api)
+            await gossip.handle_peer_announce(1, 5, 1, b"data", sender)
+            await gossip.handle_peer_ihave(1, 5, 1, sender)
+            # No subscribers for datatype 2
+            await gossip.handle_peer_ihave(2, 5, 2, sender)
+            await gossip.handle_peer_ihave(3, 5, 1, sender)
+
+        asyncio.run(run())
+        self.assertEqual(sender.iwants, [3])
+
+
+if __name__ == "__main__":
+    unittest.main()
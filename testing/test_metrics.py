@@ -0,0 +1,30 @@
+import unittest
+import context
+from modules.metrics import Metrics
+
+
+class Test_metrics(unittest.TestCase):
+    def test_increment(self):
+        metrics = Metrics()
+        self.assertEqual(metrics.get("sent"), 0)
+        metrics.increment("sent")
+        metrics.increment("sent", 2)
+        self.assertEqual(metrics.get("sent"), 3)
+        self.assertEqual(metrics.get_statistics(), {"sent": 3})
+
+    def test_observe(self):
+        metrics = Metrics()
+        for value in [1.0, 3.0, 2.0]:
+            metrics.observe("time", value)
+        self.assertEqual(metrics.get_statistics()["time"],
+                         {"count": 3, "mean": 2.0, "max": 3.0})
+
+    def test_statistics_are_a_copy(self):
+        metrics = Metrics()
+        metrics.increment("sent")
+        metrics.get_statistics()["sent"] = 10
+        self.assertEqual(metrics.get("sent"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
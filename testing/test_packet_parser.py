@@ -141,6 +141,16 @@ class Test_header_funcs(unittest.TestCase):
         self.assertEqual(pp.parse_gossip_notification(test_packet),
                          (1, 1, b''))
 
+    def test_build_gossip_notification_header(self):
+        # header and data must be the same packet as the full notification
+        data = b'some data'
+        header = pp.build_gossip_notification_header(7, 3, len(data))
+        self.assertEqual(header + data,
+                         pp.build_gossip_notification(7, 3, data))
+        self.assertIsNone(pp.build_gossip_notification_header(2**16, 3, 0))
+        self.assertIsNone(pp.build_gossip_notification_header(7, -1, 0))
+        self.assertIsNone(pp.build_gossip_notification_header(7, 3, 2**16))
+
     def test_get_type(self):
         # correct packet
         test_packet = pack(pp.FORMAT_GOSSIP_ANNOUNCE+"H", 10, 500, 0, 0, 0, 0)
@@ -203,6 +213,15 @@ class Test_header_funcs(unittest.TestCase):
         self.assertEqual(pp.parse_peer_announce(test_packet),
                          (1, 1, 1, b''))
 
+    def test_pack_peer_announce_header(self):
+        # header and data must be the same packet as the full announce
+        data = b'some data'
+        header = pp.pack_peer_announce_header(2**64-1, 3, 9, len(data))
+        self.assertEqual(header + data,
+                         pp.pack_peer_announce(2**64-1, 3, 9, data))
+        self.assertEqual(pp.parse_peer_announce(header + data),
+                         (2**64-1, 3, 9, data))
+
     def test_pack_peer_discovery(self):
         test_packet = pp.pack_peer_discovery()
         self.assertEqual(pp.check_peer_discovery(test_packet),
@@ -233,8 +252,108 @@ class Test_header_funcs(unittest.TestCase):
         self.assertEqual(pp.parse_peer_validation(test_packet),
                          (True))
 
+    def test_peer_flags(self):
+        flag = pp.PEER_FLAG_LAZY_PUSH
+        self.assertEqual(pp.parse_peer_flags(pp.pack_peer_info(1, flag)), flag)
+        self.assertEqual(pp.parse_peer_info(pp.pack_peer_info(1, flag)), 1)
+        test_packet = pp.pack_peer_validation(True, flag)
+        self.assertEqual(pp.parse_peer_flags(test_packet), flag)
+        self.assertEqual(pp.parse_peer_validation(test_packet), True)
+        self.assertEqual(pp.parse_peer_flags(pp.pack_peer_validation(True)),
+                         0)
+
+    def test_pack_peer_ihave(self):
+        test_packet = pp.pack_peer_ihave(2**64-1, 3, 9)
+        self.assertEqual(pp.get_header_type(test_packet), pp.PEER_IHAVE)
+        self.assertEqual(pp.parse_peer_ihave(test_packet), (2**64-1, 3, 9))
+        self.assertIsNone(pp.parse_peer_ihave(test_packet + b'x'))
+
+    def test_pack_peer_iwant(self):
+        test_packet = pp.pack_peer_iwant(2**64-1)
+        self.assertEqual(pp.get_header_type(test_packet), pp.PEER_IWANT)
+        self.assertEqual(pp.parse_peer_iwant(test_packet), 2**64-1)
+        self.assertIsNone(pp.parse_peer_iwant(test_packet[:8]))
+
 # ============================================================================
 
 
+class Test_frame_decoder(unittest.TestCase):
+    def test_single_frame(self):
+        decoder = pp.Frame_decoder()
+        packet = pp.pack_peer_announce(1, 2, 3, b'data')
+        frames = decoder.feed(packet)
+        self.assertEqual(len(frames), 1)
+        self.assertIsInstance(frames[0], memoryview)
+        self.assertTrue(frames[0].readonly)
+        self.assertEqual(bytes(frames[0]), packet)
+        self.assertEqual(pp.parse_peer_announce(frames[0])[:3], (1, 2, 3))
+        self.assertEqual(len(decoder), 0)
+
+    def test_many_frames_per_chunk(self):
+        # Thousands of small frames in a single read
+        packets = [pp.pack_peer_announce(i, 1, 1, bytes(i % 7))
+                   for i in range(10000)]
+        decoder = pp.Frame_decoder()
+        frames = decoder.feed(b''.join(packets))
+        self.assertEqual(len(frames), len(packets))
+        for (frame, packet) in zip(frames, packets):
+            self.assertEqual(frame, packet)
+        self.assertEqual(len(decoder), 0)
+
+    def test_split_frames(self):
+        # Frames split at every possible position, including the size field
+        packets = [pp.pack_peer_discovery(), pp.pack_peer_offer(["a:1"]),
+                   pp.pack_peer_announce(5, 1, 1, b'x' * 100)]
+        stream = b''.join(packets)
+        for chunk_size in [1, 2, 3, 5, 13, 64]:
+            decoder = pp.Frame_decoder()
+            frames = []
+            for i in range(0, len(stream), chunk_size):
+                frames += [bytes(frame) for frame in
+                           decoder.feed(stream[i:i + chunk_size])]
+            self.assertEqual(frames, packets,
+                             f"wrong frames for chunk size {chunk_size}")
+            self.assertEqual(len(decoder), 0)
+
+    def test_incomplete_frame(self):
+        decoder = pp.Frame_decoder()
+        packet = pp.pack_peer_challenge(42)
+        self.assertEqual(decoder.feed(packet[:-1]), [])
+        self.assertEqual(len(decoder), len(packet) - 1)
+        frames = decoder.feed(packet[-1:] + packet[:1])
+        self.assertEqual(frames, [packet])
+        self.assertEqual(len(decoder), 1)
+
+    def test_frames_after_split_frame_not_copied(self):
+        # Only the split frame is copied, later frames are views into the chunk
+        first = pp.pack_peer_announce(1, 1, 1, b'x' * 50)
+        second = pp.pack_peer_announce(2, 1, 1, b'y' * 50)
+        third = pp.pack_peer_challenge(7)
+        for split in [1, 2, 10]:
+            decoder = pp.Frame_decoder()
+            self.assertEqual(decoder.feed(first[:split]), [])
+            chunk = first[split:] + second + third
+            frames = decoder.feed(chunk)
+            self.assertEqual(frames, [first, second, third])
+            self.assertTrue(all(frame.readonly for frame in frames))
+            self.assertIsNot(frames[0].obj, chunk)
+            self.assertIs(frames[1].obj, chunk)
+            self.assertIs(frames[2].obj, chunk)
+            self.assertEqual(len(decoder), 0)
+
+    def test_invalid_size(self):
+        # A size smaller than the header can not be framed
+        decoder = pp.Frame_decoder()
+        with self.assertRaises(ValueError):
+            decoder.feed(pack("!HH", 2, pp.PEER_DISCOVERY))
+        with self.assertRaises(ValueError):
+            pp.Frame_decoder().feed(b'\x00\x00')
+
+    def test_parse_peer_offer_memoryview(self):
+        # Parsers must accept frames returned by the decoder
+        frames = pp.Frame_decoder().feed(pp.pack_peer_offer(["1.2.3.4:5"]))
+        self.assertEqual(pp.parse_peer_offer(frames[0]), ["1.2.3.4:5"])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,160 @@
+import unittest
+from unittest import mock
+import asyncio
+from struct import unpack
+import context
+from modules.gossip import Gossip
+from modules.packet_parser import (
+    PEER_CHALLENGE,
+    PEER_FLAG_LAZY_PUSH,
+    PEER_VALIDATION,
+    get_header_type,
+    pack_peer_info,
+    pack_peer_validation,
+    pack_peer_verification,
+    parse_peer_flags,
+    parse_peer_validation
+)
+from modules.peer_connection import CHALLENGE_TIMEOUT, peer_connection_factory
+from modules.peer_registry import UNVERIFIED
+from modules.timer_wheel import Timer_wheel
+from test_gossip import make_config
+from test_timer_wheel import Fake_clock
+
+
+async def read_frame(reader):
+    """Reads a single message from a stream"""
+    header = await reader.readexactly(4)
+    (size, _) = unpack("!HH", header)
+    return header + await reader.readexactly(size - 4)
+
+
+class Test_peer_connection(unittest.TestCase):
+    def setUp(self):
+        self.clock = Fake_clock()
+
+    async def connect(self, **kwargs):
+        """Connects to gossip like a new node. Returns (gossip, reader,
+        writer), the peer is the only unverified peer of gossip"""
+        gossip = Gossip(make_config(**kwargs))
+        gossip.timer_wheel = Timer_wheel(resolution=1, clock=self.clock)
+        server = await asyncio.start_server(
+            gossip._Gossip__on_peer_connection, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        (reader, writer) = await asyncio.open_connection("127.0.0.1", port)
+        self.server = server
+        self.writer = writer
+        while gossip._Gossip__peers.count(UNVERIFIED) == 0:
+            await asyncio.sleep(0)
+        return (gossip, reader, writer)
+
+    async def disconnect(self):
+        self.writer.close()
+        self.server.close()
+        await self.server.wait_closed()
+
+    def get_peer(self, gossip):
+        return gossip._Gossip__peers.get_oldest(UNVERIFIED)
+
+    def test_challenge_after_peer_info(self):
+        async def run():
+            (gossip, reader, writer) = await self.connect()
+            writer.write(pack_peer_info(6100))
+            # No timer has to run out for the challenge
+            frame = await asyncio.wait_for(read_frame(reader), 1)
+            await self.disconnect()
+            return (frame, self.get_peer(gossip))
+
+        (frame, peer) = asyncio.run(run())
+        self.assertEqual(get_header_type(frame), PEER_CHALLENGE)
+        self.assertEqual(peer.peer_p2p_listening_port, 6100)
+        self.assertIsNotNone(peer.get_peer_challenge())
+
+    def test_handshake_deadline(self):
+        async def run():
+            (gossip, reader, writer) = await self.connect()
+            writer.write(pack_peer_info(6100))
+            await read_frame(reader)
+            # The peer never sends a PEER VERIFICATION
+            self.clock.now += CHALLENGE_TIMEOUT + 1
+            gossip.timer_wheel.advance()
+            closed = await asyncio.wait_for(reader.read(), 1)
+            await self.disconnect()
+            return (closed, gossip)
+
+        (closed, gossip) = asyncio.run(run())
+        self.assertEqual(closed, b"")
+        self.assertEqual(gossip._Gossip__peers.count(UNVERIFIED), 0)
+
+    def test_handshake_deadline_without_peer_info(self):
+        async def run():
+            (gossip, reader, _) = await self.connect()
+            self.clock.now += CHALLENGE_TIMEOUT + 1
+            gossip.timer_wheel.advance()
+            closed = await asyncio.wait_for(reader.read(), 1)
+            await self.disconnect()
+            return closed
+
+        self.assertEqual(asyncio.run(run()), b"")
+
+    def test_lazy_push_from_peer_info(self):
+        # Lazy push is used if both sides send PEER_FLAG_LAZY_PUSH
+        async def run(dissemination, flags):
+            (gossip, reader, writer) = await self.connect(
+                dissemination=dissemination)
+            writer.write(pack_peer_info(6100, flags))
+            await read_frame(reader)
+            await self.disconnect()
+            return self.get_peer(gossip).lazy_push
+
+        self.assertTrue(asyncio.run(run("lazy", PEER_FLAG_LAZY_PUSH)))
+        self.assertFalse(asyncio.run(run("lazy", 0)))
+        self.assertFalse(asyncio.run(run("eager", PEER_FLAG_LAZY_PUSH)))
+
+    def test_peer_validation_contains_flags(self):
+        async def run():
+            (gossip, reader, writer) = await self.connect(
+                dissemination="lazy")
+            writer.write(pack_peer_info(6100, PEER_FLAG_LAZY_PUSH))
+            await read_frame(reader)
+            with mock.patch("modules.peer_connection."
+                            "valid_nonce_peer_challenge", return_value=True):
+                writer.write(pack_peer_verification(0))
+                frame = await asyncio.wait_for(read_frame(reader), 1)
+            await self.disconnect()
+            return frame
+
+        frame = asyncio.run(run())
+        self.assertEqual(get_header_type(frame), PEER_VALIDATION)
+        self.assertTrue(parse_peer_validation(frame))
+        self.assertEqual(parse_peer_flags(frame), PEER_FLAG_LAZY_PUSH)
+
+    def test_lazy_push_from_peer_validation(self):
+        # An outbound peer learns the flags from the PEER VALIDATION
+        async def run():
+            gossip = Gossip(make_config(dissemination="lazy"))
+            gossip.timer_wheel = Timer_wheel(resolution=1, clock=self.clock)
+            accepted = asyncio.get_running_loop().create_future()
+            server = await asyncio.start_server(
+                lambda reader, writer: accepted.set_result(writer),
+                "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            (peer, ) = await peer_connection_factory(
+                [f"127.0.0.1:{port}"], gossip, 6001)
+            await gossip.add_pull_peer(peer)
+            writer = await accepted
+            writer.write(pack_peer_validation(True, PEER_FLAG_LAZY_PUSH))
+            while not peer.lazy_push:
+                await asyncio.sleep(0.01)
+            (self.server, self.writer) = (server, writer)
+            await peer.close()
+            await self.disconnect()
+            return peer
+
+        peer = asyncio.run(asyncio.wait_for(run(), 2))
+        self.assertTrue(peer.lazy_push)
+        self.assertTrue(peer._Peer_connection__validated_us)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+import asyncio
+from types import SimpleNamespace
+import context
+from modules.packet_parser import pack_peer_announce
+from modules.peer_protocol import Peer_protocol, open_peer_protocol_connection
+
+
+class Fake_peer:
+    """Records handled messages and close_peer calls"""
+
+    def __init__(self):
+        self.messages = []
+        self.closed = asyncio.Event()
+        self.gossip = SimpleNamespace(close_peer=self.close_peer)
+
+    async def handle_message(self, buf):
+        self.messages.append(bytes(buf))
+
+    async def close_peer(self, peer):
+        self.closed.set()
+
+
+async def connect():
+    """Returns (server, client, accepted), where client and accepted are the
+    Peer_protocols of both ends of a loopback connection"""
+    accepted = asyncio.get_running_loop().create_future()
+
+    async def on_connection(reader, protocol):
+        accepted.set_result(protocol)
+
+    server = await asyncio.get_running_loop().create_server(
+        lambda: Peer_protocol(on_connection), "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    (reader, client) = await open_peer_protocol_connection("127.0.0.1", port)
+    return (server, client, await accepted)
+
+
+class Test_peer_protocol(unittest.TestCase):
+    def test_messages_in_order(self):
+        # Many messages sent at once are handled in order, including the ones
+        # received before attach
+        packets = [pack_peer_announce(i, 1, 1, bytes(i % 50))
+                   for i in range(5000)]
+
+        async def run():
+            (server, client, accepted) = await connect()
+            client.writelines(packets)
+            await client.drain()
+            await asyncio.sleep(0.1)
+            peer = Fake_peer()
+            accepted.attach(peer)
+            for _ in range(100):
+                if len(peer.messages) == len(packets):
+                    break
+                await asyncio.sleep(0.05)
+            client.close()
+            await client.wait_closed()
+            server.close()
+            return peer.messages
+
+        self.assertEqual(asyncio.run(run()), packets)
+
+    def test_connection_lost_closes_peer(self):
+        async def run():
+            (server, client, accepted) = await connect()
+            peer = Fake_peer()
+            accepted.attach(peer)
+            client.close()
+            await asyncio.wait_for(peer.closed.wait(), 2)
+            self.assertTrue(accepted.is_closing())
+            with self.assertRaises(ConnectionResetError):
+                await accepted.drain()
+            server.close()
+
+        asyncio.run(run())
+
+    def test_invalid_frame_closes_connection(self):
+        async def run():
+            (server, client, accepted) = await connect()
+            peer = Fake_peer()
+            accepted.attach(peer)
+            client.write(b'\x00\x01\x00\x00')
+            await asyncio.wait_for(peer.closed.wait(), 2)
+            self.assertEqual(peer.messages, [])
+            server.close()
+
+        asyncio.run(run())
+
+    def test_extra_info(self):
+        async def run():
+            (server, client, accepted) = await connect()
+            self.assertEqual(client.get_extra_info("peername"),
+                             accepted.get_extra_info("sockname"))
+            client.close()
+            server.close()
+
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    unittest.main()
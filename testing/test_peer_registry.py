@@ -0,0 +1,93 @@
+import unittest
+import context
+from modules.peer_registry import Peer_registry, UNVERIFIED, PUSH, PULL
+
+
+class Fake_peer:
+    def __init__(self, address=None, validated=False):
+        self.address = address
+        self.validated = validated
+
+    def get_peer_p2p_listening_address(self):
+        return self.address
+
+    def is_fully_validated(self):
+        return self.validated
+
+
+class Test_peer_registry(unittest.TestCase):
+    def setUp(self):
+        self.registry = Peer_registry()
+
+    def test_roles(self):
+        peers = [Fake_peer() for _ in range(3)]
+        for peer in peers:
+            self.registry.add(peer, UNVERIFIED)
+        self.assertEqual(self.registry.count(UNVERIFIED), 3)
+        self.assertIs(self.registry.get_oldest(UNVERIFIED), peers[0])
+
+        # A peer changing its role is the newest of its new role
+        self.registry.add(peers[0], PUSH)
+        self.registry.add(peers[1], PUSH)
+        self.assertEqual(self.registry.get_peers(PUSH), peers[:2])
+        self.assertEqual(self.registry.get_peers(UNVERIFIED), [peers[2]])
+        self.assertEqual(self.registry.get_role(peers[0]), PUSH)
+        self.assertEqual(len(self.registry), 3)
+
+        self.assertEqual(self.registry.remove(peers[0]), PUSH)
+        self.assertIsNone(self.registry.remove(peers[0]))
+        self.assertIsNone(self.registry.get_oldest(PULL))
+        self.assertNotIn(peers[0], self.registry)
+
+    def test_validated(self):
+        # Push peers are always validated, pull peers after update
+        push = Fake_peer()
+        pull = Fake_peer()
+        self.registry.add(Fake_peer(validated=True), UNVERIFIED)
+        self.registry.add(push, PUSH)
+        self.registry.add(pull, PULL)
+        self.assertEqual(self.registry.get_snapshot().peers, (push,))
+        pull.validated = True
+        self.registry.update(pull)
+        self.assertEqual(self.registry.get_snapshot().peers, (push, pull))
+        self.registry.remove(push)
+        self.assertEqual(self.registry.get_snapshot().peers, (pull,))
+
+    def test_snapshot(self):
+        push = Fake_peer()
+        self.registry.add(push, PUSH)
+        snapshot = self.registry.get_snapshot()
+        self.assertEqual(snapshot.version, 1)
+
+        # Changes that do not affect the validated peers keep the snapshot
+        self.registry.add(Fake_peer(), UNVERIFIED)
+        self.registry.update(push)
+        self.assertIs(self.registry.get_snapshot(), snapshot)
+
+        # A published snapshot is not changed by later changes
+        self.registry.remove(push)
+        self.assertEqual(snapshot.peers, (push,))
+        self.assertEqual(self.registry.get_snapshot(), ((), 2))
+
+    def test_address_index(self):
+        peer = Fake_peer()
+        self.registry.add(peer, UNVERIFIED)
+        self.assertEqual(self.registry.get_addresses(), [])
+        # The address becomes known with the PEER INFO
+        peer.address = "127.0.0.1:6001"
+        self.registry.update(peer)
+        self.assertIs(self.registry.find("127.0.0.1:6001"), peer)
+
+        # A second connection with the same address replaces the first in
+        # the index, removing the first one keeps the second
+        other = Fake_peer("127.0.0.1:6001")
+        self.registry.add(other, PULL)
+        self.assertIs(self.registry.find("127.0.0.1:6001"), other)
+        self.registry.remove(peer)
+        self.assertIs(self.registry.find("127.0.0.1:6001"), other)
+        self.registry.remove(other)
+        self.assertIsNone(self.registry.find("127.0.0.1:6001"))
+
+
+if __name__ == "__main__":
+    unittest.main()
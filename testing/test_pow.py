@@ -0,0 +1,185 @@
+import unittest
+import asyncio
+import hashlib
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+import context
+from modules import util
+from modules.pow_solver import Pow_solver
+
+
+class Test_pow(unittest.TestCase):
+    def test_valid_nonce(self):
+        # Find a nonce with one leading zero byte by brute force and check
+        # that it is accepted
+        challenge = (1234).to_bytes(8, 'big')
+        for nonce in range(2**16):
+            digest = hashlib.sha256(challenge + nonce.to_bytes(8, 'big'))
+            if digest.digest()[0] == 0:
+                break
+        self.assertTrue(util.valid_nonce_peer_challenge(1234, nonce, 1))
+        self.assertTrue(
+            util.valid_nonce_peer_challenge(challenge, nonce, 1),
+            "challenge as bytes should be accepted")
+
+    def test_invalid_nonce(self):
+        # Find a nonce without a leading zero byte
+        challenge = (1234).to_bytes(8, 'big')
+        for nonce in range(2**16):
+            digest = hashlib.sha256(challenge + nonce.to_bytes(8, 'big'))
+            if digest.digest()[0] != 0:
+                break
+        self.assertFalse(util.valid_nonce_peer_challenge(1234, nonce, 1))
+
+    def test_search_nonce_range(self):
+        # The midstate search must find the same nonce as a plain search
+        for challenge in [0, 1, 2**64-1, 987654321]:
+            expected = None
+            for nonce in range(2**16):
+                if util.valid_nonce_peer_challenge(challenge, nonce, 1):
+                    expected = nonce
+                    break
+            self.assertEqual(
+                util.search_nonce_range(challenge, 0, 2**16, 1), expected,
+                f"different nonce found for challenge {challenge}")
+
+    def test_search_nonce_range_start(self):
+        # Nonces before start must not be returned
+        nonce = util.search_nonce_range(42, 0, 2**16, 1)
+        self.assertEqual(util.search_nonce_range(42, nonce, 2**16, 1), nonce)
+        self.assertNotEqual(
+            util.search_nonce_range(42, nonce + 1, 2**16, 1), nonce)
+
+    def test_search_nonce_range_step(self):
+        # Strided slices together must find the smallest nonce
+        expected = util.search_nonce_range(7, 0, 2**16, 1)
+        found = [util.search_nonce_range(7, i, 2**16, 1, 4) for i in range(4)]
+        self.assertEqual(min(n for n in found if n is not None), expected)
+        # Each slice only returns nonces of its own slice
+        for i, nonce in enumerate(found):
+            if nonce is not None:
+                self.assertEqual(nonce % 4, i)
+
+    def test_search_nonce_range_not_found(self):
+        # No nonce is found in an empty range
+        self.assertIsNone(util.search_nonce_range(42, 10, 10, 1))
+
+
+class Slow_search:
+    """Replaces search_nonce_range. Every job takes delay seconds, slice
+    found_slice finds a nonce in its first job, all other slices never find
+    one. Records the start of every job"""
+
+    def __init__(self, delay, found_slice=None):
+        self.delay = delay
+        self.found_slice = found_slice
+        self.starts = []
+
+    def __call__(self, challenge, start, stop, difficulty, step):
+        self.starts.append(start)
+        time.sleep(self.delay)
+        if start % step == self.found_slice:
+            return start
+        return None
+
+
+class Broken_executor:
+    """Executor whose jobs fail like jobs of a pool with a dead worker"""
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_exception(BrokenProcessPool("worker died"))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+class Test_pow_solver(unittest.TestCase):
+    def setUp(self):
+        self.solver = Pow_solver(workers=4, slices=4)
+        # Threads run the patched search, which can not be sent to a process
+        self.solver._Pow_solver__executor = ThreadPoolExecutor(4)
+
+    def tearDown(self):
+        self.solver.shutdown()
+
+    def test_solve(self):
+        solver = Pow_solver(workers=1, slices=2, difficulty=1)
+        try:
+            (nonce, elapsed, checked) = asyncio.run(solver.solve(42))
+        finally:
+            solver.shutdown()
+        self.assertTrue(util.valid_nonce_peer_challenge(42, nonce, 1))
+        self.assertGreater(elapsed, 0)
+        self.assertGreater(checked, 0)
+        statistics = solver.get_statistics()
+        self.assertEqual(statistics["solved"], 1)
+        self.assertEqual(statistics["nonces_checked"], checked)
+
+    def test_found_nonce_stops_other_slices(self):
+        search = Slow_search(0.05, found_slice=2)
+
+        async def run():
+            result = await self.solver.solve(42)
+            jobs = len(search.starts)
+            # Running jobs finish, but no new jobs are started
+            await asyncio.sleep(0.2)
+            return (result, jobs)
+
+        with mock.patch("modules.pow_solver.search_nonce_range", search):
+            ((nonce, _, _), jobs) = asyncio.run(run())
+        self.assertEqual(nonce, 2)
+        self.assertEqual(len(search.starts), jobs)
+        self.assertLessEqual(jobs, 8)
+
+    def test_timeout(self):
+        search = Slow_search(0.02)
+
+        async def run():
+            result = await self.solver.solve(42, timeout=0.1)
+            jobs = len(search.starts)
+            await asyncio.sleep(0.1)
+            return (result, jobs)
+
+        with mock.patch("modules.pow_solver.search_nonce_range", search):
+            ((nonce, elapsed, _), jobs) = asyncio.run(run())
+        self.assertIsNone(nonce)
+        self.assertGreaterEqual(elapsed, 0.1)
+        self.assertEqual(len(search.starts), jobs)
+        self.assertEqual(self.solver.get_statistics()["failed"], 1)
+
+    def test_cancel(self):
+        # Closing a Peer_connection cancels the task solving its challenge
+        search = Slow_search(0.02)
+
+        async def run():
+            task = asyncio.create_task(self.solver.solve(42))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            jobs = len(search.starts)
+            await asyncio.sleep(0.1)
+            return jobs
+
+        with mock.patch("modules.pow_solver.search_nonce_range", search):
+            jobs = asyncio.run(run())
+        self.assertEqual(len(search.starts), jobs)
+
+    def test_broken_pool(self):
+        broken = Broken_executor()
+        self.solver._Pow_solver__executor = broken
+        (nonce, _, _) = asyncio.run(self.solver.solve(42, timeout=1))
+        self.assertIsNone(nonce)
+        statistics = self.solver.get_statistics()
+        self.assertEqual(statistics["failed"], 1)
+        self.assertEqual(statistics["pool_restarts"], 1)
+        # The next solve starts a new pool
+        self.assertIsNot(self.solver._Pow_solver__get_executor(), broken)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,335 @@
+import unittest
+import asyncio
+import context
+from modules.send_queue import Send_queue
+from modules.timer_wheel import Timer_wheel
+
+
+class Fake_writer:
+    """Records written data. drain blocks while blocked is cleared, written
+    data counts as in flight until drain returns"""
+
+    def __init__(self):
+        self.data = b''
+        self.drained = 0
+        self.transport = self
+        self.writes = 0
+        self.drains = 0
+        self.closing = False
+        self.blocked = asyncio.Event()
+        self.blocked.set()
+        self.error = None
+
+    def write(self, data):
+        self.data += bytes(data)
+        self.writes += 1
+
+    def writelines(self, data):
+        self.write(b''.join(data))
+
+    async def drain(self):
+        self.drains += 1
+        if self.error is not None:
+            raise self.error
+        await self.blocked.wait()
+        self.drained = len(self.data)
+
+    def get_write_buffer_size(self):
+        return len(self.data) - self.drained
+
+    def is_closing(self):
+        return self.closing
+
+
+def congested_queue(policy, **kwargs):
+    """Returns (writer, queue) with a blocked writer, a high watermark of 10
+    bytes and a low watermark of 4 bytes"""
+    writer = Fake_writer()
+    writer.blocked.clear()
+    queue = Send_queue(writer, high_watermark=10, low_watermark=4,
+                       policy=policy, **kwargs)
+    return (writer, queue)
+
+
+class Test_send_queue(unittest.TestCase):
+    def test_batching(self):
+        # Frames enqueued together are written with a single drain
+        async def run():
+            writer = Fake_writer()
+            queue = Send_queue(writer)
+            for i in range(100):
+                self.assertTrue(queue.put(bytes([i]), b'x'))
+            self.assertEqual(len(queue), 100)
+            self.assertEqual(queue.get_queued_bytes(), 200)
+            await queue.flush()
+            return (writer, queue.get_statistics())
+
+        (writer, statistics) = asyncio.run(run())
+        self.assertEqual(writer.data,
+                         b''.join(bytes([i]) + b'x' for i in range(100)))
+        self.assertEqual(writer.drains, 1)
+        self.assertEqual(statistics["flushes"], 1)
+        self.assertEqual(statistics["sent_frames"], 100)
+        self.assertEqual(statistics["depth"], 0)
+
+    def test_write_latency(self):
+        # Frames are measured from put until their batch was drained
+        now = [0]
+
+        async def run():
+            writer = Fake_writer()
+            writer.blocked.clear()
+            queue = Send_queue(writer, clock=lambda: now[0])
+            queue.put(b'a')
+            now[0] = 1
+            queue.put(b'b')
+            await asyncio.sleep(0)
+            now[0] = 4
+            writer.blocked.set()
+            await queue.flush()
+            return queue.get_statistics()["write_latency"]
+
+        self.assertEqual(asyncio.run(run()),
+                         {"count": 2, "mean": 3.5, "max": 4})
+
+    def test_frames_during_drain(self):
+        # Frames enqueued while waiting for drain are sent in the next batch
+        async def run():
+            writer = Fake_writer()
+            writer.blocked.clear()
+            queue = Send_queue(writer)
+            queue.put(b'a')
+            await asyncio.sleep(0)
+            queue.put(b'b')
+            queue.put(b'c')
+            self.assertEqual(len(queue), 2)
+            writer.blocked.set()
+            await queue.flush()
+            return (writer, queue.get_statistics())
+
+        (writer, statistics) = asyncio.run(run())
+        self.assertEqual(writer.data, b'abc')
+        self.assertEqual(statistics["flushes"], 2)
+
+    def test_bounded(self):
+        async def run():
+            writer = Fake_writer()
+            queue = Send_queue(writer, max_frames=3)
+            results = [queue.put(b'a', datatype=1) for _ in range(5)]
+            await queue.flush()
+            return (writer, results, queue.get_statistics())
+
+        (writer, results, statistics) = asyncio.run(run())
+        self.assertEqual(results, [True, True, True, False, False])
+        self.assertEqual(writer.data, b'aaa')
+        self.assertEqual(statistics["dropped_frames"], 2)
+
+    def test_bounded_control_frames(self):
+        # Control frames replace the oldest data frame of a full queue and
+        # are queued even if only control frames are left
+        async def run():
+            writer = Fake_writer()
+            queue = Send_queue(writer, max_frames=3)
+            queue.put(b'a', datatype=1)
+            queue.put(b'b', datatype=2)
+            queue.put(b'c', datatype=1)
+            results = [queue.put(b'X'), queue.put(b'Y'), queue.put(b'Z'),
+                       queue.put(b'W')]
+            await queue.flush()
+            return (writer, results, queue.get_statistics())
+
+        (writer, results, statistics) = asyncio.run(run())
+        self.assertEqual(results, [True] * 4)
+        self.assertEqual(writer.data, b'XYZW')
+        self.assertEqual(statistics["dropped_frames"], 3)
+
+    def test_close_writes_queued_frames(self):
+        async def run():
+            writer = Fake_writer()
+            queue = Send_queue(writer)
+            queue.put(b'a')
+            queue.put(b'b')
+            queue.close()
+            self.assertFalse(queue.put(b'c'))
+            await asyncio.sleep(0)
+            return writer
+
+        writer = asyncio.run(run())
+        self.assertEqual(writer.data, b'ab')
+        self.assertEqual(writer.drains, 0)
+
+    def test_connection_error(self):
+        # A failed drain drops queued frames and closes the queue
+        async def run():
+            writer = Fake_writer()
+            writer.error = ConnectionResetError()
+            queue = Send_queue(writer)
+            queue.put(b'a')
+            await queue.flush()
+            return queue
+
+        queue = asyncio.run(run())
+        self.assertFalse(queue.put(b'b'))
+        self.assertEqual(len(queue), 0)
+
+
+class Test_scheduling(unittest.TestCase):
+    def test_control_before_data(self):
+        # A control frame enqueued while data is drained is sent with the
+        # next batch, ahead of the remaining data frames
+        async def run():
+            writer = Fake_writer()
+            writer.blocked.clear()
+            queue = Send_queue(writer, batch_bytes=8)
+            for _ in range(4):
+                queue.put(b'dddd', datatype=1)
+            await asyncio.sleep(0)
+            self.assertEqual(writer.data, b'dddddddd')
+            queue.put(b'CTRL')
+            self.assertEqual(queue.get_statistics()["control_depth"], 1)
+            writer.blocked.set()
+            await queue.flush()
+            return writer
+
+        writer = asyncio.run(run())
+        self.assertEqual(writer.data, b'ddddddddCTRLdddddddd')
+
+    def test_fair_between_datatypes(self):
+        # A datatype that enqueued many frames does not delay another one
+        async def run():
+            writer = Fake_writer()
+            queue = Send_queue(writer)
+            for _ in range(100):
+                queue.put(b'a' * 1000, datatype=1)
+            for _ in range(10):
+                queue.put(b'b' * 1000, datatype=2)
+            queue.close()
+            return writer
+
+        data = asyncio.run(run()).data
+        # Each round both datatypes send 4 frames (QUANTUM_BYTES of 4096)
+        self.assertLess(data.rindex(b'b'), 24000)
+        self.assertEqual(len(data), 110000)
+
+    def test_weights(self):
+        async def run():
+            writer = Fake_writer()
+            queue = Send_queue(writer, weights={1: 3})
+            for _ in range(100):
+                queue.put(b'a' * 1024, datatype=1)
+                queue.put(b'b' * 1024, datatype=2)
+            queue.close()
+            return writer
+
+        first = asyncio.run(run()).data[:64 * 1024]
+        self.assertEqual(first.count(b'a'), 3 * first.count(b'b'))
+
+    def test_drop_oldest_between_datatypes(self):
+        async def run():
+            (writer, queue) = congested_queue("drop_oldest")
+            queue.put(b'1111', datatype=1)
+            queue.put(b'2222', datatype=2)
+            queue.put(b'3333', datatype=1)
+            queue.close()
+            return writer
+
+        writer = asyncio.run(run())
+        self.assertEqual(writer.data, b'22223333')
+
+
+class Test_slow_consumer(unittest.TestCase):
+    def test_drop_new(self):
+        async def run():
+            (writer, queue) = congested_queue("drop_new")
+            results = [queue.put(b'aaaa', datatype=1) for _ in range(4)]
+            # Frames that are not droppable are always queued
+            results.append(queue.put(b'ctrl'))
+            self.assertTrue(queue.is_congested())
+            writer.blocked.set()
+            await queue.flush()
+            return (writer, results, queue.get_statistics())
+
+        (writer, results, statistics) = asyncio.run(run())
+        self.assertEqual(results, [True, True, False, False, True])
+        # Control frames are sent before data frames
+        self.assertEqual(writer.data, b'ctrlaaaaaaaa')
+        self.assertEqual(statistics["dropped_frames"], 2)
+        self.assertEqual(statistics["congestions"], 1)
+        # Recovered after draining below the low watermark
+        self.assertFalse(statistics["congested"])
+
+    def test_drop_oldest(self):
+        async def run():
+            (writer, queue) = congested_queue("drop_oldest")
+            queue.put(b'ctrl')
+            results = [queue.put(bytes([i]) * 4, datatype=1)
+                       for i in range(4)]
+            writer.blocked.set()
+            await queue.flush()
+            return (writer, results, queue.get_statistics())
+
+        (writer, results, statistics) = asyncio.run(run())
+        self.assertEqual(results, [True, True, True, True])
+        # The control frame is kept and the oldest droppable frames make room
+        # for new ones
+        self.assertEqual(writer.data, b'ctrl' + bytes([3]) * 4)
+        self.assertEqual(statistics["dropped_frames"], 3)
+
+    def test_drop_oldest_without_droppable_frames(self):
+        # If no droppable frame can be dropped, the new one is dropped
+        async def run():
+            (writer, queue) = congested_queue("drop_oldest")
+            queue.put(b'control frame')
+            result = queue.put(b'data', datatype=1)
+            queue.close()
+            return (writer, result)
+
+        (writer, result) = asyncio.run(run())
+        self.assertFalse(result)
+        self.assertEqual(writer.data, b'control frame')
+
+    def test_disconnect(self):
+        async def run():
+            timer_wheel = Timer_wheel(resolution=1, clock=lambda: 0)
+            slow = asyncio.Event()
+
+            async def on_slow_consumer():
+                slow.set()
+
+            (writer, queue) = congested_queue(
+                "disconnect", timeout=5, timer_wheel=timer_wheel,
+                on_slow_consumer=on_slow_consumer)
+            results = [queue.put(b'aaaa', datatype=1) for _ in range(4)]
+            timer_wheel.advance(4)
+            await asyncio.sleep(0)
+            self.assertFalse(slow.is_set())
+            timer_wheel.advance(6)
+            await asyncio.wait_for(slow.wait(), 1)
+            queue.close()
+            return results
+
+        self.assertEqual(asyncio.run(run()), [True] * 4)
+
+    def test_disconnect_recovered(self):
+        # A connection that recovers in time is not disconnected
+        async def run():
+            timer_wheel = Timer_wheel(resolution=1, clock=lambda: 0)
+            calls = []
+            (writer, queue) = congested_queue(
+                "disconnect", timeout=5, timer_wheel=timer_wheel,
+                on_slow_consumer=lambda: calls.append(1))
+            for _ in range(4):
+                queue.put(b'aaaa', datatype=1)
+            self.assertTrue(queue.is_congested())
+            writer.blocked.set()
+            await queue.flush()
+            timer_wheel.advance(10)
+            return (queue, calls)
+
+        (queue, calls) = asyncio.run(run())
+        self.assertFalse(queue.is_congested())
+        self.assertEqual(calls, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
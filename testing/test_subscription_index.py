@@ -0,0 +1,48 @@
+import unittest
+import context
+from modules.subscription_index import Subscription_index
+
+
+class Test_subscription_index(unittest.TestCase):
+    def setUp(self):
+        self.index = Subscription_index()
+
+    def test_subscribe_twice(self):
+        self.assertTrue(self.index.subscribe(1, "a"))
+        self.assertFalse(self.index.subscribe(1, "a"))
+        self.index.subscribe(1, "b")
+        self.assertEqual(self.index.get_subscribers(1), ("a", "b"))
+        self.assertEqual(self.index.get_subscribers(2), ())
+
+    def test_unsubscribe(self):
+        self.index.subscribe(1, "a")
+        self.index.subscribe(2, "a")
+        self.assertTrue(self.index.unsubscribe(1, "a"))
+        self.assertFalse(self.index.unsubscribe(1, "a"))
+        self.assertEqual(self.index.get_subscribers(1), ())
+        self.assertEqual(self.index.get_datatypes("a"), [2])
+        self.index.unsubscribe(2, "a")
+        self.assertNotIn("a", self.index)
+
+    def test_remove(self):
+        for datatype in [1, 2, 3]:
+            self.index.subscribe(datatype, "a")
+        self.index.subscribe(2, "b")
+        self.assertEqual(sorted(self.index.remove("a")), [1, 2, 3])
+        self.assertEqual(self.index.remove("a"), [])
+        self.assertEqual(self.index.get_subscribers(2), ("b",))
+        self.assertEqual(len(self.index), 1)
+
+    def test_snapshot_is_immutable(self):
+        self.index.subscribe(1, "a")
+        subscribers = self.index.get_subscribers(1)
+        # The tuple is cached until the subscribers change
+        self.assertIs(self.index.get_subscribers(1), subscribers)
+        self.index.subscribe(1, "b")
+        self.index.remove("a")
+        self.assertEqual(subscribers, ("a",))
+        self.assertEqual(self.index.get_subscribers(1), ("b",))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+import context
+from modules.timer_wheel import Timer_wheel
+
+
+class Fake_clock:
+    """Clock that only advances when set"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Test_timer_wheel(unittest.TestCase):
+    def setUp(self):
+        self.clock = Fake_clock()
+        self.wheel = Timer_wheel(resolution=1, slots=4, levels=3,
+                                 clock=self.clock)
+        self.fired = []
+
+    def __advance_to(self, now):
+        """Advances the wheel second by second and records the fire times"""
+        while self.clock.now < now:
+            self.clock.now += 1
+            self.wheel.advance()
+
+    def __schedule(self, delay, name):
+        return self.wheel.schedule(delay, lambda: self.fired.append(
+            (name, self.clock.now)))
+
+    def test_fires_on_time(self):
+        # Timers on all levels and in the overflow fire at their deadline
+        delays = [1, 3, 4, 5, 15, 16, 17, 63, 64, 65, 200]
+        for delay in delays:
+            self.__schedule(delay, delay)
+        self.assertEqual(len(self.wheel), len(delays))
+        self.__advance_to(250)
+        self.assertEqual(self.fired, [(delay, delay) for delay in delays])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_cancel(self):
+        # Cancelled timers do not fire, also after cascading
+        timer_1 = self.__schedule(2, "a")
+        timer_2 = self.__schedule(40, "b")
+        self.__schedule(41, "c")
+        timer_1.cancel()
+        self.__advance_to(20)
+        timer_2.cancel()
+        # Cancelling twice does nothing
+        timer_2.cancel()
+        self.assertFalse(timer_2.is_pending())
+        self.__advance_to(100)
+        self.assertEqual(self.fired, [("c", 41)])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_cancel_in_same_tick(self):
+        # A callback can cancel a timer that expires in the same tick
+        timers = []
+
+        def cancel_other(name):
+            self.fired.append((name, self.clock.now))
+            for timer in timers:
+                timer.cancel()
+
+        timers.append(self.wheel.schedule(3, cancel_other, "a"))
+        timers.append(self.wheel.schedule(3, cancel_other, "b"))
+        self.__advance_to(10)
+        self.assertEqual(len(self.fired), 1)
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_schedule_while_advancing(self):
+        # Timers scheduled later are relative to the current time
+        self.__advance_to(10)
+        self.__schedule(7, "a")
+        self.__advance_to(30)
+        self.assertEqual(self.fired, [("a", 17)])
+
+    def test_advance_jump(self):
+        # All timers expire if the clock jumps
+        for delay in range(1, 100, 7):
+            self.__schedule(delay, delay)
+        self.wheel.advance(150)
+        self.assertEqual(len(self.fired), len(range(1, 100, 7)))
+
+    def test_many_timers(self):
+        # Many deadlines can be registered and cancelled
+        timers = [self.__schedule(i % 300 + 1, i) for i in range(20000)]
+        for timer in timers[::2]:
+            timer.cancel()
+        self.assertEqual(len(self.wheel), 10000)
+        self.__advance_to(301)
+        self.assertEqual(len(self.fired), 10000)
+        for (name, time) in self.fired:
+            self.assertEqual(name % 300 + 1, time)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -11,7 +11,19 @@ def generate_test_config(
     bootstrapper="127.0.0.1:1000",
     p2p_address="127.0.0.1:6001",
     api_address="127.0.0.1:7001",
-    known_peers="127.0.0.1:1000, 127.0.0.1:2000"
+    known_peers="127.0.0.1:1000, 127.0.0.1:2000",
+    pow_workers=None,
+    pow_slices=None,
+    dedup_backend=None,
+    bloom_fp_rate=None,
+    send_high_watermark=None,
+    send_low_watermark=None,
+    slow_consumer_policy=None,
+    datatype_weights=None,
+    gossip_core=None,
+    validation_policies=None,
+    dissemination=None,
+    eager_fanout=None
 ):
     """Generates a config file in the current directory, for testing.
     Set parameters to None to not include them in the config.
@@ -29,6 +41,18 @@ def generate_test_config(
     - p2p_address (str) -- default: "127.0.0.1:6001"
     - api_address (str) -- default: "127.0.0.1:7001"
     - known_peers (str) -- default: "127.0.0.1:1000, 127.0.0.1:2000"
+    - pow_workers (str) -- default: None
+    - pow_slices (str) -- default: None
+    - dedup_backend (str) -- default: None
+    - bloom_fp_rate (str) -- default: None
+    - send_high_watermark (str) -- default: None
+    - send_low_watermark (str) -- default: None
+    - slow_consumer_policy (str) -- default: None
+    - datatype_weights (str) -- default: None
+    - gossip_core (str) -- default: None
+    - validation_policies (str) -- default: None
+    - dissemination (str) -- default: None
+    - eager_fanout (str) -- default: None
     """
     config = "[gossip]\n"
     if cache_size:
@@ -49,6 +73,30 @@ def generate_test_config(
         config += f"api_address = {api_address}\n"
     if known_peers:
         config += f"known_peers = {known_peers}\n"
+    if pow_workers:
+        config += f"pow_workers = {pow_workers}\n"
+    if pow_slices:
+        config += f"pow_slices = {pow_slices}\n"
+    if dedup_backend:
+        config += f"dedup_backend = {dedup_backend}\n"
+    if bloom_fp_rate:
+        config += f"bloom_fp_rate = {bloom_fp_rate}\n"
+    if send_high_watermark:
+        config += f"send_high_watermark = {send_high_watermark}\n"
+    if send_low_watermark:
+        config += f"send_low_watermark = {send_low_watermark}\n"
+    if slow_consumer_policy:
+        config += f"slow_consumer_policy = {slow_consumer_policy}\n"
+    if datatype_weights:
+        config += f"datatype_weights = {datatype_weights}\n"
+    if gossip_core:
+        config += f"gossip_core = {gossip_core}\n"
+    if validation_policies:
+        config += f"validation_policies = {validation_policies}\n"
+    if dissemination:
+        config += f"dissemination = {dissemination}\n"
+    if eager_fanout:
+        config += f"eager_fanout = {eager_fanout}\n"
 
     f = open(filename, "w")
     f.write(config)